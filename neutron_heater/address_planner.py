@@ -0,0 +1,94 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import netaddr
+
+from neutron_heater import constants
+
+
+# Addresses in every IPv4 subnet which can't be used by the ports, like
+# network and broadcast addresses, gateway and DHCP or metadata ports
+RESERVED_ADDRESSES = 8
+# SLAAC requires IPv6 subnets to be /64 and every /64 has more than enough
+# addresses for any number of ports
+V6_PREFIXLEN = 64
+
+
+class AddressPoolExhausted(ValueError):
+    pass
+
+
+def get_v4_prefixlen(ports):
+    """Get prefix length of the smallest IPv4 subnet for all the ports."""
+    return 32 - (ports + RESERVED_ADDRESSES - 1).bit_length()
+
+
+class AddressPlanner(object):
+    """Plan CIDRs of the subnets of all networks without overlaps.
+
+    Every IPv4 subnet is sized to have addresses for all ports of the
+    network. Subnets of all networks are carved out of the IPv4 and IPv6
+    pools one after another, ordered by the network's number, so they are
+    the same in every run and every process without any coordination.
+    """
+
+    def __init__(self, ports, ipv4_subnets, ipv6_subnets,
+                 v4_pool=constants.V4_CIDR_POOL,
+                 v6_pool=constants.V6_CIDR_POOL):
+        self.ipv4_subnets = ipv4_subnets
+        self.ipv6_subnets = ipv6_subnets
+        self.v4_pool = netaddr.IPNetwork(v4_pool)
+        self.v6_pool = netaddr.IPNetwork(v6_pool)
+        self.v4_prefixlen = get_v4_prefixlen(ports)
+
+    @staticmethod
+    def _get_cidr(pool, prefixlen, index):
+        width = 32 if pool.version == 4 else 128
+        first = pool.first + index * 2 ** (width - prefixlen)
+        if prefixlen < pool.prefixlen or first > pool.last:
+            raise AddressPoolExhausted(
+                "Pool %s has no room for %s subnets /%s" % (
+                    pool, index + 1, prefixlen))
+        return str(netaddr.IPNetwork((first, prefixlen),
+                                     version=pool.version))
+
+    def get_v4_cidr(self, net_number, subnet_number):
+        return self._get_cidr(
+            self.v4_pool, self.v4_prefixlen,
+            net_number * self.ipv4_subnets + subnet_number)
+
+    def get_v6_cidr(self, net_number, subnet_number):
+        return self._get_cidr(
+            self.v6_pool, V6_PREFIXLEN,
+            net_number * self.ipv6_subnets + subnet_number)
+
+    def check(self, networks):
+        """Raise AddressPoolExhausted if networks don't fit in the pools."""
+        if not networks:
+            return
+        if self.ipv4_subnets:
+            self.get_v4_cidr(networks - 1, self.ipv4_subnets - 1)
+        if self.ipv6_subnets:
+            self.get_v6_cidr(networks - 1, self.ipv6_subnets - 1)
+
+    def get_subnets(self, net_number, hostname):
+        """Get list of tuples (name, cidr) of subnets for one network."""
+        subnets = []
+        for v4_subnet in range(self.ipv4_subnets):
+            subnet_name = "v4_subnet-%s-host-%s" % (v4_subnet, hostname)
+            subnets.append((subnet_name,
+                            self.get_v4_cidr(net_number, v4_subnet)))
+        for v6_subnet in range(self.ipv6_subnets):
+            subnet_name = "v6_subnet-%s-host-%s" % (v6_subnet, hostname)
+            subnets.append((subnet_name,
+                            self.get_v6_cidr(net_number, v6_subnet)))
+        return subnets
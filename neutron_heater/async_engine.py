@@ -0,0 +1,477 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+from concurrent import futures
+import ssl
+import time
+
+import aiohttp
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from neutron_heater import address_planner
+from neutron_heater import journal
+from neutron_heater import limiter as heater_limiter
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 100
+
+RESOURCE_TYPES = {
+    'networks': journal.NETWORK,
+    'subnets': journal.SUBNET,
+    'ports': journal.PORT,
+}
+
+
+class NeutronRequestError(Exception):
+
+    def __init__(self, method, url, status, body):
+        super(NeutronRequestError, self).__init__(
+            "%s %s returned %s: %s" % (method, url, status, body))
+        self.status = status
+
+
+class AsyncNeutronClient(object):
+    """Neutron API client which sends requests with aiohttp.
+
+    It reuses keystoneauth session of the given OSClient so the token and
+    the service catalog are shared with it. Number of requests in flight
+    is limited by the semaphore of the concurrency size.
+    """
+
+    def __init__(self, os_client, concurrency):
+        self.os_client = os_client
+        self.concurrency = concurrency
+        self.endpoint = None
+        self._semaphore = None
+        self._http = None
+
+    @property
+    def _session(self):
+        return self.os_client.os_conn.session
+
+    def _get_endpoint(self):
+        endpoint = self.os_client.os_conn.network.get_endpoint().rstrip('/')
+        if not endpoint.endswith('/v2.0'):
+            endpoint += '/v2.0'
+        return endpoint
+
+    def _get_ssl(self):
+        verify = self._session.verify
+        if verify is False:
+            return False
+        if isinstance(verify, str):
+            return ssl.create_default_context(cafile=verify)
+        return True
+
+    async def __aenter__(self):
+        self.endpoint = self._get_endpoint()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                         ssl=self._get_ssl())
+        self._http = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._http.close()
+
+    async def _request(self, operation, method, url, body=None,
+                       params=None):
+        metrics = self.os_client.metrics
+        scheduler = self.os_client.scheduler
+        if method == 'GET' or scheduler is None:
+            with metrics.measure(operation):
+                return await self._send(method, url, body, params,
+                                        operation)
+        # Only requests which create or delete resources are sent in the
+        # slots given by the open-loop scheduler, same as in the OSClient
+        intended_time, send_time = await scheduler.async_wait()
+        try:
+            with metrics.measure(operation, intended_time):
+                return await self._send(method, url, body, params,
+                                        operation)
+        finally:
+            scheduler.record(intended_time, send_time)
+
+    async def _send(self, method, url, body=None, params=None,
+                    operation=None):
+        if not url.startswith('http'):
+            url = self.endpoint + url
+        headers = self._session.get_auth_headers()
+        limiter = self.os_client.limiter
+        if limiter is None:
+            return await self._send_request(method, url, body, params,
+                                            headers)
+        await limiter.async_acquire()
+        start_time = time.monotonic()
+        success = True
+        try:
+            return await self._send_request(method, url, body, params,
+                                            headers)
+        except Exception as e:
+            success = not heater_limiter.is_overload_error(e)
+            raise
+        finally:
+            await limiter.async_release(time.monotonic() - start_time,
+                                        success, operation)
+
+    async def _send_request(self, method, url, body, params, headers):
+        async with self._semaphore:
+            async with self._http.request(method, url, json=body,
+                                          params=params,
+                                          headers=headers) as resp:
+                if resp.status >= 400:
+                    raise NeutronRequestError(method, url, resp.status,
+                                              await resp.text())
+                if resp.status == 204:
+                    return
+                return await resp.json()
+
+    async def _list(self, resource, **filters):
+        resources = []
+        url = '/%s' % resource
+        params = filters
+        if self.os_client.page_size:
+            params['limit'] = self.os_client.page_size
+        operation = 'get_%s' % resource
+        with self.os_client.metrics.measure(operation):
+            while url:
+                result = await self._send('GET', url, params=params,
+                                          operation=operation)
+                resources.extend(result[resource])
+                url = None
+                params = None
+                for link in result.get('%s_links' % resource, []):
+                    if link['rel'] == 'next':
+                        url = link['href']
+        return resources
+
+    async def _bulk_create(self, resource, data):
+        watch = timeutils.StopWatch().start()
+        try:
+            result = await self._request('create_%s_bulk' % resource,
+                                         'POST', '/%s' % resource,
+                                         body={resource: data})
+        except Exception as e:
+            LOG.warning("Bulk creation of %s %s failed, falling back to "
+                        "creating them one by one. Error: %s",
+                        len(data), resource, e)
+            return
+        LOG.info("Created %s %s in bulk in %.3f seconds",
+                 len(result[resource]), resource, watch.elapsed())
+        self.os_client._journal_created(RESOURCE_TYPES[resource],
+                                        result[resource])
+        return result[resource]
+
+    async def _delete(self, resource, resource_id):
+        try:
+            await self._request('delete_%s' % RESOURCE_TYPES[resource],
+                                'DELETE', '/%s/%s' % (resource, resource_id))
+        except NeutronRequestError as e:
+            # Resource which doesn't exist anymore is as good as deleted
+            if e.status != 404:
+                raise
+        self.os_client._journal_deleted(RESOURCE_TYPES[resource],
+                                        {'id': resource_id})
+
+    async def create_network(self, name):
+        attrs = self.os_client._get_tagged_attrs(name)
+        try:
+            result = await self._request('create_network', 'POST',
+                                         '/networks',
+                                         body={'network': attrs})
+        except Exception as e:
+            LOG.warning("Network %s creation failed. Error: %s", name, e)
+            return
+        self.os_client._journal_created(journal.NETWORK, [result['network']])
+        return result['network']
+
+    async def create_networks_bulk(self, names):
+        networks = await self._bulk_create(
+            'networks',
+            [self.os_client._get_tagged_attrs(name) for name in names])
+        if networks is None:
+            networks = await asyncio.gather(
+                *[self.create_network(name) for name in names])
+        return [network for network in networks if network]
+
+    async def delete_network(self, network):
+        try:
+            await self._delete('networks', network['id'])
+        except Exception as e:
+            LOG.warning("Failed to delete network %s. "
+                        "Error: %s", network['id'], e)
+
+    async def create_subnet(self, network_id, name, cidr):
+        attrs = self.os_client._get_subnet_attrs(network_id, name, cidr)
+        try:
+            result = await self._request('create_subnet', 'POST',
+                                         '/subnets', body={'subnet': attrs})
+        except Exception as e:
+            LOG.warning("Subnet %s creation in network %s failed. "
+                        "Error: %s", name, network_id, e)
+            return
+        self.os_client._journal_created(journal.SUBNET, [result['subnet']])
+        return result['subnet']
+
+    async def create_subnets_bulk(self, subnets):
+        created_subnets = await self._bulk_create(
+            'subnets',
+            [self.os_client._get_subnet_attrs(**subnet)
+             for subnet in subnets])
+        if created_subnets is None:
+            created_subnets = await asyncio.gather(
+                *[self.create_subnet(**subnet) for subnet in subnets])
+        return [subnet for subnet in created_subnets if subnet]
+
+    async def get_subnets(self, network_id):
+        try:
+            return await self._list('subnets', network_id=network_id)
+        except Exception as e:
+            LOG.warning("Failed to get subnets of network %s. Error: %s",
+                        network_id, e)
+            return []
+
+    async def create_port(self, network_id, name, hostname=None):
+        attrs = self.os_client._get_port_attrs(network_id, name, hostname)
+        try:
+            result = await self._request('create_port', 'POST', '/ports',
+                                         body={'port': attrs})
+        except Exception as e:
+            LOG.warning("Port %s creation in network %s failed. "
+                        "Error: %s", name, network_id, e)
+            return
+        self.os_client._journal_created(journal.PORT, [result['port']])
+        return result['port']
+
+    async def create_ports_bulk(self, network_id, names, hostname=None):
+        if len(names) == 1:
+            port = await self.create_port(network_id, names[0], hostname)
+            return [port] if port else []
+        ports = await self._bulk_create(
+            'ports',
+            [self.os_client._get_port_attrs(network_id, name, hostname)
+             for name in names])
+        if ports is None:
+            ports = await asyncio.gather(
+                *[self.create_port(network_id, name, hostname)
+                  for name in names])
+        return [port for port in ports if port]
+
+    async def get_ports(self, network_id):
+        try:
+            return await self._list('ports', network_id=network_id)
+        except Exception as e:
+            LOG.error("Failed to get ports from neutron server. "
+                      "Network: %s. Error: %s", network_id, e)
+            return []
+
+    async def delete_port(self, port):
+        try:
+            await self._delete('ports', port['id'])
+        except Exception as e:
+            LOG.warning("Failed to delete port %s. "
+                        "Error: %s", port['id'], e)
+
+
+class AsyncEngine(object):
+    """Create and clean resources from a single asyncio event loop.
+
+    Requests to the Neutron API are sent with up to concurrency requests in
+    flight. Plugging ports with os_vif is blocking so it is done in a pool
+    of plug_workers threads.
+    """
+
+    def __init__(self, os_client, os_vif, concurrency, plug_workers,
+                 tracker=None):
+        self.os_client = os_client
+        self.os_vif = os_vif
+        self.concurrency = concurrency
+        self.plug_workers = plug_workers
+        self.tracker = tracker
+        self.client = None
+        self._plug_executor = None
+
+    async def _run(self, coroutine):
+        async with AsyncNeutronClient(self.os_client,
+                                      self.concurrency) as self.client:
+            with futures.ThreadPoolExecutor(
+                    max_workers=self.plug_workers) as self._plug_executor:
+                await coroutine
+
+    async def _run_in_plug_executor(self, func, *args):
+        await asyncio.get_running_loop().run_in_executor(
+            self._plug_executor, func, *args)
+
+    async def _create_and_plug_ports(self, network, subnets, port_names,
+                                     hostname):
+        ports = await self.client.create_ports_bulk(network['id'],
+                                                    port_names, hostname)
+        if not ports:
+            return
+        if self.tracker:
+            self.tracker.ports_created(ports)
+        await self._run_in_plug_executor(self.os_vif.plug_ports, ports,
+                                         subnets)
+        if self.tracker:
+            self.tracker.ports_plugged(ports)
+
+    async def _create_network_ports(self, network, subnets, config,
+                                    hostname):
+        port_names = [utils.get_port_name(port, hostname, network['id'])
+                      for port in range(config.ports)]
+        await asyncio.gather(
+            *[self._create_and_plug_ports(network, subnets, batch, hostname)
+              for batch in utils.chunks(port_names,
+                                        config.port_batch_size)])
+        self.os_vif.release_network(network['id'])
+
+    async def _create_network_with_ports(self, net_number, config,
+                                         hostname):
+        network_name = utils.get_network_name(net_number, hostname)
+        LOG.info("Starting to create network %s", network_name)
+        network = await self.client.create_network(network_name)
+        if not network:
+            LOG.error("Failed to create network %s.", network_name)
+            return False
+        subnets_to_create = address_planner.AddressPlanner(
+            config.ports, config.ipv4_subnets,
+            config.ipv6_subnets).get_subnets(net_number, hostname)
+        subnets = await asyncio.gather(
+            *[self.client.create_subnet(network['id'], subnet_name, cidr)
+              for subnet_name, cidr in subnets_to_create])
+        subnets = {subnet['id']: subnet for subnet in subnets if subnet}
+        if subnets:
+            # Only if some subnets were created creating ports makes any
+            # sense
+            await self._create_network_ports(network, subnets, config,
+                                             hostname)
+        return True
+
+    async def _create_networks_with_ports_bulk(self, net_numbers, config,
+                                               hostname):
+        network_names = {utils.get_network_name(net_number, hostname):
+                         net_number for net_number in net_numbers}
+        LOG.info("Starting to create networks %s", ", ".join(network_names))
+        networks = await self.client.create_networks_bulk(
+            list(network_names))
+        planner = address_planner.AddressPlanner(
+            config.ports, config.ipv4_subnets, config.ipv6_subnets)
+        subnets_data = [
+            {'network_id': network['id'], 'name': subnet_name, 'cidr': cidr}
+            for network in networks
+            for subnet_name, cidr in planner.get_subnets(
+                network_names[network['name']], hostname)]
+        network_subnets = {network['id']: {} for network in networks}
+        batches = await asyncio.gather(
+            *[self.client.create_subnets_bulk(batch)
+              for batch in utils.chunks(subnets_data,
+                                        config.network_batch_size)])
+        for batch in batches:
+            for subnet in batch:
+                network_subnets[subnet['network_id']][subnet['id']] = subnet
+        await asyncio.gather(
+            *[self._create_network_ports(
+                network, network_subnets[network['id']], config, hostname)
+              for network in networks if network_subnets[network['id']]])
+
+    async def _create_resources(self, config, hostname, net_numbers):
+        if config.network_batch_size > 1:
+            await asyncio.gather(
+                *[self._create_networks_with_ports_bulk(batch, config,
+                                                        hostname)
+                  for batch in utils.chunks(net_numbers,
+                                            config.network_batch_size)])
+        else:
+            await asyncio.gather(
+                *[self._create_network_with_ports(net, config, hostname)
+                  for net in net_numbers])
+
+    def create_resources(self, config, hostname, net_numbers):
+        asyncio.run(self._run(self._create_resources(config, hostname,
+                                                     net_numbers)))
+
+    async def _clean_ports(self, ports, subnets):
+        await self._run_in_plug_executor(self.os_vif.unplug_ports, ports,
+                                         subnets)
+        await asyncio.gather(*[self.client.delete_port(port)
+                               for port in ports])
+
+    async def _clean_network_with_ports(self, network, port_batch_size):
+        ports, subnets = await asyncio.gather(
+            self.client.get_ports(network['id']),
+            self.client.get_subnets(network['id']))
+        subnets = {subnet['id']: subnet for subnet in subnets}
+        await asyncio.gather(
+            *[self._clean_ports(batch, subnets)
+              for batch in utils.chunks(ports, port_batch_size)])
+        self.os_vif.release_network(network['id'])
+        await self.client.delete_network(network)
+
+    async def _clean_all(self, networks, port_batch_size):
+        # Networks are taken from the listing by a limited number of
+        # coroutines, so only few of them are cleaned at the same time and
+        # the rest isn't listed before they are done
+        networks = iter(networks)
+
+        async def clean_networks():
+            for network in networks:
+                await self._clean_network_with_ports(network,
+                                                     port_batch_size)
+
+        await asyncio.gather(
+            *[clean_networks() for _ in range(self.concurrency)])
+
+    def clean_all(self, networks, port_batch_size=1):
+        asyncio.run(self._run(self._clean_all(networks, port_batch_size)))
+
+    async def _clean_resources(self, networks, ports, subnets,
+                               port_batch_size):
+        await asyncio.gather(
+            *[self._clean_ports(batch, subnets)
+              for batch in utils.chunks(ports, port_batch_size)])
+        await asyncio.gather(
+            *[self.client.delete_network(network) for network in networks])
+
+    def clean_resources(self, networks, ports, subnets, port_batch_size=1):
+        asyncio.run(self._run(self._clean_resources(
+            networks, ports, subnets, port_batch_size)))
+        for network in networks:
+            self.os_vif.release_network(network['id'])
+
+
+def create_resources(config, hostname, os_client, os_vif, concurrency,
+                     plug_workers, tracker=None, net_numbers=None):
+    """Create all resources from single asyncio event loop."""
+    if net_numbers is None:
+        net_numbers = range(config.networks)
+    AsyncEngine(os_client, os_vif, concurrency, plug_workers,
+                tracker).create_resources(config, hostname, net_numbers)
+
+
+def clean_all(networks, os_client, os_vif, concurrency, plug_workers,
+              port_batch_size=1):
+    """Clean given networks with all their ports from asyncio event loop."""
+    AsyncEngine(os_client, os_vif, concurrency,
+                plug_workers).clean_all(networks, port_batch_size)
+
+
+def clean_resources(networks, ports, subnets, os_client, os_vif, concurrency,
+                    plug_workers, port_batch_size=1):
+    """Clean given ports and networks from asyncio event loop."""
+    AsyncEngine(os_client, os_vif, concurrency,
+                plug_workers).clean_resources(networks, ports, subnets,
+                                              port_batch_size)
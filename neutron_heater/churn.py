@@ -0,0 +1,193 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+from concurrent import futures
+import itertools
+import threading
+import time
+
+from oslo_log import log as logging
+
+from neutron_heater import pipeline
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+# Ports to replace are started in ticks of that many seconds
+TICK = 1.0
+
+REPLACE_PORT = 'churn_replace_port'
+
+
+class ChurnRunner(object):
+    """Keep the number of ports on the node and replace part of them.
+
+    Every tick the given fraction of the ports, the oldest ones first, is
+    replaced: old port is unplugged and deleted and a new one is created
+    in the same network and plugged on the node. Replacements are started
+    at the target rate no matter how fast previous ones finished, so if
+    the cloud can't keep up with the rate, ports which are still being
+    replaced pile up and it is visible in the progress reports.
+    """
+
+    def __init__(self, os_client, os_vif, hostname, workers, rate,
+                 first_port_number=0, report_interval=10):
+        self.os_client = os_client
+        self.os_vif = os_vif
+        self.hostname = hostname
+        self.workers = workers
+        self.rate = rate
+        self.report_interval = report_interval
+        self.metrics = os_client.metrics
+        self._ports = collections.deque()
+        self._subnets = {}
+        self._port_numbers = itertools.count(first_port_number)
+        self._in_progress = 0
+        self._lock = threading.Lock()
+
+    def _load(self, networks):
+        for network in networks:
+            subnets = self.os_client.get_network_subnets(network['id'])
+            self._subnets[network['id']] = subnets
+            for port in self.os_client.get_ports(network['id']) or []:
+                # DHCP, metadata or router ports aren't replaced
+                if not utils.is_heater_port(port):
+                    continue
+                self.os_client.get_port_subnets(port, subnets)
+                self._ports.append(
+                    {field: port[field] for field in pipeline.PORT_FIELDS})
+
+    def _delete_port(self, port, subnets):
+        """Delete the port, or plug it back and return False if it failed."""
+        self.os_vif.unplug_ports([port], subnets)
+        if self.os_client.delete_port(port):
+            return True
+        self.os_vif.plug_ports([port], subnets)
+        return False
+
+    def _create_port(self, network_id):
+        name = utils.get_port_name(next(self._port_numbers), self.hostname,
+                                   network_id)
+        new_ports = self.os_client.create_ports_bulk(network_id, [name],
+                                                     self.hostname)
+        return new_ports[0] if new_ports else None
+
+    def _replace_port(self, port):
+        """Replace the port keeping the number of ports in the pool.
+
+        If the old port couldn't be deleted, it is put back in the pool.
+        If it was deleted but the new one couldn't be created, a placeholder
+        without ID is put there instead, so the port is created by the
+        next replacement. Both are replaced first in the next tick.
+        """
+        start_time = time.monotonic()
+        network_id = port['network_id']
+        subnets = self._subnets[network_id]
+        new_port = None
+        replaced = False
+        try:
+            if port['id'] is None or self._delete_port(port, subnets):
+                port = {'id': None, 'network_id': network_id}
+                new_port = self._create_port(network_id)
+                if new_port:
+                    self.os_vif.plug_ports([new_port], subnets)
+                    replaced = True
+        except Exception:
+            LOG.exception("Failed to replace port %s in network %s",
+                          port['id'], network_id)
+        self.metrics.record(REPLACE_PORT, time.monotonic() - start_time,
+                            replaced)
+        with self._lock:
+            self._in_progress -= 1
+            if new_port:
+                self._ports.append(
+                    {field: new_port[field] for field in pipeline.PORT_FIELDS})
+            else:
+                self._ports.appendleft(port)
+
+    def _cancel(self, replacements):
+        """Cancel replacements which didn't start before the deadline."""
+        cancelled = [port for future, port in replacements.items()
+                     if future.cancel()]
+        with self._lock:
+            self._in_progress -= len(cancelled)
+            self._ports.extendleft(cancelled)
+        if cancelled:
+            LOG.info("Cancelled %s port replacements which didn't start "
+                     "before the end of the churn", len(cancelled))
+
+    def run(self, networks, duration):
+        """Replace ports of the networks for duration seconds."""
+        self._load(networks)
+        if self.os_client.scheduler:
+            self.os_client.scheduler.resume()
+        target = len(self._ports)
+        if not target:
+            LOG.warning("There are no ports to churn")
+            return
+        ports_per_tick = target * self.rate * TICK
+        LOG.info("Keeping %s ports and replacing %.2f of them every second "
+                 "for %s seconds", target, ports_per_tick / TICK, duration)
+        started_at = reported_at = time.monotonic()
+        due = 0.0
+        replacements = {}
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for tick in itertools.count():
+                if tick * TICK >= duration:
+                    break
+                time.sleep(max(started_at + tick * TICK - time.monotonic(),
+                               0))
+                due += ports_per_tick
+                with self._lock:
+                    ports = [self._ports.popleft()
+                             for _ in range(min(int(due), len(self._ports)))]
+                    self._in_progress += len(ports)
+                due -= len(ports)
+                replacements = {future: port for future, port in
+                                replacements.items() if not future.done()}
+                for port in ports:
+                    replacements[executor.submit(self._replace_port,
+                                                 port)] = port
+                now = time.monotonic()
+                if now - reported_at >= self.report_interval:
+                    self._report_progress(now - started_at)
+                    reported_at = now
+            time.sleep(max(started_at + duration - time.monotonic(), 0))
+            # Only replacements which are already running are waited for
+            self._cancel(replacements)
+        self.report_summary(time.monotonic() - started_at, target)
+        for network_id in self._subnets:
+            self.os_vif.release_network(network_id)
+
+    def _report_progress(self, elapsed):
+        stats = self.metrics.operations.get(REPLACE_PORT)
+        LOG.info("Churn: %s ports replaced in %.0f seconds, %s in progress",
+                 stats.count if stats else 0, elapsed, self._in_progress)
+
+    def report_summary(self, elapsed, target):
+        stats = self.metrics.operations.get(REPLACE_PORT)
+        if not stats:
+            return
+        LOG.info("Churn steady state: replaced %(count)s ports "
+                 "(%(errors)s failed) of %(target)s kept on the node in "
+                 "%(elapsed).1f seconds, %(rate).2f ports/s for the target "
+                 "%(target_rate).2f ports/s, replace latency p50 %(p50).3f "
+                 "s, p90 %(p90).3f s, p99 %(p99).3f s",
+                 {'count': stats.count, 'target': target,
+                  'errors': stats.errors, 'elapsed': elapsed,
+                  'rate': stats.count / elapsed,
+                  'target_rate': target * self.rate,
+                  'p50': stats.latency.percentile(50),
+                  'p90': stats.latency.percentile(90),
+                  'p99': stats.latency.percentile(99)})
@@ -11,21 +11,41 @@
 #    under the License.
 
 from oslo_config import cfg
+from oslo_config import types
 from oslo_log import log as logging
 
 from neutron_heater import constants
 
 
+class ConcurrencyType(types.Integer):
+    """Number of workers or "auto" to adjust it during the run."""
+
+    def __init__(self):
+        super(ConcurrencyType, self).__init__(min=0,
+                                              type_name='concurrency value')
+
+    def __call__(self, value):
+        if value == constants.AUTO_CONCURRENCY:
+            return value
+        return super(ConcurrencyType, self).__call__(value)
+
+
 def register_config_options(conf):
     options = [
         cfg.StrOpt('action',
                    choices=[constants.CREATE, constants.CLEAN,
+                            constants.CHURN, constants.RECONCILE,
                             constants.DISCOVER_HOSTS],
                    positional=True,
                    help='Action to do. Possible options are "create" to '
                         'create resources in neutron and on the nodes, '
                         '"clean" to clean all resources made earlier by this '
-                        'tool or "discover" to discover all hosts with L2 '
+                        'tool, "churn" to create resources and then keep '
+                        'replacing part of the ports for the "duration", '
+                        '"reconcile" to create or delete only resources '
+                        'which differ from the requested numbers of '
+                        'networks, subnets and ports or "discover" to '
+                        'discover all hosts with L2 '
                         'agent installed and prepare inventory file for '
                         'ansible to run there.'),
         cfg.IntOpt('networks',
@@ -48,6 +68,27 @@ def register_config_options(conf):
                         'each created network. Those ports will be bound '
                         'and provisioned on all nodes with the L2 agents '
                         'running. It only has effect with "create" action.'),
+        cfg.IntOpt('network-batch-size',
+                   default=1,
+                   min=1,
+                   dest='network_batch_size',
+                   help='Number of networks to be created in Neutron with a '
+                        'single bulk API request. Subnets of those networks '
+                        'are then created with bulk API requests of the same '
+                        'size. Default value is "1" which means that every '
+                        'network and subnet is created with a separate API '
+                        'request. It only has effect with "create" action.'),
+        cfg.IntOpt('port-batch-size',
+                   default=1,
+                   min=1,
+                   dest='port_batch_size',
+                   help='Number of ports to be created in Neutron with a '
+                        'single bulk API request. Default value is "1" which '
+                        'means that every port is created with a separate '
+                        'API request. All ports created in one batch are '
+                        'plugged on the node together. With "clean" action '
+                        'it is number of ports unplugged from the node '
+                        'together.'),
         cfg.StrOpt('cloud-name',
                    default='devstack-admin',
                    dest='cloud_name',
@@ -62,16 +103,332 @@ def register_config_options(conf):
                     help="If set, SSL certificates will not be "
                          "verified and self signed certificates will be "
                          "accepted."),
-        cfg.IntOpt('concurrency',
+        cfg.Opt('concurrency',
+                type=ConcurrencyType(),
+                default=0,
+                help='Number of threads in which networks and resources '
+                     'which belongs to network will be created. '
+                     'Networks, subnets, batches of ports and plugging '
+                     'them are separate work items and idle threads take '
+                     'ready items of any network from other threads. '
+                     'Default value is "0" which means it will be '
+                     'calculated automatically based on the "networks" '
+                     'and "ports" values but it will not be more workers '
+                     'than half of the CPUs in the system. '
+                     'With the "asyncio" engine it is the maximum number '
+                     'of API requests sent at once and the default is '
+                     '100. With "auto" the limit of API requests in '
+                     'flight is adjusted during the run, increased '
+                     'additively while latency and errors are low and '
+                     'decreased multiplicatively when the server gets '
+                     'overloaded, up to 100 requests. The limit and '
+                     'throughput are logged every "report-interval" '
+                     'seconds.'),
+        cfg.StrOpt('engine',
+                   default=constants.THREADS_ENGINE,
+                   choices=[constants.THREADS_ENGINE,
+                            constants.ASYNCIO_ENGINE,
+                            constants.PIPELINE_ENGINE],
+                   help='Engine used to send requests to the Neutron API. '
+                        '"threads" uses pool of threads where each thread '
+                        'sends one request at a time. "asyncio" sends '
+                        'requests from a single event loop so many of them '
+                        'can be in flight at once. "pipeline" creates '
+                        'networks, subnets, ports and plugs ports on the '
+                        'node in separate stages, each with its own pool of '
+                        'workers, so ports can be plugged while next ones '
+                        'are still created. It only has effect with '
+                        '"create" and "clean" actions. The "threads" and '
+                        '"pipeline" engines both clean resources in a '
+                        'pipeline of stages which list ports and delete '
+                        'them, so deletes start with the first page of '
+                        'listed resources.'),
+        cfg.IntOpt('processes',
+                   default=1,
+                   min=1,
+                   help='Number of worker processes. Networks are split '
+                        'between processes and every process creates or '
+                        'cleans its part of them with the selected engine, '
+                        'its own connection to the cloud and its own '
+                        'plugging backend, so the work is not limited by '
+                        'the single Python process. Metrics from all '
+                        'processes are merged at the end of the run and '
+                        'the target "rate" is split between them. It only '
+                        'has effect with "create" and "clean" actions.'),
+        cfg.IntOpt('plug-workers',
+                   default=0,
+                   min=0,
+                   dest='plug_workers',
+                   help='Number of threads used to plug ports on the node '
+                        'by the "asyncio" and "pipeline" engines. Default '
+                        'value is "0" which means that it is the same as '
+                        'number of threads used for the API requests by '
+                        'the "threads" engine.'),
+        cfg.IntOpt('connection-pool-size',
                    default=0,
-                   help='Number of threads in which networks and resources '
-                        'which belongs to network will be created. '
-                        'Each thread will create one network and all subnets '
-                        'and ports which should be created per network. '
-                        'Default value is "0" which means it will be '
-                        'calculated automatically based on the "networks" '
-                        'value but it will not be more workers than '
-                        'half of the CPUs in the system.'),
+                   min=0,
+                   dest='connection_pool_size',
+                   help='Maximum number of HTTP connections kept open to '
+                        'the cloud by every connection. When all of them '
+                        'are in use, next request waits for a free one '
+                        'instead of opening new connection which would be '
+                        'closed right after the request. Default value is '
+                        '"0" which means that it is the same as number of '
+                        'threads used for the API requests, but not less '
+                        'than 10.'),
+        cfg.BoolOpt('connection-per-worker',
+                    default=False,
+                    dest='connection_per_worker',
+                    help='If set, every thread sending API requests uses '
+                         'its own connection to the cloud, with its own '
+                         'token and HTTP connection pool, instead of '
+                         'the single connection shared by all threads.'),
+        cfg.StrOpt('cache-dir',
+                   default=None,
+                   dest='cache_dir',
+                   help='Directory where data which can be reused by next '
+                        'runs on the same node is cached, like the Keystone '
+                        'tokens, which are reused until they expire instead '
+                        'of authenticating again in every run, and the '
+                        'name of the node resolved from the L2 agents. '
+                        'Nothing is cached if not set.'),
+        cfg.StrOpt('plug-backend',
+                   default=constants.OS_VIF_BACKEND,
+                   choices=[constants.OS_VIF_BACKEND,
+                            constants.OVSDB_BACKEND],
+                   dest='plug_backend',
+                   help='Backend used to plug ports on the node. "os_vif" '
+                        'plugs every port with os_vif. "ovsdb" adds all '
+                        'ports of the batch to the integration bridge as '
+                        'OVS internal ports in a single OVSDB transaction. '
+                        'The same backend has to be used with "create" and '
+                        '"clean" actions.'),
+        cfg.StrOpt('ovsdb-connection',
+                   default='unix:/var/run/openvswitch/db.sock',
+                   dest='ovsdb_connection',
+                   help='Connection string to the local Open_vSwitch '
+                        'database, e.g. "tcp:127.0.0.1:6640". It is used '
+                        'only by the "ovsdb" plug backend.'),
+        cfg.IntOpt('ovsdb-timeout',
+                   default=180,
+                   min=1,
+                   dest='ovsdb_timeout',
+                   help='Timeout, in seconds, of the OVSDB transactions. It '
+                        'is used only by the "ovsdb" plug backend.'),
+        cfg.StrOpt('integration-bridge',
+                   default='br-int',
+                   dest='integration_bridge',
+                   help='Name of the OVS integration bridge where ports are '
+                        'plugged. It is used only by the "ovsdb" plug '
+                        'backend.'),
+        cfg.IntOpt('pipeline-queue-size',
+                   default=100,
+                   min=1,
+                   dest='pipeline_queue_size',
+                   help='Maximum number of items waiting in the queue of '
+                        'each stage of the "pipeline" engine and of the '
+                        'cleanup, which bounds memory used for resources '
+                        'listed but not deleted yet.'),
+        cfg.IntOpt('report-interval',
+                   default=10,
+                   min=1,
+                   dest='report_interval',
+                   help='Interval, in seconds, of reporting progress of '
+                        'the run, like the queue depths of the "pipeline" '
+                        'engine stages.'),
+        cfg.FloatOpt('rate',
+                     default=0,
+                     min=0,
+                     help='Target rate, in requests per second, of the API '
+                          'requests which create or delete resources. When '
+                          'set, requests are sent in open-loop mode at the '
+                          'times planned in advance, not when previous '
+                          'requests finished, and their latency is measured '
+                          'from the intended send time. Default value is '
+                          '"0" which means closed-loop mode where every '
+                          'worker sends next request as soon as previous '
+                          'one is finished. It only has effect with "create" '
+                          'and "clean" actions.'),
+        cfg.IntOpt('duration',
+                   default=600,
+                   min=1,
+                   help='Time, in seconds, for which ports are replaced '
+                        'by the "churn" action.'),
+        cfg.FloatOpt('churn-rate',
+                     default=0.01,
+                     min=0,
+                     dest='churn_rate',
+                     help='Fraction of all ports created on the node which '
+                          'is replaced every second by the "churn" action. '
+                          'Every replaced port is unplugged and deleted and '
+                          'a new one is created in the same network and '
+                          'plugged. The "churn" action always runs in a '
+                          'single process.'),
+        cfg.StrOpt('arrival',
+                   default=constants.UNIFORM_ARRIVAL,
+                   choices=[constants.UNIFORM_ARRIVAL,
+                            constants.POISSON_ARRIVAL],
+                   help='Distribution of the intervals between requests in '
+                        'the open-loop mode. "uniform" sends requests at '
+                        'equal intervals, "poisson" uses exponentially '
+                        'distributed intervals. It only has effect when '
+                        '"rate" is set.'),
+        cfg.StrOpt('load-profile',
+                   default=None,
+                   dest='load_profile',
+                   help='Profile of the load changed over time, given as '
+                        '"shape:key=value,...". Possible shapes are '
+                        '"linear:start=S,end=E,duration=D[,phases=N]" which '
+                        'ramps linearly from S to E, '
+                        '"step:start=S,end=E,duration=D[,steps=N]" which '
+                        'raises the load in N equal steps, '
+                        '"spike:base=B,peak=P,duration=D[,at=T,length=L]" '
+                        'which keeps B with a spike to P for L seconds at '
+                        'second T and "soak:level=L,duration=D[,phases=N]" '
+                        'which keeps L for a long time. Operations done in '
+                        'every phase are reported separately and written to '
+                        'the "metrics-file". Profile drives creation of the '
+                        'resources with "create" action and the steady state '
+                        'with "churn" action, other actions don\'t accept '
+                        'it. Value of the last phase is kept until all the '
+                        'work is done.'),
+        cfg.StrOpt('load-profile-target',
+                   default=constants.CONCURRENCY_TARGET,
+                   choices=[constants.CONCURRENCY_TARGET,
+                            constants.RATE_TARGET],
+                   dest='load_profile_target',
+                   help='Value set by the "load-profile" over time. '
+                        '"concurrency" is the limit of the API requests in '
+                        'flight in every process and "rate" is the target '
+                        'rate of the requests per second in the open-loop '
+                        'mode, like the "rate" option.'),
+        cfg.IntOpt('security-groups',
+                   default=0,
+                   min=0,
+                   dest='security_groups',
+                   help='Number of security groups created on the node '
+                        'after the networks and ports, by every process. '
+                        'Groups are set on the created ports and, with '
+                        '"track-provisioning", time from updating the port '
+                        'to the moment when it is ACTIVE is reported. '
+                        'Default value is "0" which means that ports keep '
+                        'the default security group. It only has effect '
+                        'with "create" and "churn" actions.'),
+        cfg.IntOpt('security-group-rules',
+                   default=20,
+                   min=0,
+                   dest='security_group_rules',
+                   help='Number of ingress rules created with a bulk '
+                        'request in every security group.'),
+        cfg.IntOpt('remote-group-rules',
+                   default=2,
+                   min=0,
+                   dest='remote_group_rules',
+                   help='Number of the rules of every security group which '
+                        'allow traffic from the next security groups as '
+                        'their remote groups instead of from the IP '
+                        'prefix.'),
+        cfg.IntOpt('security-groups-per-port',
+                   default=1,
+                   min=1,
+                   dest='security_groups_per_port',
+                   help='Number of security groups set on every port.'),
+        cfg.IntOpt('routers',
+                   default=0,
+                   min=0,
+                   help='Number of routers created on the node after the '
+                        'networks and ports, by every process. Networks are '
+                        'spread between the routers and all their subnets '
+                        'are attached to them as interfaces. Default value '
+                        'is "0" which means that no routers are created. It '
+                        'only has effect with "create" and "churn" '
+                        'actions.'),
+        cfg.StrOpt('external-network',
+                   default=None,
+                   dest='external_network',
+                   help='Name or ID of the external network set as the '
+                        'gateway of the routers and from which floating IPs '
+                        'are allocated. If not set, routers have no '
+                        'gateways and no floating IPs are created.'),
+        cfg.IntOpt('floating-ips',
+                   default=0,
+                   min=0,
+                   dest='floating_ips',
+                   help='Number of ports in every network which get a '
+                        'floating IP from the "external-network". It only '
+                        'has effect if "routers" are created.'),
+        cfg.BoolOpt('track-provisioning',
+                    default=False,
+                    dest='track_provisioning',
+                    help='If set, status of all created ports is checked '
+                         'until they become ACTIVE and time from creating '
+                         'and from plugging the port to the moment when it '
+                         'became ACTIVE is reported. It only has effect with '
+                         '"create" action.'),
+        cfg.FloatOpt('provisioning-poll-interval',
+                     default=2,
+                     min=0.1,
+                     dest='provisioning_poll_interval',
+                     help='Interval, in seconds, of checking status of the '
+                          'ports which are not ACTIVE yet.'),
+        cfg.IntOpt('provisioning-timeout',
+                   default=300,
+                   min=1,
+                   dest='provisioning_timeout',
+                   help='Time, in seconds, after which port which is still '
+                        'not ACTIVE is reported as failed.'),
+        cfg.StrOpt('metrics-file',
+                   default=None,
+                   dest='metrics_file',
+                   help='Name of the file where latencies, errors and '
+                        'throughput of all operations done during the run '
+                        'will be stored in JSON format. Summary of those '
+                        'metrics is always logged at the end of the run. It '
+                        'only has effect with "create" and "clean" '
+                        'actions.'),
+        cfg.StrOpt('run-id',
+                   default=None,
+                   dest='run_id',
+                   help='ID of the run. All networks, subnets and ports '
+                        'created by the "create" action are tagged with it '
+                        'and with the name of the host. If not set, new ID '
+                        'is generated for every run. With "clean" action '
+                        'only resources created by the run with that ID '
+                        'are removed. If not set, resources created by all '
+                        'runs on the host are removed.'),
+        cfg.StrOpt('journal-file',
+                   default=None,
+                   dest='journal_file',
+                   help='Name of the SQLite file where every network, '
+                        'subnet and port is recorded when it is created, '
+                        'plugged on the node and deleted. It is needed by '
+                        'the "resume" and "from-journal" options.'),
+        cfg.BoolOpt('resume',
+                    default=False,
+                    help='If set, the run recorded in the journal is '
+                         'continued and only networks, subnets and ports '
+                         'which are not in the journal yet are created and '
+                         'only ports which are not plugged yet are plugged. '
+                         'Run with the ID given by the "run-id" option or '
+                         'the last run from the journal is continued. '
+                         'Resumed run is always done by the "threads" '
+                         'engine. It only has effect with "create" action.'),
+        cfg.BoolOpt('from-journal',
+                    default=False,
+                    dest='from_journal',
+                    help='If set, resources recorded in the journal which '
+                         'are not deleted yet are cleaned, without listing '
+                         'any resources in Neutron. If "run-id" is set, '
+                         'only resources from that run are cleaned. It only '
+                         'has effect with "clean" action.'),
+        cfg.IntOpt('list-page-size',
+                   default=1000,
+                   min=0,
+                   dest='list_page_size',
+                   help='Number of resources fetched from the Neutron API '
+                        'in one request when resources are listed. "0" '
+                        'means that all resources are fetched in one '
+                        'request.'),
         cfg.StrOpt('l2_agent_name',
                    default='ovn-controller',
                    help="Name of the L2 agent's binary. It's used only with "
@@ -0,0 +1,100 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from keystoneauth1 import session as ks_session
+from oslo_log import log as logging
+from urllib3 import connectionpool
+
+
+LOG = logging.getLogger(__name__)
+
+# Minimal size of the HTTP connection pool, same as the requests' default
+DEFAULT_POOL_SIZE = 10
+
+CONNECTIONS_USED = 'http_connections_used'
+CONNECTIONS_OPENED = 'http_connections_opened'
+POOL_WAITS = 'http_pool_wait'
+
+
+def _get_pool_class(base, metrics):
+
+    class InstrumentedConnectionPool(base):
+        """Connection pool counting new and reused connections."""
+
+        def _new_conn(self):
+            metrics.increment(CONNECTIONS_OPENED)
+            return super(InstrumentedConnectionPool, self)._new_conn()
+
+        def _get_conn(self, timeout=None):
+            metrics.increment(CONNECTIONS_USED)
+            if not self.block or not self.pool or not self.pool.empty():
+                return super(InstrumentedConnectionPool, self)._get_conn(
+                    timeout)
+            # All connections from the pool are in use so the request has
+            # to wait until one of them is returned to the pool
+            start_time = time.monotonic()
+            try:
+                return super(InstrumentedConnectionPool, self)._get_conn(
+                    timeout)
+            finally:
+                metrics.record(POOL_WAITS, time.monotonic() - start_time)
+
+    return InstrumentedConnectionPool
+
+
+class InstrumentedAdapter(ks_session.TCPKeepAliveAdapter):
+    """Keep-alive adapter with connections' reuse and pool waits metrics.
+
+    Pool is blocking, so when all its connections are in use requests wait
+    for a free one instead of opening new connections which are closed
+    right after the request.
+    """
+
+    def __init__(self, metrics, pool_size):
+        self.metrics = metrics
+        super(InstrumentedAdapter, self).__init__(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            pool_block=True)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(InstrumentedAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _get_pool_class(connectionpool.HTTPConnectionPool,
+                                    self.metrics),
+            'https': _get_pool_class(connectionpool.HTTPSConnectionPool,
+                                     self.metrics),
+        }
+
+
+def mount_adapter(session, metrics, pool_size):
+    """Mount instrumented adapter in the keystoneauth session."""
+    adapter = InstrumentedAdapter(metrics, pool_size)
+    session.session.mount('http://', adapter)
+    session.session.mount('https://', adapter)
+
+
+def report_summary(metrics):
+    used = metrics.counters[CONNECTIONS_USED]
+    if not used:
+        return
+    opened = metrics.counters[CONNECTIONS_OPENED]
+    waits = metrics.operations.get(POOL_WAITS)
+    LOG.info("HTTP connections: used %(used)s times, opened %(opened)s, "
+             "reused %(reused).1f%% of times. Requests waited for a free "
+             "connection in the pool %(waits)s times, %(wait_time).3f s in "
+             "total",
+             {'used': used, 'opened': opened,
+              'reused': (used - opened) * 100.0 / used,
+              'waits': waits.count if waits else 0,
+              'wait_time': waits.latency.total if waits else 0.0})
@@ -15,12 +15,40 @@ NAME = "Neutron heater"
 # ACTIONS POSSIBLE TO DO
 CREATE = 'create'
 CLEAN = 'clean'
+CHURN = 'churn'
+RECONCILE = 'reconcile'
 DISCOVER_HOSTS = "discover"
 
-# TODO(slaweq): this should be more smart and based on the number of ports per
-# network maybe
-V4_CIDR_BASE = "192.168.%s.0/24"
-V6_CIDR_BASE = "2000:%s::/64"
+# ENGINES USED TO SEND REQUESTS TO THE NEUTRON API
+THREADS_ENGINE = 'threads'
+ASYNCIO_ENGINE = 'asyncio'
+PIPELINE_ENGINE = 'pipeline'
+
+# VALUE OF THE CONCURRENCY OPTION WHICH ENABLES THE ADAPTIVE LIMITER
+AUTO_CONCURRENCY = 'auto'
+
+# VALUES CHANGED OVER TIME BY THE LOAD PROFILE
+CONCURRENCY_TARGET = 'concurrency'
+RATE_TARGET = 'rate'
+
+# BACKENDS USED TO PLUG PORTS ON THE NODE
+OS_VIF_BACKEND = 'os_vif'
+OVSDB_BACKEND = 'ovsdb'
+
+# DISTRIBUTIONS OF THE REQUESTS SEND TIMES IN THE OPEN-LOOP MODE
+UNIFORM_ARRIVAL = 'uniform'
+POISSON_ARRIVAL = 'poisson'
+
+# OWNER OF THE PORTS CREATED BY THE NEUTRON HEATER AND BOUND TO THE NODES
+PORT_DEVICE_OWNER = 'compute:neutron_heater'
+
+# TAGS SET ON ALL RESOURCES CREATED BY THE NEUTRON HEATER
+RUN_TAG_PREFIX = 'neutron-heater-run-'
+HOST_TAG_PREFIX = 'neutron-heater-host-'
+
+# POOLS FROM WHICH CIDRS OF THE SUBNETS ARE PLANNED
+V4_CIDR_POOL = "10.0.0.0/8"
+V6_CIDR_POOL = "fd00::/32"
 
 # ERROR_EXIT_CODES
 INVALID_CONFIG_OPTION = 1
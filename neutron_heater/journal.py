@@ -0,0 +1,211 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import json
+import sqlite3
+import threading
+import time
+
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Time, in seconds, to wait for the database locked by other process
+LOCK_TIMEOUT = 60
+
+NETWORK = 'network'
+SUBNET = 'subnet'
+PORT = 'port'
+SECURITY_GROUP = 'security_group'
+ROUTER = 'router'
+FLOATING_IP = 'floatingip'
+
+CREATED = 'created'
+PLUGGED = 'plugged'
+DELETED = 'deleted'
+
+# Attributes of the resources stored in the journal. Those are enough to
+# plug, unplug and delete resources without getting them from Neutron.
+RESOURCE_FIELDS = {
+    NETWORK: ('id', 'name', 'project_id'),
+    SUBNET: ('id', 'name', 'network_id', 'cidr'),
+    PORT: ('id', 'name', 'network_id', 'project_id', 'mac_address',
+           'fixed_ips'),
+    SECURITY_GROUP: ('id', 'name', 'project_id'),
+    ROUTER: ('id', 'name', 'project_id'),
+    FLOATING_IP: ('id', 'floating_ip_address', 'port_id', 'project_id'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    run_id TEXT,
+    event TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    resource_id TEXT NOT NULL,
+    network_id TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_resource ON events (resource_id, event);
+"""
+
+
+class JournaledResources(object):
+    """Resources of the run which are in the journal and not deleted."""
+
+    def __init__(self, networks, subnets, ports, plugged_ports):
+        # {network name: network}
+        self.networks = {network['name']: network for network in networks}
+        # {network ID: {subnet ID: subnet}}
+        self.subnets = collections.defaultdict(dict)
+        for subnet in subnets:
+            self.subnets[subnet['network_id']][subnet['id']] = subnet
+        # {network ID: {port name: port}}
+        self.ports = collections.defaultdict(dict)
+        for port in ports:
+            self.ports[port['network_id']][port['name']] = port
+        self.plugged_ports = set(plugged_ports)
+
+
+class Journal(object):
+    """Append-only local journal of the resources made by the heater.
+
+    Every network, subnet and port is recorded as soon as Neutron confirms
+    that it was created, every port when it was plugged on the node and
+    every resource when it was deleted. Events are never updated or
+    removed, state of the resource is the last event recorded for it.
+
+    The journal is a SQLite database in WAL mode, so appending events is
+    cheap and what was committed survives crash of the heater.
+    """
+
+    def __init__(self, filename, run_id=None):
+        self.filename = filename
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        # Many worker processes can append to the same journal so writers
+        # wait for each other instead of failing with "database is locked"
+        self._db = sqlite3.connect(filename, timeout=LOCK_TIMEOUT,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _get_data(resource_type, resource):
+        data = {}
+        for field in RESOURCE_FIELDS[resource_type]:
+            value = resource.get(field)
+            if field == 'fixed_ips':
+                value = [dict(fixed_ip) for fixed_ip in value or []]
+            data[field] = value
+        return json.dumps(data)
+
+    def _append(self, event, resource_type, rows):
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO events (time, run_id, event, resource_type, "
+                "resource_id, network_id, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(now, self.run_id, event, resource_type) + row
+                 for row in rows])
+
+    def record_created(self, resource_type, resources):
+        self._append(CREATED, resource_type, [
+            (resource['id'], resource.get('network_id'),
+             self._get_data(resource_type, resource))
+            for resource in resources])
+
+    def record_plugged(self, ports):
+        self._append(PLUGGED, PORT, [(port['id'], port['network_id'], None)
+                                     for port in ports])
+
+    def record_deleted(self, resource_type, resources):
+        self._append(DELETED, resource_type, [
+            (resource['id'], resource.get('network_id'), None)
+            for resource in resources])
+        if resource_type == NETWORK and resources:
+            # Subnets are deleted by Neutron together with their network
+            params = [time.time(), DELETED, SUBNET, CREATED]
+            params.extend(resource['id'] for resource in resources)
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO events (time, run_id, event, "
+                    "resource_type, resource_id, network_id) "
+                    "SELECT ?, run_id, ?, resource_type, resource_id, "
+                    "network_id FROM events WHERE resource_type = ? AND "
+                    "event = ? AND network_id IN (%s)" % ", ".join(
+                        "?" * len(resources)), params)
+
+    def _query(self, sql, params, run_id):
+        if run_id:
+            sql += " AND e.run_id = ?"
+            params = params + (run_id,)
+        with self._lock:
+            return self._db.execute(sql + " ORDER BY e.seq", params).fetchall()
+
+    def get_resources(self, resource_type, run_id=None):
+        """Get resources which were created and not deleted yet."""
+        rows = self._query(
+            "SELECT e.data FROM events e WHERE e.event = ? AND "
+            "e.resource_type = ? AND NOT EXISTS (SELECT 1 FROM events d "
+            "WHERE d.resource_id = e.resource_id AND d.event = ?)",
+            (CREATED, resource_type, DELETED), run_id)
+        return [json.loads(data) for data, in rows]
+
+    def get_plugged_port_ids(self, run_id=None):
+        rows = self._query(
+            "SELECT e.resource_id FROM events e WHERE e.event = ?",
+            (PLUGGED,), run_id)
+        return [port_id for port_id, in rows]
+
+    def get_last_run_id(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT run_id FROM events WHERE run_id IS NOT NULL "
+                "ORDER BY seq DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def load(self, run_id=None):
+        return JournaledResources(self.get_resources(NETWORK, run_id),
+                                  self.get_resources(SUBNET, run_id),
+                                  self.get_resources(PORT, run_id),
+                                  self.get_plugged_port_ids(run_id))
+
+
+class JournalingVifClient(object):
+    """Plugging backend wrapper recording plugged ports in the journal."""
+
+    def __init__(self, vif_client, journal):
+        self.vif_client = vif_client
+        self.journal = journal
+
+    def __getattr__(self, name):
+        return getattr(self.vif_client, name)
+
+    def plug_ports(self, ports, subnets):
+        plugged_ports = self.vif_client.plug_ports(ports, subnets)
+        self.journal.record_plugged(plugged_ports)
+        return plugged_ports
+
+    def plug_port(self, port, subnets):
+        return bool(self.plug_ports([port], subnets))
@@ -0,0 +1,215 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Maximum number of requests in flight with the automatic concurrency
+MAX_LIMIT = 100
+INITIAL_LIMIT = 4
+# Window with mean latency higher than the baseline latency times the
+# tolerance, for the same operations, is treated as a sign that the server
+# is overloaded
+LATENCY_TOLERANCE = 2.0
+# Limit is multiplied by the backoff when the server is overloaded
+BACKOFF = 0.75
+# Part of the difference between the window's latency and the baseline by
+# which the baseline grows, so it follows the server which gets slower
+# with more resources instead of throttling it forever
+BASELINE_DRIFT = 0.01
+# HTTP statuses which mean that the server is overloaded, not that the
+# request was wrong
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+CONCURRENCY_LIMIT = 'concurrency_limit'
+
+
+def is_overload_error(error):
+    # Errors without HTTP status, like timeouts or refused connections, are
+    # also signs of the overloaded server
+    status = getattr(error, 'status_code', getattr(error, 'status', None))
+    return status is None or status in OVERLOAD_STATUSES
+
+
+class ConcurrencyLimiter(object):
+    """Limit of API requests in flight which can be changed at any time.
+
+    It is shared by the threads of the OSClient and by the coroutines of
+    the asyncio engine, which wait for a free slot in the same limit.
+    """
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._async_condition = None
+        self._loop = None
+
+    def set_limit(self, limit):
+        with self._condition:
+            self.limit = float(limit)
+            self._condition.notify_all()
+        # Coroutines waiting for a slot are woken up in their own loop, as
+        # the limit is set from other thread
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._async_notify(), loop)
+
+    def try_acquire(self):
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, success=True, operation=None):
+        with self._condition:
+            self.in_flight -= 1
+            self._observe(latency, success, operation)
+            self._condition.notify_all()
+
+    def _observe(self, latency, success, operation):
+        """Called with the lock held for every finished request."""
+
+    @contextlib.contextmanager
+    def limit_request(self, operation=None):
+        self.acquire()
+        start_time = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(time.monotonic() - start_time,
+                         not is_overload_error(e), operation)
+            raise
+        self.release(time.monotonic() - start_time, operation=operation)
+
+    async def async_acquire(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._async_condition = asyncio.Condition()
+        async with self._async_condition:
+            await self._async_condition.wait_for(self.try_acquire)
+
+    async def _async_notify(self):
+        async with self._async_condition:
+            self._async_condition.notify_all()
+
+    async def async_release(self, latency, success=True, operation=None):
+        self.release(latency, success, operation)
+        await self._async_notify()
+
+
+class AIMDLimiter(ConcurrencyLimiter):
+    """Limit of API requests in flight adjusted to the server's capacity.
+
+    Requests are observed in windows of as many requests as the current
+    limit. After window with errors caused by overload, or with the mean
+    latency much higher than the lowest one seen so far, the limit is
+    decreased multiplicatively, otherwise it is increased by one. Latency
+    of every operation is compared with the baseline of that operation,
+    as e.g. creating a port takes much longer than getting a network. Until the
+    first decrease the limit is doubled after every window, to find the
+    server's capacity quickly. The limit and throughput are logged every
+    report interval so it can be seen where the throughput plateaus.
+    """
+
+    def __init__(self, max_limit, metrics, report_interval=10, min_limit=1):
+        super(AIMDLimiter, self).__init__(min(INITIAL_LIMIT, max_limit))
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.metrics = metrics
+        self.report_interval = report_interval
+        self._slow_start = True
+        self._baselines = {}
+        self._load = 1.0
+        self._window_count = 0
+        self._window_latency = collections.defaultdict(lambda: [0.0, 0])
+        self._window_errors = 0
+        self._interval_count = 0
+        self._started_at = self._reported_at = time.monotonic()
+
+    def _observe(self, latency, success, operation):
+        self._window_count += 1
+        operation_latency = self._window_latency[operation]
+        operation_latency[0] += latency
+        operation_latency[1] += 1
+        self._window_errors += int(not success)
+        self._interval_count += 1
+        if self._window_count >= int(self.limit):
+            self._adjust()
+        now = time.monotonic()
+        if now - self._reported_at >= self.report_interval:
+            self._report(now)
+
+    def _adjust(self):
+        # Load is the mean latency of the window's requests relative to the
+        # baselines of their operations
+        load = 0.0
+        for operation, (total, count) in self._window_latency.items():
+            latency = total / count
+            baseline = self._baselines.get(operation)
+            if baseline is None or latency < baseline:
+                baseline = latency
+            else:
+                baseline += (latency - baseline) * BASELINE_DRIFT
+            self._baselines[operation] = baseline
+            if baseline > 0:
+                load += latency / baseline * count
+            else:
+                load += count
+        self._load = load / self._window_count
+        if self._window_errors or self._load > LATENCY_TOLERANCE:
+            self._slow_start = False
+            self.limit = max(self.limit * BACKOFF, self.min_limit)
+        elif self._slow_start:
+            self.limit = min(self.limit * 2, self.max_limit)
+        else:
+            self.limit = min(self.limit + 1, self.max_limit)
+        self._window_count = 0
+        self._window_latency.clear()
+        self._window_errors = 0
+
+    def _report(self, now):
+        throughput = self._interval_count / (now - self._reported_at)
+        LOG.info("Concurrency limit %d, %d requests in flight, "
+                 "%.2f requests/s, latency %.2f times the baseline",
+                 self.limit, self.in_flight, throughput, self._load)
+        self.metrics.add_details(CONCURRENCY_LIMIT, [
+            {'time': now - self._started_at, 'limit': int(self.limit),
+             'throughput': throughput}])
+        self._interval_count = 0
+        self._reported_at = now
+
+
+def report_summary(metrics):
+    history = metrics.details.get(CONCURRENCY_LIMIT)
+    if not history:
+        return
+    best = max(history, key=lambda sample: sample['throughput'])
+    LOG.info("Highest throughput %.2f requests/s was reached with the "
+             "concurrency limit %d, the limit was %d at the end of the run",
+             best['throughput'], best['limit'], history[-1]['limit'])
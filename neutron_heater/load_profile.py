@@ -0,0 +1,240 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+import time
+
+from oslo_log import log as logging
+
+from neutron_heater import metrics as heater_metrics
+
+
+LOG = logging.getLogger(__name__)
+
+LINEAR = 'linear'
+STEP = 'step'
+SPIKE = 'spike'
+SOAK = 'soak'
+
+# Parameters of every shape of the profile and their default values, None
+# means that the parameter is required unless it is one of the COMPUTED
+# parameters, which are computed from the other ones when not given
+SHAPES = {
+    LINEAR: {'start': None, 'end': None, 'duration': None, 'phases': 10},
+    STEP: {'start': None, 'end': None, 'duration': None, 'steps': 5},
+    SPIKE: {'base': None, 'peak': None, 'duration': None, 'at': None,
+            'length': None},
+    SOAK: {'level': None, 'duration': None, 'phases': 10},
+}
+COMPUTED = ('at', 'length')
+
+# Target value of the profile is updated every TICK seconds
+TICK = 1.0
+
+LOAD_PHASES = 'load_phases'
+
+Phase = collections.namedtuple(
+    'Phase', ['name', 'duration', 'start_value', 'end_value'])
+
+
+def _get_params(shape, spec):
+    params = dict(SHAPES[shape])
+    for item in filter(None, spec.split(',')):
+        key, sep, value = item.partition('=')
+        if not sep or key not in params:
+            raise ValueError("Unknown parameter '%s' of the %s profile" %
+                             (item, shape))
+        params[key] = float(value)
+    missing = [key for key, value in params.items()
+               if value is None and key not in COMPUTED]
+    if missing:
+        raise ValueError("Parameters %s of the %s profile are required" %
+                         (", ".join(sorted(missing)), shape))
+    if shape == SPIKE:
+        # Spike is by default a tenth of the profile, in its middle
+        if params['length'] is None:
+            params['length'] = params['duration'] / 10
+        if params['at'] is None:
+            params['at'] = (params['duration'] - params['length']) / 2
+    return params
+
+
+def _split(name, duration, start_value, end_value, parts):
+    parts = max(int(parts), 1)
+    step = (end_value - start_value) / parts
+    return [Phase('%s-%s' % (name, part), duration / parts,
+                  start_value + part * step, start_value + (part + 1) * step)
+            for part in range(parts)]
+
+
+def get_phases(spec):
+    """Get list of phases of the profile given as "shape:key=value,...".
+
+    Examples of the profiles:
+      linear:start=1,end=50,duration=300 - value grows from 1 to 50
+      step:start=10,end=50,steps=5,duration=300 - 10, 20, ..., 50
+      spike:base=10,peak=100,duration=300 - 100 for 30 s in the middle
+      soak:level=20,duration=3600 - constant 20 for an hour
+
+    Value changes linearly within a phase between its start and end values,
+    and raises ValueError if the spec is not valid.
+    """
+    shape, _sep, spec = spec.partition(':')
+    if shape not in SHAPES:
+        raise ValueError("Unknown load profile '%s', possible profiles are: "
+                         "%s" % (shape, ", ".join(sorted(SHAPES))))
+    params = _get_params(shape, spec)
+    duration = params['duration']
+    if shape == LINEAR:
+        phases = _split('ramp', duration, params['start'], params['end'],
+                        params['phases'])
+    elif shape == STEP:
+        steps = max(int(params['steps']), 1)
+        increase = (params['end'] - params['start']) / max(steps - 1, 1)
+        phases = [Phase('step-%s' % step, duration / steps,
+                        params['start'] + step * increase,
+                        params['start'] + step * increase)
+                  for step in range(steps)]
+    elif shape == SPIKE:
+        if params['at'] + params['length'] > duration:
+            raise ValueError("Spike has to end before the end of the "
+                             "profile")
+        phases = [
+            Phase('base', params['at'], params['base'], params['base']),
+            Phase('spike', params['length'], params['peak'],
+                  params['peak']),
+            Phase('recovery', duration - params['at'] - params['length'],
+                  params['base'], params['base'])]
+    else:
+        phases = _split('soak', duration, params['level'], params['level'],
+                        params['phases'])
+    phases = [phase for phase in phases if phase.duration > 0]
+    if not phases:
+        raise ValueError("Load profile has to last longer than 0 seconds")
+    if min(min(phase.start_value, phase.end_value) for phase in phases) <= 0:
+        raise ValueError("Values of the load profile have to be positive")
+    return phases
+
+
+def get_max_value(phases):
+    return max(max(phase.start_value, phase.end_value) for phase in phases)
+
+
+class LoadProfileRunner(object):
+    """Change the concurrency or the request rate over the phases.
+
+    Every tick value for the current moment of the phase is given to the
+    apply function, which sets it as the limit of requests in flight or as
+    the rate of the open-loop scheduler. Operations done in every phase are
+    recorded in separate metrics, stored in the details of the run metrics,
+    so it can be seen at which load the latency breaks. After the last
+    phase the last value is kept until the work is done, in the "hold"
+    phase.
+    """
+
+    def __init__(self, phases, target, apply, metrics):
+        self.phases = phases
+        self.target = target
+        self.apply = apply
+        self.metrics = metrics
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.apply(self.phases[0].start_value)
+        self._thread = threading.Thread(target=self._run,
+                                        name="load-profile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        started_at = time.monotonic()
+        phases = self.phases + [
+            Phase('hold', None, self.phases[-1].end_value,
+                  self.phases[-1].end_value)]
+        for index, phase in enumerate(phases):
+            if self._stopped.is_set():
+                if phase.duration is not None:
+                    LOG.info("Work was done before the %s phase of the load "
+                             "profile", phase.name)
+                break
+            self._run_phase(index, phase, started_at)
+        self.metrics.end_phase()
+
+    def _run_phase(self, index, phase, profile_started_at):
+        phase_metrics = self.metrics.start_phase()
+        started_at = time.monotonic()
+        LOG.info("Starting %s phase of the load profile with %s %.2f",
+                 phase.name, self.target, phase.start_value)
+        elapsed = 0.0
+        while phase.duration is None or elapsed < phase.duration:
+            if phase.duration:
+                progress = elapsed / phase.duration
+                self.apply(phase.start_value + progress * (
+                    phase.end_value - phase.start_value))
+            else:
+                self.apply(phase.end_value)
+            if self._stopped.wait(TICK):
+                break
+            elapsed = time.monotonic() - started_at
+        elapsed = time.monotonic() - started_at
+        self.metrics.add_details(LOAD_PHASES, [{
+            'index': index, 'phase': phase.name, 'target': self.target,
+            'start_value': phase.start_value,
+            'end_value': phase.end_value,
+            'started_at': started_at - profile_started_at,
+            'duration': elapsed,
+            'metrics': phase_metrics.to_dict()}])
+
+
+def report_summary(metrics):
+    phases = metrics.details.get(LOAD_PHASES)
+    if not phases:
+        return
+    # With many processes every one of them reports its own phases
+    merged = {}
+    for phase in sorted(phases, key=lambda phase: phase['index']):
+        merged.setdefault(phase['index'], []).append(phase)
+    LOG.info("Operations done in the phases of the load profile:")
+    LOG.info("%-12s %-11s %11s %-28s %8s %7s %9s %9s %9s %9s", "phase",
+             "target", "value", "operation", "count", "errors", "ops/s",
+             "p50 [s]", "p90 [s]", "p99 [s]")
+    for phase_reports in merged.values():
+        phase = phase_reports[0]
+        # Operations are reported separately, as e.g. time to the port's
+        # provisioning has nothing to do with the latency of API requests
+        operations = {}
+        for report in phase_reports:
+            for name, data in report['metrics']['operations'].items():
+                stats = heater_metrics.OperationStats.from_dict(data)
+                if name in operations:
+                    operations[name].merge(stats)
+                else:
+                    operations[name] = stats
+        duration = max(report['duration'] for report in phase_reports)
+        if phase['start_value'] == phase['end_value']:
+            value = "%.4g" % phase['start_value']
+        else:
+            value = "%.4g-%.4g" % (phase['start_value'], phase['end_value'])
+        for name, stats in sorted(operations.items()):
+            LOG.info("%-12s %-11s %11s %-28s %8d %7d %9.2f %9.3f %9.3f "
+                     "%9.3f", phase['phase'], phase['target'], value, name,
+                     stats.count, stats.errors,
+                     stats.count / duration if duration else 0.0,
+                     stats.latency.percentile(50),
+                     stats.latency.percentile(90),
+                     stats.latency.percentile(99))
@@ -0,0 +1,322 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import contextlib
+import json
+import math
+import threading
+import time
+
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Every power of 2 range of values is split into 2^(SUB_BUCKET_BITS - 1)
+# buckets so recorded values are stored with relative error below 1.6%
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_MASK = (1 << SUB_BUCKET_BITS) - 1
+# Latencies are stored in microseconds
+UNITS_PER_SECOND = 1000000
+
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram(object):
+    """HDR-style histogram of latencies with log-linear buckets.
+
+    Memory used by the histogram depends only on the range of the recorded
+    values, not on how many of them were recorded, and histograms from
+    different threads or processes can be merged without losing precision.
+    """
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    @staticmethod
+    def _get_bucket(value):
+        units = int(value * UNITS_PER_SECOND)
+        exponent = max(units.bit_length() - SUB_BUCKET_BITS, 0)
+        return (exponent << SUB_BUCKET_BITS) | (units >> exponent)
+
+    @staticmethod
+    def _get_bucket_value(bucket):
+        exponent = bucket >> SUB_BUCKET_BITS
+        lowest = (bucket & SUB_BUCKET_MASK) << exponent
+        highest = lowest + (1 << exponent) - 1
+        return (lowest + highest) / 2.0 / UNITS_PER_SECOND
+
+    def record(self, value):
+        self.buckets[self._get_bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        if self.min is None:
+            self.min = other.min
+        elif other.min is not None:
+            self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile):
+        if not self.count:
+            return 0.0
+        target = max(math.ceil(percentile / 100.0 * self.count), 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(max(self._get_bucket_value(bucket), self.min),
+                           self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': {str(bucket): count
+                        for bucket, count in sorted(self.buckets.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        histogram.buckets.update(
+            {int(bucket): count for bucket, count in data['buckets'].items()})
+        return histogram
+
+
+class OperationStats(object):
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+    @property
+    def count(self):
+        return self.latency.count
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.errors += other.errors
+
+    def to_dict(self):
+        return {'errors': self.errors, 'latency': self.latency.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.errors = data['errors']
+        stats.latency = Histogram.from_dict(data['latency'])
+        return stats
+
+
+class Metrics(object):
+    """Latencies and errors of the operations done during the run."""
+
+    def __init__(self):
+        self.operations = collections.defaultdict(OperationStats)
+        # Lists of additional results of the run, like IDs of the resources
+        # which failed, stored in the JSON file together with the metrics
+        self.details = collections.defaultdict(list)
+        # Numbers of events which have no latency, like opened connections
+        self.counters = collections.Counter()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._phase = None
+
+    def start_phase(self):
+        """Return Metrics to which operations are recorded from now on too.
+
+        Operations are recorded in the returned object until the next phase
+        is started or end_phase() is called, so e.g. the latency of every
+        phase of the load profile can be seen separately.
+        """
+        phase = Metrics()
+        with self._lock:
+            self._phase = phase
+        return phase
+
+    def end_phase(self):
+        with self._lock:
+            self._phase = None
+
+    def record(self, operation, latency, success=True):
+        now = time.time()
+        with self._lock:
+            if self._phase is not None:
+                self._phase.record(operation, latency, success)
+            if self.started_at is None:
+                self.started_at = now - latency
+            self.finished_at = now
+            stats = self.operations[operation]
+            stats.latency.record(latency)
+            if not success:
+                stats.errors += 1
+
+    def record_error(self, operation):
+        """Record failed operation which has no meaningful latency."""
+        with self._lock:
+            if self._phase is not None:
+                self._phase.record_error(operation)
+            self.operations[operation].errors += 1
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            if self._phase is not None:
+                self._phase.increment(counter, value)
+            self.counters[counter] += value
+
+    def add_details(self, name, items):
+        with self._lock:
+            self.details[name].extend(items)
+
+    @contextlib.contextmanager
+    def measure(self, operation, start_time=None):
+        """Measure latency of the operation done in the context.
+
+        start_time, as returned by time.monotonic(), can be given if the
+        operation should be measured from other moment than now, e.g. from
+        its intended send time in the open-loop mode.
+        """
+        if start_time is None:
+            start_time = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(operation, time.monotonic() - start_time, False)
+            raise
+        self.record(operation, time.monotonic() - start_time)
+
+    def measure_iter(self, operation, iterator):
+        """Measure time spent on getting all items from the iterator.
+
+        Only time spent in the iterator itself is counted, not the time
+        spent by the caller on processing the items, so it can be used to
+        measure paginated listings which are consumed lazily.
+        """
+        elapsed = 0.0
+        iterator = iter(iterator)
+        while True:
+            start_time = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(operation,
+                            elapsed + time.monotonic() - start_time)
+                return
+            except Exception:
+                self.record(operation,
+                            elapsed + time.monotonic() - start_time, False)
+                raise
+            elapsed += time.monotonic() - start_time
+            yield item
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def merge(self, other):
+        with self._lock:
+            for operation, stats in other.operations.items():
+                self.operations[operation].merge(stats)
+            for name, items in other.details.items():
+                self.details[name].extend(items)
+            self.counters.update(other.counters)
+            if other.started_at is not None:
+                self.started_at = min(self.started_at or other.started_at,
+                                      other.started_at)
+                self.finished_at = max(self.finished_at or other.finished_at,
+                                       other.finished_at)
+
+    def to_dict(self):
+        duration = self.duration
+        operations = {}
+        for operation, stats in sorted(self.operations.items()):
+            operation_data = stats.to_dict()
+            operation_data['count'] = stats.count
+            operation_data['throughput'] = (
+                stats.count / duration if duration else 0.0)
+            operation_data['summary'] = {
+                'min': stats.latency.min,
+                'mean': stats.latency.mean,
+                'max': stats.latency.max}
+            for percentile in PERCENTILES:
+                operation_data['summary']['p%s' % percentile] = (
+                    stats.latency.percentile(percentile))
+            operations[operation] = operation_data
+        return {
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': duration,
+            'operations': operations,
+            'details': dict(self.details),
+            'counters': dict(self.counters),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls()
+        metrics.started_at = data['started_at']
+        metrics.finished_at = data['finished_at']
+        for operation, operation_data in data['operations'].items():
+            metrics.operations[operation] = OperationStats.from_dict(
+                operation_data)
+        metrics.details.update(data.get('details', {}))
+        metrics.counters.update(data.get('counters', {}))
+        return metrics
+
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report_summary(self):
+        if not self.operations:
+            return
+        duration = self.duration
+        LOG.info("Operations done in %.2f seconds:", duration)
+        LOG.info("%-32s %8s %7s %9s %9s %9s %9s %9s", "operation", "count",
+                 "errors", "ops/s", "p50 [s]", "p90 [s]", "p99 [s]",
+                 "max [s]")
+        for operation, stats in sorted(self.operations.items()):
+            LOG.info("%-32s %8d %7d %9.2f %9.3f %9.3f %9.3f %9.3f",
+                     operation, stats.count, stats.errors,
+                     stats.count / duration if duration else 0.0,
+                     stats.latency.percentile(50),
+                     stats.latency.percentile(90),
+                     stats.latency.percentile(99),
+                     stats.latency.max)
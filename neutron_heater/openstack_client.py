@@ -10,27 +10,105 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import threading
 
 import netaddr
 import openstack
+from openstack.network.v2 import network as _network
+from openstack.network.v2 import port as _port
+from openstack.network.v2 import security_group_rule as _sg_rule
+from openstack.network.v2 import subnet as _subnet
 from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from neutron_heater import connection_pool
+from neutron_heater import constants
+from neutron_heater import journal as heater_journal
+from neutron_heater import metrics as heater_metrics
+from neutron_heater import token_cache as heater_token_cache
 
 
 LOG = logging.getLogger(__name__)
 
+# Owners of the ports of the router's interfaces in the legacy, DVR and HA
+# routers
+ROUTER_INTERFACE_OWNERS = ('network:router_interface',
+                           'network:router_interface_distributed',
+                           'network:ha_router_replicated_interface')
+
 
 class OSClient(object):
 
-    def __init__(self, cloud, **kwargs):
+    def __init__(self, cloud, scheduler=None, metrics=None, tags=None,
+                 page_size=None, journal=None, pool_size=None,
+                 connection_per_worker=False, token_cache=None, limiter=None,
+                 **kwargs):
         self._os_conn = None
+        self._os_conn_lock = threading.Lock()
+        self._local = threading.local()
         self.cloud = cloud
         self.kwargs = kwargs
+        # Size of the HTTP connection pool of every connection to the cloud
+        self.pool_size = pool_size or connection_pool.DEFAULT_POOL_SIZE
+        # If set, every thread uses its own connection to the cloud
+        self.connection_per_worker = connection_per_worker
+        # On-disk cache of the Keystone tokens reused between runs
+        self.token_cache = token_cache
+        # Tags set on all created networks, subnets and ports
+        self.tags = list(tags or [])
+        # Number of resources fetched in one request by the list calls
+        self.page_size = page_size
+        # Journal where created and deleted resources are recorded
+        self.journal = journal
         self._project_id = None
+        self.scheduler = scheduler
+        # Adaptive limit of the API requests in flight, if used
+        self.limiter = limiter
+        self.metrics = metrics or heater_metrics.Metrics()
+
+    def _connect(self):
+        os_conn = openstack.connect(cloud=self.cloud, **self.kwargs)
+        connection_pool.mount_adapter(os_conn.session, self.metrics,
+                                      self.pool_size)
+        if self.token_cache:
+            self._authenticate(os_conn)
+        return os_conn
+
+    def _authenticate(self, os_conn):
+        """Use token from the cache or authenticate and cache new token."""
+        auth = os_conn.session.auth
+        region_name = self.kwargs.get('region_name')
+        auth_time = self.token_cache.restore(auth, self.cloud, region_name)
+        if auth_time is not None:
+            LOG.debug("Using cached Keystone token for cloud %s",
+                      self.cloud)
+            self.metrics.increment(heater_token_cache.TOKENS_REUSED)
+            self.metrics.increment(heater_token_cache.AUTH_TIME_SAVED,
+                                   auth_time)
+            return
+        watch = timeutils.StopWatch().start()
+        try:
+            with self.metrics.measure('keystone_authenticate'):
+                os_conn.session.get_token()
+        except Exception as e:
+            LOG.warning("Failed to authenticate to the cloud %s. Error: %s",
+                        self.cloud, e)
+            return
+        self.token_cache.save(auth, self.cloud, region_name,
+                              watch.elapsed())
 
     @property
     def os_conn(self):
+        if self.connection_per_worker:
+            os_conn = getattr(self._local, 'os_conn', None)
+            if os_conn is None:
+                os_conn = self._local.os_conn = self._connect()
+            return os_conn
         if self._os_conn is None:
-            self._os_conn = openstack.connect(cloud=self.cloud, **self.kwargs)
+            with self._os_conn_lock:
+                if self._os_conn is None:
+                    self._os_conn = self._connect()
         return self._os_conn
 
     @property
@@ -39,73 +117,250 @@ class OSClient(object):
             self._project_id = self.os_conn.session.get_project_id()
         return self._project_id
 
-    def get_agents(self, binary_name=None, only_alive=True):
+    @contextlib.contextmanager
+    def _api_call(self, operation, scheduled=True):
+        """Measure the API request done in the context.
+
+        If scheduled is True and the open-loop scheduler is used, request is
+        sent in the slot given by the scheduler and its latency is measured
+        from the intended send time. Time spent waiting for the concurrency
+        limiter is included in the measured latency.
+        """
+        if self.limiter:
+            limit = self.limiter.limit_request(operation)
+        else:
+            limit = contextlib.nullcontext()
+        if not scheduled or self.scheduler is None:
+            with self.metrics.measure(operation), limit:
+                yield
+            return
+        intended_time, send_time = self.scheduler.wait()
+        try:
+            with self.metrics.measure(operation, intended_time), limit:
+                yield
+        finally:
+            self.scheduler.record(intended_time, send_time)
+
+    def _journal_created(self, resource_type, resources):
+        if self.journal and resources:
+            self.journal.record_created(resource_type, resources)
+
+    def _journal_deleted(self, resource_type, resource):
+        if self.journal:
+            self.journal.record_deleted(resource_type, [resource])
+
+    def _bulk_create(self, resource_type, data, resource_name,
+                     journaled=True):
+        """Create resources with one bulk request and log its latency.
+
+        Returns list of created resources or None if the request failed.
+        """
+        watch = timeutils.StopWatch().start()
         try:
-            all_agents = self.os_conn.network.agents()
-            if only_alive:
-                agents = [agent for agent in all_agents
-                          if agent.get('is_alive') is True]
-            else:
-                agents = list(all_agents)
+            with self._api_call('create_%s_bulk' % resource_name):
+                resources = list(
+                    resource_type.bulk_create(self.os_conn.network, data))
         except Exception as e:
-            LOG.error("Failed to get list of Neutron agents. Error: %s", e)
+            LOG.warning("Bulk creation of %s %s failed, falling back to "
+                        "creating them one by one. Error: %s",
+                        len(data), resource_name, e)
             return
+        LOG.info("Created %s %s in bulk in %.3f seconds",
+                 len(resources), resource_name, watch.elapsed())
+        if journaled:
+            self._journal_created(resource_type.resource_key, resources)
+        return resources
+
+    def get_agents(self, binary_name=None, only_alive=True, host=None):
+        """Get agents, filtered by binary and host on the server side.
+
+        Agents are fetched page by page while they are consumed, so callers
+        never need to keep all of them in memory.
+        """
+        filters = {}
         if binary_name:
-            return [agent for agent in agents
-                    if agent.get("binary") == binary_name]
-        return agents
+            filters['binary'] = binary_name
+        if host:
+            filters['host'] = host
+        try:
+            for agent in self.metrics.measure_iter(
+                    'get_agents', self.os_conn.network.agents(
+                        **self._get_list_filters(**filters))):
+                if only_alive and agent.get('is_alive') is not True:
+                    continue
+                yield agent
+        except Exception as e:
+            LOG.error("Failed to get list of Neutron agents. Error: %s", e)
 
-    def create_network(self, name):
+    def _get_list_filters(self, **filters):
+        if self.page_size:
+            filters['limit'] = self.page_size
+        return filters
+
+    def _get_tagged_attrs(self, name):
+        attrs = {'name': name}
+        if self.tags:
+            attrs['tags'] = self.tags
+        return attrs
+
+    def _list_tagged(self, list_resources, resource_name, tags=None):
+        """List resources, only the ones with all given tags if set.
+
+        Tags are filtered on the server side and resources are fetched in
+        pages of the page_size resources.
+        """
+        filters = {}
+        if tags:
+            filters['tags'] = ','.join(tags)
         try:
-            return self.os_conn.network.create_network(name=name)
+            return self.metrics.measure_iter(
+                'get_%s' % resource_name,
+                list_resources(**self._get_list_filters(**filters)))
         except Exception as e:
-            LOG.warning("Network %s creation failed. Error: %s", name, e)
+            LOG.warning("Failed to get %s from neutron server. Error: %s",
+                        resource_name.replace('_', ' '), e)
 
-    def get_networks(self):
+    def create_network(self, name):
+        kwargs = self._get_tagged_attrs(name)
         try:
-            return self.os_conn.network.networks()
+            with self._api_call('create_network'):
+                network = self.os_conn.network.create_network(**kwargs)
         except Exception as e:
-            LOG.warning("Failed to get networks from neutron server. "
-                        "Error: %s", e)
+            LOG.warning("Network %s creation failed. Error: %s", name, e)
+            return
+        self._journal_created(heater_journal.NETWORK, [network])
+        return network
+
+    def create_networks_bulk(self, names):
+        """Create networks with a single bulk request.
+
+        If the bulk request fails, networks are created one by one.
+        """
+        data = [self._get_tagged_attrs(name) for name in names]
+        networks = self._bulk_create(_network.Network, data, 'networks')
+        if networks is None:
+            networks = [network for network in map(self.create_network, names)
+                        if network]
+        return networks
+
+    def get_networks(self, tags=None):
+        return self._list_tagged(self.os_conn.network.networks, 'networks',
+                                 tags)
 
     def delete_network(self, network):
         try:
-            return self.os_conn.network.delete_network(network)
+            with self._api_call('delete_network'):
+                self.os_conn.network.delete_network(network)
         except Exception as e:
             LOG.warning("Failed to delete network %s. "
                         "Error: %s", network['id'], e)
+            return
+        self._journal_deleted(heater_journal.NETWORK, network)
+
+    def _get_subnet_attrs(self, network_id, name, cidr):
+        attrs = {
+            'network_id': network_id,
+            'name': name,
+            'ip_version': netaddr.IPNetwork(cidr).version,
+            'cidr': cidr
+        }
+        if self.tags:
+            attrs['tags'] = self.tags
+        return attrs
 
     def create_subnet(self, network_id, name, cidr):
-        ip_version = netaddr.IPNetwork(cidr).version
+        kwargs = self._get_subnet_attrs(network_id, name, cidr)
         try:
-            return self.os_conn.network.create_subnet(network_id=network_id,
-                                                      name=name,
-                                                      ip_version=ip_version,
-                                                      cidr=cidr)
+            with self._api_call('create_subnet'):
+                subnet = self.os_conn.network.create_subnet(**kwargs)
         except Exception as e:
             LOG.warning("Subnet %s creation in network %s failed. "
                         "Error: %s", name, network_id, e)
+            return
+        self._journal_created(heater_journal.SUBNET, [subnet])
+        return subnet
 
-    def create_port(self, network_id, name, hostname=None):
-        kwargs = {
+    def create_subnets_bulk(self, subnets):
+        """Create subnets with a single bulk request.
+
+        :param subnets: list of dicts with the network_id, name and cidr of
+            each subnet. Subnets may belong to different networks.
+
+        If the bulk request fails, subnets are created one by one.
+        """
+        data = [self._get_subnet_attrs(**subnet) for subnet in subnets]
+        created_subnets = self._bulk_create(_subnet.Subnet, data, 'subnets')
+        if created_subnets is None:
+            created_subnets = []
+            for subnet in subnets:
+                created_subnet = self.create_subnet(**subnet)
+                if created_subnet:
+                    created_subnets.append(created_subnet)
+        return created_subnets
+
+    def delete_subnet(self, subnet):
+        try:
+            with self._api_call('delete_subnet'):
+                self.os_conn.network.delete_subnet(subnet)
+        except Exception as e:
+            LOG.warning("Failed to delete subnet %s. "
+                        "Error: %s", subnet['id'], e)
+            return
+        self._journal_deleted(heater_journal.SUBNET, subnet)
+
+    def _get_port_attrs(self, network_id, name, hostname=None):
+        attrs = {
             'network_id': network_id,
             'name': name
         }
         if hostname:
-            kwargs['device_owner'] = 'compute:neutron_heater'
-            kwargs['binding_host_id'] = hostname
+            attrs['device_owner'] = constants.PORT_DEVICE_OWNER
+            attrs['binding_host_id'] = hostname
+        if self.tags:
+            attrs['tags'] = self.tags
+        return attrs
+
+    def create_port(self, network_id, name, hostname=None):
+        kwargs = self._get_port_attrs(network_id, name, hostname)
         try:
-            return self.os_conn.network.create_port(**kwargs)
+            with self._api_call('create_port'):
+                port = self.os_conn.network.create_port(**kwargs)
         except Exception as e:
             LOG.warning("Port %s creation in network %s failed. "
                         "Error: %s", name, network_id, e)
+            return
+        self._journal_created(heater_journal.PORT, [port])
+        return port
+
+    def create_ports_bulk(self, network_id, names, hostname=None):
+        """Create ports with a single bulk request.
+
+        If the bulk request fails, ports are created one by one so
+        the returned list contains all ports which could be created.
+        """
+        if len(names) == 1:
+            port = self.create_port(network_id, names[0], hostname)
+            return [port] if port else []
+        data = [self._get_port_attrs(network_id, name, hostname)
+                for name in names]
+        ports = self._bulk_create(_port.Port, data, 'ports')
+        if ports is not None:
+            return ports
+        ports = []
+        for name in names:
+            port = self.create_port(network_id, name, hostname)
+            if port:
+                ports.append(port)
+        return ports
 
     def get_ports(self, network_id=None):
         filters = {}
         if network_id:
             filters['network_id'] = network_id
         try:
-            return self.os_conn.network.ports(**filters)
+            return self.metrics.measure_iter(
+                'get_ports', self.os_conn.network.ports(
+                    **self._get_list_filters(**filters)))
         except Exception as e:
             err_msg = "Failed to get ports from neutron server. "
             if network_id:
@@ -113,28 +368,244 @@ class OSClient(object):
             err_msg += "Error: %s" % e
             LOG.error(err_msg)
 
+    def get_ports_status(self, port_ids):
+        """Get statuses of the given ports with a single list request."""
+        try:
+            with self._api_call('get_ports_status', scheduled=False):
+                return {port['id']: port['status'] for port in
+                        self.os_conn.network.ports(id=port_ids,
+                                                   fields=['id', 'status'])}
+        except Exception as e:
+            LOG.warning("Failed to get status of %s ports. Error: %s",
+                        len(port_ids), e)
+            return {}
+
     def delete_port(self, port):
         try:
-            return self.os_conn.network.delete_port(port)
+            with self._api_call('delete_port'):
+                self.os_conn.network.delete_port(port)
         except Exception as e:
             LOG.warning("Failed to delete port %s. "
                         "Error: %s", port['id'], e)
+            return
+        self._journal_deleted(heater_journal.PORT, port)
+        return True
+
+    def get_network_subnets(self, network_id):
+        """Get all subnets of the network, keyed by ID, in one request."""
+        try:
+            with self._api_call('get_subnets', scheduled=False):
+                return {subnet['id']: subnet for subnet in
+                        self.os_conn.network.subnets(
+                            **self._get_list_filters(network_id=network_id))}
+        except Exception as e:
+            LOG.warning("Failed to get subnets of network %s. Error: %s",
+                        network_id, e)
+            return {}
 
-    def get_port_subnets(self, port):
+    def get_port_subnets(self, port, subnets_cache=None):
+        """Get subnets of the port's fixed IPs, keyed by ID.
+
+        Subnets which are already in subnets_cache aren't fetched from the
+        server again and the ones which were fetched are added to it.
+        """
+        if subnets_cache is None:
+            subnets_cache = {}
         subnets = {}
         for fixed_ip in port['fixed_ips']:
+            subnet = subnets_cache.get(fixed_ip['subnet_id'])
+            if subnet:
+                subnets[subnet['id']] = subnet
+                continue
             try:
-                subnet = self.os_conn.network.get_subnet(fixed_ip['subnet_id'])
+                with self._api_call('get_subnet', scheduled=False):
+                    subnet = self.os_conn.network.get_subnet(
+                        fixed_ip['subnet_id'])
             except Exception as e:
                 LOG.warning("Failed to get subnet %s. Error: %s",
                             fixed_ip['subnet_id'], e)
                 continue
-            subnets[subnet['id']] = subnet
+            subnets[subnet['id']] = subnets_cache[subnet['id']] = subnet
         return subnets
 
+    def set_port_security_groups(self, port, security_group_ids):
+        try:
+            with self._api_call('update_port_security_groups'):
+                return self.os_conn.network.update_port(
+                    port, security_group_ids=security_group_ids)
+        except Exception as e:
+            LOG.warning("Failed to set security groups of port %s. "
+                        "Error: %s", port['id'], e)
+
+    def set_port_fixed_ips(self, port, fixed_ips):
+        try:
+            with self._api_call('update_port_fixed_ips'):
+                return self.os_conn.network.update_port(
+                    port, fixed_ips=fixed_ips)
+        except Exception as e:
+            LOG.warning("Failed to set fixed IPs of port %s. "
+                        "Error: %s", port['id'], e)
+
+    def create_security_group(self, name):
+        kwargs = self._get_tagged_attrs(name)
+        try:
+            with self._api_call('create_security_group'):
+                security_group = self.os_conn.network.create_security_group(
+                    **kwargs)
+        except Exception as e:
+            LOG.warning("Security group %s creation failed. Error: %s",
+                        name, e)
+            return
+        self._journal_created(heater_journal.SECURITY_GROUP,
+                              [security_group])
+        return security_group
+
+    def create_security_group_rule(self, **rule):
+        try:
+            with self._api_call('create_security_group_rule'):
+                return self.os_conn.network.create_security_group_rule(
+                    **rule)
+        except Exception as e:
+            LOG.warning("Rule creation in security group %s failed. "
+                        "Error: %s", rule['security_group_id'], e)
+
+    def create_security_group_rules_bulk(self, rules):
+        """Create security group rules with a single bulk request.
+
+        Rules aren't recorded in the journal as they are deleted by Neutron
+        together with their security group. If the bulk request fails,
+        rules are created one by one.
+        """
+        created_rules = self._bulk_create(_sg_rule.SecurityGroupRule, rules,
+                                          'security_group_rules',
+                                          journaled=False)
+        if created_rules is None:
+            created_rules = [
+                created_rule for created_rule in
+                (self.create_security_group_rule(**rule) for rule in rules)
+                if created_rule]
+        return created_rules
+
+    def get_security_groups(self, tags=None):
+        return self._list_tagged(self.os_conn.network.security_groups,
+                                 'security_groups', tags)
+
+    def delete_security_group(self, security_group):
+        try:
+            with self._api_call('delete_security_group'):
+                self.os_conn.network.delete_security_group(security_group)
+        except Exception as e:
+            LOG.warning("Failed to delete security group %s. "
+                        "Error: %s", security_group['id'], e)
+            return
+        self._journal_deleted(heater_journal.SECURITY_GROUP, security_group)
+
+    def find_network(self, name_or_id):
+        try:
+            with self._api_call('find_network', scheduled=False):
+                return self.os_conn.network.find_network(name_or_id,
+                                                         ignore_missing=False)
+        except Exception as e:
+            LOG.warning("Failed to find network %s. Error: %s",
+                        name_or_id, e)
+
+    def create_router(self, name):
+        kwargs = self._get_tagged_attrs(name)
+        try:
+            with self._api_call('create_router'):
+                router = self.os_conn.network.create_router(**kwargs)
+        except Exception as e:
+            LOG.warning("Router %s creation failed. Error: %s", name, e)
+            return
+        self._journal_created(heater_journal.ROUTER, [router])
+        return router
+
+    def set_router_gateway(self, router, network_id):
+        try:
+            with self._api_call('set_router_gateway'):
+                return self.os_conn.network.update_router(
+                    router, external_gateway_info={'network_id': network_id})
+        except Exception as e:
+            LOG.warning("Failed to set gateway of router %s to network %s. "
+                        "Error: %s", router['id'], network_id, e)
+
+    def add_router_interface(self, router, subnet_id):
+        try:
+            with self._api_call('add_router_interface'):
+                return self.os_conn.network.add_interface_to_router(
+                    router, subnet=subnet_id)
+        except Exception as e:
+            LOG.warning("Failed to add subnet %s to router %s. Error: %s",
+                        subnet_id, router['id'], e)
+
+    def get_router_interfaces(self, router):
+        """Get ports of the router's interfaces, without its gateway."""
+        try:
+            with self._api_call('get_router_ports', scheduled=False):
+                return [port for port in self.os_conn.network.ports(
+                    device_id=router['id'])
+                    if port['device_owner'] in ROUTER_INTERFACE_OWNERS]
+        except Exception as e:
+            LOG.warning("Failed to get ports of router %s. Error: %s",
+                        router['id'], e)
+            return []
+
+    def remove_router_interface(self, router, port):
+        try:
+            with self._api_call('remove_router_interface'):
+                self.os_conn.network.remove_interface_from_router(
+                    router, port=port['id'])
+        except Exception as e:
+            LOG.warning("Failed to remove interface %s from router %s. "
+                        "Error: %s", port['id'], router['id'], e)
+
+    def get_routers(self, tags=None):
+        return self._list_tagged(self.os_conn.network.routers, 'routers',
+                                 tags)
+
+    def delete_router(self, router):
+        try:
+            with self._api_call('delete_router'):
+                self.os_conn.network.delete_router(router)
+        except Exception as e:
+            LOG.warning("Failed to delete router %s. Error: %s",
+                        router['id'], e)
+            return
+        self._journal_deleted(heater_journal.ROUTER, router)
+
+    def create_floating_ip(self, network_id, port):
+        kwargs = {'floating_network_id': network_id, 'port_id': port['id']}
+        if self.tags:
+            kwargs['tags'] = self.tags
+        try:
+            with self._api_call('create_floating_ip'):
+                floating_ip = self.os_conn.network.create_ip(**kwargs)
+        except Exception as e:
+            LOG.warning("Failed to create floating IP for port %s. "
+                        "Error: %s", port['id'], e)
+            return
+        self._journal_created(heater_journal.FLOATING_IP, [floating_ip])
+        return floating_ip
+
+    def get_floating_ips(self, tags=None):
+        return self._list_tagged(self.os_conn.network.ips, 'floating_ips',
+                                 tags)
+
+    def delete_floating_ip(self, floating_ip):
+        try:
+            with self._api_call('delete_floating_ip'):
+                self.os_conn.network.delete_ip(floating_ip)
+        except Exception as e:
+            LOG.warning("Failed to delete floating IP %s. Error: %s",
+                        floating_ip['id'], e)
+            return
+        self._journal_deleted(heater_journal.FLOATING_IP, floating_ip)
+
     def set_project_quota(self, **resources):
         try:
-            quota = self.os_conn.network.get_quota(self.project_id)
-            self.os_conn.network.update_quota(quota, **resources)
+            with self._api_call('get_quota', scheduled=False):
+                quota = self.os_conn.network.get_quota(self.project_id)
+            with self._api_call('update_quota', scheduled=False):
+                self.os_conn.network.update_quota(quota, **resources)
         except Exception as e:
             LOG.warning("Failed to set quota. Error: %s", e)
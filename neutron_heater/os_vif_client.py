@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 import os_vif
 from os_vif import exception as vif_exc
 from os_vif.objects import instance_info
@@ -27,9 +29,20 @@ LINUX_DEV_LEN = 14
 
 
 class OSVifClient(object):
+    """Plug ports on the node with os_vif.
+
+    os_vif Network objects, with all their subnets, are the same for all
+    ports from the network so they are built only once and cached until
+    release_network is called for the network. Only objects specific for
+    the port, like VIF, port profile and InstanceInfo, are built for every
+    port.
+    """
 
     def __init__(self):
         os_vif.initialize()
+        # {network_id: {(subnet_id, ...): os_vif Network object}}
+        self._networks = {}
+        self._lock = threading.Lock()
 
     def plug_port(self, port, subnets):
         instance_info = self._get_instance_info(port)
@@ -39,6 +52,12 @@ class OSVifClient(object):
         except vif_exc.PlugException as err:
             LOG.error('Failed to plug port %s on the host. Error: %s',
                       port['name'], err)
+            return False
+        return True
+
+    def plug_ports(self, ports, subnets):
+        """Plug ports and return list of the ones plugged successfully."""
+        return [port for port in ports if self.plug_port(port, subnets)]
 
     def unplug_port(self, port, subnets):
         instance_info = self._get_instance_info(port)
@@ -49,25 +68,45 @@ class OSVifClient(object):
             LOG.error('Failed to unplug port %s on the host. Error: %s',
                       port['name'], err)
 
+    def unplug_ports(self, ports, subnets):
+        for port in ports:
+            self.unplug_port(port, subnets)
+
     def _get_instance_info(self, port):
         return instance_info.InstanceInfo(
             uuid=uuidutils.generate_uuid(),
             name='fake-vm-connected-to-%s' % port['name'],
             project_id=port['project_id'])
 
-    def _get_subnet_objects(self, port, subnets):
+    def release_network(self, network_id):
+        """Forget cached objects of the network once its ports are done."""
+        with self._lock:
+            self._networks.pop(network_id, None)
+
+    def _get_subnet_objects(self, subnet_ids, subnets):
         os_vif_subnets = []
-        for fixed_ip in port['fixed_ips']:
-            subnet = subnets.get(fixed_ip['subnet_id'])
+        for subnet_id in subnet_ids:
+            subnet = subnets.get(subnet_id)
             os_vif_subnet = os_subnet.Subnet(subnet['cidr'])
             os_vif_subnets.append(os_vif_subnet)
         return os_subnet.SubnetList(os_vif_subnets)
 
     def _get_network_object(self, port, subnets):
-        return network.Network(
-            label='neutron-heater-test-net',
-            subnets=self._get_subnet_objects(port, subnets),
-            bridge='br-int')
+        subnet_ids = tuple(fixed_ip['subnet_id']
+                           for fixed_ip in port['fixed_ips'])
+        with self._lock:
+            network_objects = self._networks.setdefault(
+                port['network_id'], {})
+            network_object = network_objects.get(subnet_ids)
+        if network_object is None:
+            network_object = network.Network(
+                label='neutron-heater-test-net',
+                subnets=self._get_subnet_objects(subnet_ids, subnets),
+                bridge='br-int')
+            with self._lock:
+                network_object = network_objects.setdefault(
+                    subnet_ids, network_object)
+        return network_object
 
     def _get_vif_object(self, port, subnets):
         # NOTE(slaweq): VIFBridge is used always, even if it will be run on
@@ -0,0 +1,89 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from oslo_utils import uuidutils
+from ovsdbapp.backend.ovs_idl import connection
+from ovsdbapp.schema.open_vswitch import impl_idl
+
+from neutron_heater import os_vif_client
+
+LOG = logging.getLogger(__name__)
+
+
+class OvsdbClient(object):
+    """Plug ports directly in the OVS integration bridge with ovsdbapp.
+
+    All ports given to plug_ports or unplug_ports are added to or removed
+    from the bridge in a single OVSDB transaction, without going through
+    os_vif and privsep for every port. Ports are created as OVS internal
+    ports, so they have network device and ofport number which is needed
+    to provision them by the Neutron L2 agent (or ovn-controller).
+    """
+
+    def __init__(self, ovsdb_connection, bridge, timeout):
+        idl = connection.OvsdbIdl.from_server(ovsdb_connection,
+                                              'Open_vSwitch')
+        self.ovs = impl_idl.OvsdbIdl(connection.Connection(idl, timeout))
+        self.bridge = bridge
+
+    def plug_port(self, port, subnets):
+        return bool(self.plug_ports([port], subnets))
+
+    def plug_ports(self, ports, subnets):
+        """Plug ports and return list of the ones plugged successfully."""
+        if not ports:
+            return []
+        try:
+            with self.ovs.transaction(check_error=True) as txn:
+                for port in ports:
+                    txn.add(self.ovs.add_port(
+                        self.bridge, self._get_tap_name(port),
+                        type='internal',
+                        external_ids=self._get_external_ids(port)))
+        except Exception as err:
+            LOG.error('Failed to plug ports %s on the host. Error: %s',
+                      ", ".join(port['name'] for port in ports), err)
+            return []
+        return ports
+
+    def unplug_port(self, port, subnets):
+        self.unplug_ports([port], subnets)
+
+    def unplug_ports(self, ports, subnets):
+        if not ports:
+            return
+        try:
+            with self.ovs.transaction(check_error=True) as txn:
+                for port in ports:
+                    txn.add(self.ovs.del_port(self._get_tap_name(port),
+                                              bridge=self.bridge,
+                                              if_exists=True))
+        except Exception as err:
+            LOG.error('Failed to unplug ports %s on the host. Error: %s',
+                      ", ".join(port['name'] for port in ports), err)
+
+    def release_network(self, network_id):
+        # Nothing is cached per network by this backend
+        pass
+
+    def _get_external_ids(self, port):
+        return {
+            'iface-id': port['id'],
+            'iface-status': 'active',
+            'attached-mac': port['mac_address'],
+            'vm-uuid': uuidutils.generate_uuid(),
+        }
+
+    def _get_tap_name(self, port):
+        tap_name = os_vif_client.TAP_DEVICE_PREFIX + port['id']
+        return tap_name[:os_vif_client.LINUX_DEV_LEN]
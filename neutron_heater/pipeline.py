@@ -0,0 +1,348 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import queue
+import threading
+import time
+
+from oslo_log import log as logging
+
+from neutron_heater import address_planner
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+_STOP = object()
+
+TIME_TO_FIRST_DELETE = 'time_to_first_delete'
+# Peak resident memory, in KiB, summed over all processes of the run
+PEAK_RSS = 'peak_rss_kib'
+# Only fields of the ports which are needed to unplug and delete them are
+# kept, instead of the whole resources returned by the SDK
+PORT_FIELDS = ('id', 'name', 'network_id', 'project_id', 'mac_address',
+               'fixed_ips')
+
+
+class Stage(object):
+    """One stage of the pipeline with its own pool of workers.
+
+    Every item taken from the stage's bounded input queue is passed to
+    func, which returns list, or generator, of items for the next stage.
+    Workers block when the queue of the next stage is full, so slow stages
+    slow down the ones before them instead of growing queues without
+    limits.
+    """
+
+    def __init__(self, name, func, workers, queue_size):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.max_queue_depth = 0
+        self.started_at = None
+        self.finished_at = None
+        self._running_workers = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._running_workers = self.workers
+        for worker in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name="%s-%s" % (self.name, worker),
+                daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def put(self, item):
+        """Put item in the queue and return time spent waiting for it."""
+        start = time.monotonic()
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return time.monotonic() - start
+
+    def stop(self):
+        for _ in range(self.workers):
+            self.queue.put(_STOP)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            start = time.monotonic()
+            blocked = 0.0
+            failed = False
+            try:
+                # Results produced by a generator are passed to the next
+                # stage one by one, before the whole item is processed
+                for result in self.func(item) or []:
+                    if self.next_stage:
+                        blocked += self.next_stage.put(result)
+            except Exception:
+                LOG.exception("Stage %s failed to process item", self.name)
+                failed = True
+            busy = time.monotonic() - start - blocked
+            with self._lock:
+                self.processed += 1
+                self.failed += int(failed)
+                self.busy_time += busy
+                self.blocked_time += blocked
+        with self._lock:
+            self._running_workers -= 1
+            last_worker = self._running_workers == 0
+        if last_worker:
+            self.finished_at = time.monotonic()
+            if self.next_stage:
+                self.next_stage.stop()
+
+    def throughput(self):
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def utilization(self):
+        """Get percentage of the workers' time spent processing items."""
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        workers_time = self.workers * elapsed
+        return (self.busy_time / workers_time * 100
+                if workers_time > 0 else 0.0)
+
+
+class Pipeline(object):
+
+    def __init__(self, stages, report_interval=10):
+        self.stages = stages
+        self.report_interval = report_interval
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        self._finished = threading.Event()
+
+    def run(self, items):
+        """Feed items to the first stage and wait until all are processed."""
+        for stage in self.stages:
+            stage.start()
+        monitor = threading.Thread(target=self._monitor, daemon=True)
+        monitor.start()
+        for item in items:
+            self.stages[0].put(item)
+        self.stages[0].stop()
+        for stage in self.stages:
+            stage.join()
+        self._finished.set()
+        monitor.join()
+        self.report_summary()
+
+    def _monitor(self):
+        while not self._finished.wait(self.report_interval):
+            LOG.info("Pipeline queue depths: %s", ", ".join(
+                "%s=%s" % (stage.name, stage.queue.qsize())
+                for stage in self.stages))
+
+    def report_summary(self):
+        for stage in self.stages:
+            LOG.info("Stage %(name)s: processed %(processed)s items "
+                     "(%(failed)s failed) with %(workers)s workers, "
+                     "%(throughput).2f items/s, workers busy %(util).1f%% "
+                     "of time, blocked on next stage %(blocked).2f s, "
+                     "max queue depth %(depth)s",
+                     {'name': stage.name, 'processed': stage.processed,
+                      'failed': stage.failed, 'workers': stage.workers,
+                      'throughput': stage.throughput(),
+                      'util': stage.utilization(),
+                      'blocked': stage.blocked_time,
+                      'depth': stage.max_queue_depth})
+
+
+def create_resources(config, hostname, os_client, os_vif, api_workers,
+                     plug_workers, tracker=None, net_numbers=None):
+    """Create resources in pipeline network -> subnets -> ports -> plug.
+
+    Every stage has its own pool of workers so ports can be plugged on the
+    node while next ones are still being created in Neutron.
+    """
+    if net_numbers is None:
+        net_numbers = range(config.networks)
+    planner = address_planner.AddressPlanner(
+        config.ports, config.ipv4_subnets, config.ipv6_subnets)
+    # Number of port batches of every network which are not plugged yet, to
+    # know when os_vif objects cached for the network can be released
+    remaining_batches = {}
+    remaining_batches_lock = threading.Lock()
+
+    def batch_done(network):
+        with remaining_batches_lock:
+            remaining_batches[network['id']] -= 1
+            network_done = remaining_batches[network['id']] == 0
+            if network_done:
+                del remaining_batches[network['id']]
+        if network_done:
+            os_vif.release_network(network['id'])
+
+    def create_networks(net_numbers):
+        network_names = {utils.get_network_name(net_number, hostname):
+                         net_number for net_number in net_numbers}
+        LOG.info("Starting to create networks %s", ", ".join(network_names))
+        if config.network_batch_size > 1:
+            networks = os_client.create_networks_bulk(list(network_names))
+        else:
+            networks = [os_client.create_network(name)
+                        for name in network_names]
+        return [(network_names[network['name']], network)
+                for network in networks if network]
+
+    def create_subnets(item):
+        net_number, network = item
+        subnets_data = [
+            {'network_id': network['id'], 'name': subnet_name, 'cidr': cidr}
+            for subnet_name, cidr in planner.get_subnets(net_number,
+                                                         hostname)]
+        if config.network_batch_size > 1:
+            subnets = os_client.create_subnets_bulk(subnets_data)
+        else:
+            subnets = [os_client.create_subnet(**subnet)
+                       for subnet in subnets_data]
+        subnets = {subnet['id']: subnet for subnet in subnets if subnet}
+        if not subnets:
+            # Only if some subnets were created creating ports makes any
+            # sense
+            return []
+        port_names = (utils.get_port_name(port, hostname, network['id'])
+                      for port in range(config.ports))
+        batches = [(network, subnets, batch) for batch in
+                   utils.chunks(port_names, config.port_batch_size)]
+        with remaining_batches_lock:
+            remaining_batches[network['id']] = len(batches)
+        return batches
+
+    def create_ports(item):
+        network, subnets, port_names = item
+        ports = os_client.create_ports_bulk(network['id'], port_names,
+                                            hostname)
+        if not ports:
+            batch_done(network)
+            return []
+        if tracker:
+            tracker.ports_created(ports)
+        return [(network, ports, subnets)]
+
+    def plug_ports(item):
+        network, ports, subnets = item
+        os_vif.plug_ports(ports, subnets)
+        if tracker:
+            tracker.ports_plugged(ports)
+        batch_done(network)
+
+    queue_size = config.pipeline_queue_size
+    pipeline = Pipeline(
+        [Stage('network', create_networks, api_workers, queue_size),
+         Stage('subnets', create_subnets, api_workers, queue_size),
+         Stage('ports', create_ports, api_workers, queue_size),
+         Stage('plug', plug_ports, plug_workers, queue_size)],
+        report_interval=config.report_interval)
+    pipeline.run(utils.chunks(net_numbers, config.network_batch_size))
+
+
+def clean_resources(networks, os_client, os_vif, api_workers, queue_size,
+                    port_batch_size=1, report_interval=10, started_at=None):
+    """Clean networks with all their ports in pipeline ports -> delete.
+
+    Networks and ports are taken from the paginated listings while the
+    ones listed before are already being deleted. Queues of the stages are
+    bounded, so listing waits for the deletes and only a few pages of
+    resources are kept in memory, no matter how many of them are cleaned.
+
+    started_at is time.monotonic() of the start of the cleanup run, from
+    which the time to the first delete is measured.
+    """
+    if started_at is None:
+        started_at = time.monotonic()
+    first_delete_done = threading.Event()
+    # Number of port batches of every network which are not deleted yet,
+    # plus one while ports of the network are still being listed
+    remaining_batches = {}
+    remaining_batches_lock = threading.Lock()
+
+    def deleted():
+        if first_delete_done.is_set():
+            return
+        with remaining_batches_lock:
+            if first_delete_done.is_set():
+                return
+            first_delete_done.set()
+        os_client.metrics.record(TIME_TO_FIRST_DELETE,
+                                 time.monotonic() - started_at)
+
+    def batch_done(network):
+        with remaining_batches_lock:
+            remaining_batches[network['id']] -= 1
+            network_done = remaining_batches[network['id']] == 0
+            if network_done:
+                del remaining_batches[network['id']]
+        if network_done:
+            os_vif.release_network(network['id'])
+            os_client.delete_network(network)
+            deleted()
+
+    def list_ports(network):
+        # All ports in the network share the same few subnets so they are
+        # listed once and ports' subnets are looked up in that cache
+        subnets = os_client.get_network_subnets(network['id'])
+        with remaining_batches_lock:
+            remaining_batches[network['id']] = 1
+        ports = os_client.get_ports(network['id']) or []
+        for batch in utils.chunks(ports, port_batch_size):
+            for port in batch:
+                os_client.get_port_subnets(port, subnets)
+            with remaining_batches_lock:
+                remaining_batches[network['id']] += 1
+            yield (network, subnets,
+                   [{field: port[field] for field in PORT_FIELDS}
+                    for port in batch])
+        # If listing failed, network is left with its ports not deleted
+        batch_done(network)
+
+    def delete_ports(item):
+        network, subnets, ports = item
+        os_vif.unplug_ports(ports, subnets)
+        for port in ports:
+            os_client.delete_port(port)
+        deleted()
+        batch_done(network)
+
+    pipeline = Pipeline(
+        [Stage('list', list_ports, api_workers, queue_size),
+         Stage('delete', delete_ports, api_workers, queue_size)],
+        report_interval=report_interval)
+    pipeline.run(networks)
+
+
+def report_clean_summary(metrics):
+    if PEAK_RSS in metrics.counters:
+        LOG.info("Peak RSS of the cleanup: %.1f MiB",
+                 metrics.counters[PEAK_RSS] / 1024.0)
+    first_delete = metrics.operations.get(TIME_TO_FIRST_DELETE)
+    if first_delete:
+        LOG.info("First resource deleted after %.2f seconds",
+                 first_delete.latency.min)
@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+from oslo_log import log as logging
+
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+ACTIVE = 'ACTIVE'
+# Number of port IDs used as filter in one list request, to keep the
+# request's URL in a sane length
+PORTS_PER_REQUEST = 100
+# Number of IDs of the ports which never became ACTIVE which are logged
+MAX_LOGGED_PORTS = 20
+
+CREATE_TO_ACTIVE = 'port_create_to_active'
+PLUG_TO_ACTIVE = 'port_plug_to_active'
+UPDATE_TO_ACTIVE = 'port_update_to_active'
+
+
+class _PortTimes(object):
+
+    def __init__(self, created_at):
+        self.created_at = created_at
+        self.plugged_at = None
+
+
+class ProvisioningTracker(object):
+    """Measure how long it takes to provision ports by the L2 agents.
+
+    Status of all ports which are not ACTIVE yet is checked every interval
+    with list requests filtered by the ports' IDs, instead of getting every
+    port separately. Time from the port's creation, and from plugging it
+    on the node, to the moment when it was seen ACTIVE is recorded in the
+    metrics. Updated ports are tracked separately, from the moment of their
+    update, so their creation is still measured if it isn't done yet.
+    """
+
+    def __init__(self, os_client, metrics, interval, timeout):
+        self.os_client = os_client
+        self.metrics = metrics
+        self.interval = interval
+        self.timeout = timeout
+        self.timed_out_ports = []
+        self._pending = {}
+        self._updated = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def ports_created(self, ports):
+        now = time.monotonic()
+        with self._lock:
+            for port in ports:
+                self._pending[port['id']] = _PortTimes(now)
+
+    def ports_plugged(self, ports):
+        now = time.monotonic()
+        with self._lock:
+            for port in ports:
+                port_times = self._pending.get(port['id'])
+                if port_times:
+                    port_times.plugged_at = now
+
+    def ports_updated(self, ports):
+        """Track ports from the moment when they were updated.
+
+        Backends which apply e.g. new security groups of the port set it
+        DOWN until it is done, with other ones the port is seen ACTIVE in
+        the first check after the update.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for port in ports:
+                self._updated[port['id']] = now
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._check_ports()
+
+    def _check_ports(self):
+        with self._lock:
+            port_ids = list(self._pending)
+            port_ids.extend(port_id for port_id in self._updated
+                            if port_id not in self._pending)
+        for chunk in utils.chunks(port_ids, PORTS_PER_REQUEST):
+            statuses = self.os_client.get_ports_status(chunk)
+            now = time.monotonic()
+            with self._lock:
+                for port_id, status in statuses.items():
+                    if status != ACTIVE:
+                        continue
+                    updated_at = self._updated.pop(port_id, None)
+                    if updated_at is not None:
+                        self.metrics.record(UPDATE_TO_ACTIVE,
+                                            now - updated_at)
+                    port_times = self._pending.pop(port_id, None)
+                    if port_times is None:
+                        continue
+                    self.metrics.record(CREATE_TO_ACTIVE,
+                                        now - port_times.created_at)
+                    if port_times.plugged_at:
+                        self.metrics.record(PLUG_TO_ACTIVE,
+                                            now - port_times.plugged_at)
+        now = time.monotonic()
+        with self._lock:
+            for port_id, port_times in list(self._pending.items()):
+                if now - port_times.created_at > self.timeout:
+                    del self._pending[port_id]
+                    self.timed_out_ports.append(port_id)
+                    self.metrics.record_error(CREATE_TO_ACTIVE)
+            for port_id, updated_at in list(self._updated.items()):
+                if now - updated_at > self.timeout:
+                    del self._updated[port_id]
+                    if port_id not in self.timed_out_ports:
+                        self.timed_out_ports.append(port_id)
+                    self.metrics.record_error(UPDATE_TO_ACTIVE)
+
+    def wait(self):
+        """Wait until all ports are ACTIVE or timed out and stop polling."""
+        while True:
+            with self._lock:
+                if not self._pending and not self._updated:
+                    break
+            time.sleep(self.interval)
+        self._stop.set()
+        self._thread.join()
+
+    def report_summary(self):
+        self.metrics.add_details('ports_not_active', self.timed_out_ports)
+        if not self.timed_out_ports:
+            LOG.info("All tracked ports became ACTIVE")
+            return
+        LOG.warning("%s ports didn't become ACTIVE in %s seconds: %s%s",
+                    len(self.timed_out_ports), self.timeout,
+                    ", ".join(self.timed_out_ports[:MAX_LOGGED_PORTS]),
+                    ", ..." if len(self.timed_out_ports) > MAX_LOGGED_PORTS
+                    else "")
@@ -0,0 +1,132 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+import random
+import threading
+import time
+
+from oslo_log import log as logging
+
+from neutron_heater import constants
+
+
+LOG = logging.getLogger(__name__)
+
+
+class OpenLoopScheduler(object):
+    """Schedule API requests with the given rate of requests per second.
+
+    Send times of the requests are planned in advance, with uniform or
+    Poisson distributed intervals, and don't depend on how fast previous
+    requests were finished. Latency is measured from the intended send
+    time, not from the moment when request was really sent, so time spent
+    waiting for a free worker is counted too (coordinated omission
+    correction). It includes time when all requests in flight were stuck
+    on the slow server and no new ones could be sent. Only time between
+    pause() and resume(), when the heater has no requests to send, is not
+    counted.
+    """
+
+    def __init__(self, rate, arrival=constants.UNIFORM_ARRIVAL):
+        self.rate = rate
+        self.arrival = arrival
+        self._lock = threading.Lock()
+        self._next_send_time = None
+        self._paused_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.requests = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+
+    def _get_interval(self):
+        if self.arrival == constants.POISSON_ARRIVAL:
+            return random.expovariate(self.rate)
+        return 1.0 / self.rate
+
+    def _reserve(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = now
+            if self._next_send_time is None:
+                self._next_send_time = now
+            intended_time = self._next_send_time
+            self._next_send_time += self._get_interval()
+        return intended_time
+
+    def pause(self):
+        """Stop the schedule while the heater has no requests to send."""
+        with self._lock:
+            if self._paused_at is None:
+                self._paused_at = time.monotonic()
+
+    def resume(self):
+        """Continue the schedule from where it was paused."""
+        with self._lock:
+            if self._paused_at is None:
+                return
+            if self._next_send_time is not None:
+                self._next_send_time += time.monotonic() - self._paused_at
+            self._paused_at = None
+
+    def wait(self):
+        """Wait for the next send slot and return its intended time."""
+        intended_time = self._reserve()
+        delay = intended_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return intended_time, time.monotonic()
+
+    async def async_wait(self):
+        intended_time = self._reserve()
+        delay = intended_time - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return intended_time, time.monotonic()
+
+    def record(self, intended_time, send_time):
+        """Record request which was sent in the slot and just finished."""
+        now = time.monotonic()
+        latency = now - intended_time
+        lag = send_time - intended_time
+        with self._lock:
+            self.finished_at = now
+            self.requests += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.lag_sum += lag
+            self.lag_max = max(self.lag_max, lag)
+
+    def report_summary(self):
+        if not self.requests:
+            return
+        elapsed = self.finished_at - self.started_at
+        LOG.info("Open-loop scheduler sent %(requests)s requests with "
+                 "target rate %(rate).2f req/s, achieved %(achieved).2f "
+                 "req/s. Latency from intended send time: avg %(avg).3f s, "
+                 "max %(max).3f s. Send lag: avg %(lag_avg).3f s, "
+                 "max %(lag_max).3f s",
+                 {'requests': self.requests, 'rate': self.rate,
+                  'achieved': self.requests / elapsed if elapsed else 0.0,
+                  'avg': self.latency_sum / self.requests,
+                  'max': self.latency_max,
+                  'lag_avg': self.lag_sum / self.requests,
+                  'lag_max': self.lag_max})
+        if self.lag_sum / self.requests > 1.0 / self.rate:
+            LOG.warning("Requests were sent on average later than the "
+                        "interval between them. Target rate couldn't be "
+                        "kept, increase --concurrency or use the asyncio "
+                        "engine.")
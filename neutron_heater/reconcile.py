@@ -0,0 +1,302 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import itertools
+
+import netaddr
+from oslo_log import log as logging
+
+from neutron_heater import address_planner
+from neutron_heater import pipeline
+from neutron_heater import utils
+from neutron_heater import work_scheduler
+
+
+LOG = logging.getLogger(__name__)
+
+
+class SubnetsConflict(ValueError):
+    pass
+
+
+class SubnetTooSmall(SubnetsConflict):
+    pass
+
+
+class SubnetsOverlap(SubnetsConflict):
+    pass
+
+
+class NetworkReconciler(object):
+    """Add tasks which bring networks to the requested state.
+
+    Subnets and ports which are missing in the network are created, and
+    the ones which are not needed anymore are deleted. Ports which don't
+    have one of the requested names are deleted first, so existing ports
+    are kept when only their number grows. Only ports created by the
+    heater are taken into account, not e.g. DHCP or router ports.
+    Missing networks are created, and the ones which are not requested
+    anymore are deleted, by tasks of the same scheduler.
+    """
+
+    def __init__(self, config, hostname, os_client, os_vif, scheduler,
+                 tracker=None):
+        self.config = config
+        self.hostname = hostname
+        self.os_client = os_client
+        self.os_vif = os_vif
+        self.scheduler = scheduler
+        self.tracker = tracker
+        self.planner = address_planner.AddressPlanner(
+            config.ports, config.ipv4_subnets, config.ipv6_subnets)
+        self.created_ports = 0
+        self.deleted_ports = 0
+
+    def _task(self, name, func, *args, after=()):
+        return self.scheduler.add(work_scheduler.Task(name, func, *args),
+                                  after=after)
+
+    def _get_ports(self, network_id):
+        return [{field: port[field] for field in pipeline.PORT_FIELDS}
+                for port in self.os_client.get_ports(network_id) or []
+                if utils.is_heater_port(port)]
+
+    def _get_subnets(self, subnets, subnet_tasks):
+        # Subnets which already existed together with the ones created by
+        # the subnet_tasks
+        subnets = dict(subnets)
+        for task in subnet_tasks:
+            if task.result:
+                subnets[task.result['id']] = task.result
+        return subnets
+
+    def _create_ports(self, network_id, subnets, subnet_tasks, port_names):
+        if not self._get_subnets(subnets, subnet_tasks):
+            return []
+        ports = self.os_client.create_ports_bulk(network_id, port_names,
+                                                 self.hostname)
+        if ports and self.tracker:
+            self.tracker.ports_created(ports)
+        return ports
+
+    def _plug_ports(self, ports_task, subnets, subnet_tasks):
+        if not ports_task.result:
+            return
+        self.os_vif.plug_ports(ports_task.result,
+                               self._get_subnets(subnets, subnet_tasks))
+        if self.tracker:
+            self.tracker.ports_plugged(ports_task.result)
+
+    def _delete_ports(self, ports, subnets):
+        self.os_vif.unplug_ports(ports, subnets)
+        for port in ports:
+            self.os_client.delete_port(port)
+
+    def _remove_fixed_ips(self, ports, subnet_ids):
+        for port in ports:
+            self.os_client.set_port_fixed_ips(
+                port, [fixed_ip for fixed_ip in port['fixed_ips']
+                       if fixed_ip['subnet_id'] not in subnet_ids])
+
+    def check(self, net_number, network, subnets):
+        """Raise SubnetsConflict if existing subnets can't be reconciled.
+
+        Existing subnets are never resized, so SubnetTooSmall is raised if
+        the number of ports grows over the number planned for them in the
+        run which created them, and SubnetsOverlap if subnets which would
+        be created overlap the existing ones, planned for other number of
+        ports.
+        """
+        requested_subnets = self.planner.get_subnets(net_number,
+                                                     self.hostname)
+        existing_names = {subnet['name'] for subnet in subnets.values()}
+        for name, cidr in requested_subnets:
+            if name in existing_names:
+                continue
+            for subnet in subnets.values():
+                if netaddr.IPSet([cidr]) & netaddr.IPSet([subnet['cidr']]):
+                    raise SubnetsOverlap(
+                        "Subnet %s of network %s would have CIDR %s which "
+                        "overlaps CIDR %s of the existing subnet %s" % (
+                            name, network['name'], cidr, subnet['cidr'],
+                            subnet['name']))
+        requested_names = {name for name, _cidr in requested_subnets}
+        for subnet in subnets.values():
+            cidr = netaddr.IPNetwork(subnet['cidr'])
+            if subnet['name'] not in requested_names or cidr.version != 4:
+                continue
+            if cidr.prefixlen > self.planner.v4_prefixlen:
+                raise SubnetTooSmall(
+                    "Subnet %s of network %s has CIDR %s which has no room "
+                    "for %s ports, at least /%s is needed" % (
+                        subnet['name'], network['name'], cidr,
+                        self.config.ports, self.planner.v4_prefixlen))
+
+    def reconcile(self, net_number, network, subnets, ports=None):
+        """Compare network with the requested state and add tasks to fix.
+
+        Ports of the network are listed if they are not given.
+        """
+        network_id = network['id']
+        if ports is None:
+            ports = self._get_ports(network_id)
+
+        requested_subnets = self.planner.get_subnets(net_number,
+                                                     self.hostname)
+        requested_names = {name for name, _cidr in requested_subnets}
+        existing_names = {subnet['name'] for subnet in subnets.values()}
+        subnet_tasks = [
+            self._task('subnets', self.os_client.create_subnet, network_id,
+                       name, cidr)
+            for name, cidr in requested_subnets
+            if name not in existing_names]
+        extra_subnets = [subnet for subnet in subnets.values()
+                         if subnet['name'] not in requested_names]
+
+        requested_ports = {utils.get_port_name(port, self.hostname,
+                                               network_id)
+                           for port in range(self.config.ports)}
+        existing_ports = {port['name'] for port in ports}
+        # Ports with names out of the requested ones are deleted first
+        ports.sort(key=lambda port: port['name'] in requested_ports)
+        extra = max(len(ports) - self.config.ports, 0)
+        ports_to_delete = ports[:extra]
+        missing = max(self.config.ports - len(ports), 0)
+        new_port_names = itertools.islice(
+            (name for name in (utils.get_port_name(port, self.hostname,
+                                                   network_id)
+                               for port in itertools.count())
+             if name not in existing_ports), missing)
+
+        done_tasks = []
+        for batch in utils.chunks(new_port_names,
+                                  self.config.port_batch_size):
+            ports_task = self._task('ports', self._create_ports, network_id,
+                                    subnets, subnet_tasks, batch,
+                                    after=subnet_tasks)
+            done_tasks.append(self._task('plug', self._plug_ports, ports_task,
+                                         subnets, subnet_tasks,
+                                         after=[ports_task]))
+        delete_tasks = [
+            self._task('delete_ports', self._delete_ports, batch, subnets)
+            for batch in utils.chunks(ports_to_delete,
+                                      self.config.port_batch_size)]
+        # Subnets can be deleted only when no ports have IPs from them, so
+        # the kept ports give up their IPs from the deleted subnets
+        extra_subnet_ids = {subnet['id'] for subnet in extra_subnets}
+        ports_to_update = [
+            port for port in ports[extra:]
+            if any(fixed_ip['subnet_id'] in extra_subnet_ids
+                   for fixed_ip in port['fixed_ips'])]
+        delete_tasks.extend(
+            self._task('update_ports', self._remove_fixed_ips, batch,
+                       extra_subnet_ids)
+            for batch in utils.chunks(ports_to_update,
+                                      self.config.port_batch_size))
+        done_tasks.extend(
+            self._task('delete_subnet', self.os_client.delete_subnet, subnet,
+                       after=delete_tasks)
+            for subnet in extra_subnets)
+        done_tasks.extend(delete_tasks)
+        self._task('release', self.os_vif.release_network, network_id,
+                   after=done_tasks)
+        self.created_ports += missing
+        self.deleted_ports += extra
+        LOG.info("Network %s: %s subnets and %s ports to create, %s subnets "
+                 "and %s ports to delete", network['name'], len(subnet_tasks),
+                 missing, len(extra_subnets), extra)
+
+    def create_networks(self, net_numbers):
+        """Create networks and add tasks creating their subnets and ports."""
+        network_names = {utils.get_network_name(net_number, self.hostname):
+                         net_number for net_number in net_numbers}
+        LOG.info("Starting to create networks %s", ", ".join(network_names))
+        if len(network_names) > 1:
+            networks = self.os_client.create_networks_bulk(
+                list(network_names))
+        else:
+            networks = [self.os_client.create_network(name)
+                        for name in network_names]
+        for network in networks:
+            if network:
+                self.reconcile(network_names[network['name']], network, {},
+                               [])
+
+    def delete_network(self, network):
+        """Add tasks deleting the network after all its ports."""
+        subnets = self.os_client.get_network_subnets(network['id'])
+        ports = self._get_ports(network['id'])
+        delete_tasks = [
+            self._task('delete_ports', self._delete_ports, batch, subnets)
+            for batch in utils.chunks(ports, self.config.port_batch_size)]
+        network_task = self._task('delete_network',
+                                  self.os_client.delete_network, network,
+                                  after=delete_tasks)
+        self._task('release', self.os_vif.release_network, network['id'],
+                   after=[network_task])
+        self.deleted_ports += len(ports)
+        LOG.info("Network %s: %s ports to delete with the network",
+                 network['name'], len(ports))
+
+
+def reconcile_resources(config, hostname, os_client, os_vif, workers,
+                        owned_networks, tracker=None):
+    """Create or delete only what differs from the requested resources.
+
+    Missing networks are created from scratch, networks which are not
+    requested anymore are deleted with all their ports and the existing
+    ones are reconciled subnet by subnet and port by port, all by the same
+    workers at once. Raises SubnetsConflict before anything is changed if
+    the existing subnets have no room for the requested ports or overlap
+    the subnets which would be created.
+    """
+    requested = {utils.get_network_name(net_number, hostname): net_number
+                 for net_number in range(config.networks)}
+    existing = {}
+    extra_networks = []
+    for network in owned_networks:
+        if network['name'] in requested and network['name'] not in existing:
+            existing[network['name']] = network
+        else:
+            extra_networks.append(network)
+    missing = [net_number for name, net_number in requested.items()
+               if name not in existing]
+    LOG.info("Reconciling resources: %s networks to create, %s to delete "
+             "and %s to check", len(missing), len(extra_networks),
+             len(existing))
+
+    scheduler = work_scheduler.WorkScheduler(workers, os_client.metrics)
+    reconciler = NetworkReconciler(config, hostname, os_client, os_vif,
+                                   scheduler, tracker)
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        subnets = dict(zip(existing, executor.map(
+            lambda network: os_client.get_network_subnets(network['id']),
+            existing.values())))
+    for name, network in existing.items():
+        reconciler.check(requested[name], network, subnets[name])
+
+    tasks = [work_scheduler.Task('network', reconciler.reconcile,
+                                 requested[name], network, subnets[name])
+             for name, network in existing.items()]
+    tasks.extend(work_scheduler.Task('networks', reconciler.create_networks,
+                                     batch)
+                 for batch in utils.chunks(missing,
+                                           config.network_batch_size))
+    tasks.extend(work_scheduler.Task('network', reconciler.delete_network,
+                                     network)
+                 for network in extra_networks)
+    scheduler.run(tasks)
+    LOG.info("Reconciled %s networks, created %s and deleted %s networks, "
+             "creating %s and deleting %s ports", len(existing), len(missing),
+             len(extra_networks), reconciler.created_ports,
+             reconciler.deleted_ports)
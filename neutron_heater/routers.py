@@ -0,0 +1,145 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import itertools
+
+from oslo_log import log as logging
+
+from neutron_heater import utils
+from neutron_heater import work_scheduler
+
+
+LOG = logging.getLogger(__name__)
+
+
+class RouterWorkload(object):
+    """Create routers with interfaces, gateways and floating IPs.
+
+    Networks are spread between the routers in the round robin order and
+    all subnets of the network are attached to its router, so the router's
+    gateway can be used by the floating IPs of all ports of the network.
+    Every router, gateway, interface and floating IP is a separate task of
+    the work scheduler. A floating IP is created only after its router has
+    the gateway and all subnets of the port's network are attached to it.
+    """
+
+    def __init__(self, config, hostname, os_client, workers):
+        self.config = config
+        self.hostname = hostname
+        self.os_client = os_client
+        self.scheduler = work_scheduler.WorkScheduler(workers,
+                                                      os_client.metrics)
+        self.external_network_id = None
+
+    def _task(self, name, func, *args, after=()):
+        return self.scheduler.add(work_scheduler.Task(name, func, *args),
+                                  after=after)
+
+    def _create_router(self, index):
+        router = self.os_client.create_router(
+            utils.get_router_name(index, self.hostname))
+        if not router:
+            # Tasks which need the router are skipped
+            raise RuntimeError("Router %s wasn't created" % index)
+        return router
+
+    def _set_gateway(self, router_task):
+        if not self.os_client.set_router_gateway(router_task.result,
+                                                 self.external_network_id):
+            raise RuntimeError("Gateway of router %s wasn't set" %
+                               router_task.result['id'])
+
+    def _add_interface(self, router_task, subnet_id):
+        if not self.os_client.add_router_interface(router_task.result,
+                                                   subnet_id):
+            raise RuntimeError("Subnet %s wasn't added to router %s" % (
+                subnet_id, router_task.result['id']))
+
+    def _create_floating_ips(self, net_number, network, router_tasks):
+        """Add tasks which attach network to its router and create FIPs."""
+        router_task, gateway_task = router_tasks[
+            net_number % len(router_tasks)]
+        interface_tasks = [
+            self._task('interface', self._add_interface, router_task,
+                       subnet_id, after=[router_task])
+            for subnet_id in self.os_client.get_network_subnets(
+                network['id'])]
+        if gateway_task is None or not self.config.floating_ips:
+            return
+        ports = itertools.islice(
+            filter(utils.is_heater_port,
+                   self.os_client.get_ports(network['id']) or []),
+            self.config.floating_ips)
+        for port in ports:
+            self._task('floating_ip', self.os_client.create_floating_ip,
+                       self.external_network_id, port,
+                       after=interface_tasks + [gateway_task])
+
+    def _get_networks(self, net_numbers):
+        """Get list of tuples (net_number, network) of this process."""
+        names = {utils.get_network_name(net_number, self.hostname):
+                 net_number for net_number in net_numbers}
+        return [(names[network['name']], network)
+                for network in self.os_client.get_networks(
+                    tags=self.os_client.tags) or []
+                if network['name'] in names]
+
+    def run(self, net_numbers):
+        """Create routers for the networks net_numbers of this process."""
+        if self.config.external_network:
+            external_network = self.os_client.find_network(
+                self.config.external_network)
+            if external_network:
+                self.external_network_id = external_network['id']
+            else:
+                LOG.warning("Routers are created without gateways and "
+                            "floating IPs as external network %s wasn't "
+                            "found", self.config.external_network)
+        router_tasks = []
+        for index in range(self.config.routers):
+            router_task = work_scheduler.Task('router', self._create_router,
+                                              index)
+            gateway_task = None
+            if self.external_network_id:
+                gateway_task = self._task('gateway', self._set_gateway,
+                                          router_task, after=[router_task])
+            router_tasks.append((router_task, gateway_task))
+        networks = self._get_networks(net_numbers)
+        LOG.info("Creating %s routers for %s networks", len(router_tasks),
+                 len(networks))
+        tasks = [router_task for router_task, _gateway_task in router_tasks]
+        tasks.extend(
+            work_scheduler.Task('network', self._create_floating_ips,
+                                net_number, network, router_tasks)
+            for net_number, network in networks)
+        self.scheduler.run(tasks)
+
+
+def _clean_router(router, os_client):
+    # Gateway is removed by Neutron together with the router, but the
+    # interfaces have to be removed first
+    for port in os_client.get_router_interfaces(router):
+        os_client.remove_router_interface(router, port)
+    os_client.delete_router(router)
+
+
+def clean_routers(routers, floating_ips, os_client, workers):
+    """Delete floating IPs, interfaces and routers in that order.
+
+    It has to be done before the networks are cleaned, as networks and
+    subnets can't be deleted while they are attached to the routers.
+    """
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(os_client.delete_floating_ip, floating_ips))
+        list(executor.map(lambda router: _clean_router(router, os_client),
+                          routers))
@@ -0,0 +1,142 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import time
+
+from oslo_log import log as logging
+
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+# Every rule allows other TCP port, starting from this one, so no two rules
+# of the group are the same
+FIRST_RULE_PORT = 1024
+
+SECURITY_GROUP_STORM = 'security_group_storm'
+
+
+def get_rules(security_group, remote_groups, rules, remote_group_rules):
+    """Get data of the rules of the security group.
+
+    First remote_group_rules rules allow traffic from the remote_groups, one
+    after another, and the rest allow traffic from any IPv4 address.
+    """
+    data = []
+    for index in range(rules):
+        rule = {'security_group_id': security_group['id'],
+                'direction': 'ingress', 'ethertype': 'IPv4',
+                'protocol': 'tcp',
+                'port_range_min': FIRST_RULE_PORT + index,
+                'port_range_max': FIRST_RULE_PORT + index}
+        if index < remote_group_rules and remote_groups:
+            remote_group = remote_groups[index % len(remote_groups)]
+            rule['remote_group_id'] = remote_group['id']
+        else:
+            rule['remote_ip_prefix'] = '0.0.0.0/0'
+        data.append(rule)
+    return data
+
+
+class SecurityGroupStorm(object):
+    """Create security groups with many rules and set them on the ports.
+
+    Rules of every group reference the next groups as their remote groups,
+    so any change of the group's members has to be sent to the agents of
+    the ports of all groups which reference it. All groups, their rules and
+    the ports' updates are done concurrently and every port created by the
+    heater gets its groups in the round robin order. With the tracker,
+    time from the port's update to the moment when it is ACTIVE is
+    measured.
+    """
+
+    def __init__(self, config, hostname, os_client, workers, tracker=None):
+        self.config = config
+        self.hostname = hostname
+        self.os_client = os_client
+        self.workers = workers
+        self.tracker = tracker
+
+    def _create_rules(self, index, security_groups):
+        # Remote groups are the next groups, as many as the group has
+        # remote group rules
+        remote_groups = [
+            security_groups[(index + offset) % len(security_groups)]
+            for offset in range(1, self.config.remote_group_rules + 1)]
+        rules = get_rules(security_groups[index], remote_groups,
+                          self.config.security_group_rules,
+                          self.config.remote_group_rules)
+        return len(self.os_client.create_security_group_rules_bulk(rules))
+
+    def _set_security_groups(self, port, security_group_ids):
+        updated_port = self.os_client.set_port_security_groups(
+            port, security_group_ids)
+        if updated_port and self.tracker:
+            self.tracker.ports_updated([updated_port])
+        return updated_port
+
+    def _get_ports(self, net_numbers):
+        names = {utils.get_network_name(net_number, self.hostname)
+                 for net_number in net_numbers}
+        for network in self.os_client.get_networks(
+                tags=self.os_client.tags) or []:
+            if network['name'] not in names:
+                continue
+            for port in self.os_client.get_ports(network['id']) or []:
+                # DHCP and metadata ports keep their security groups
+                if utils.is_heater_port(port):
+                    yield port
+
+    def run(self, net_numbers):
+        """Set security groups on the ports of the networks net_numbers."""
+        started_at = time.monotonic()
+        names = [utils.get_security_group_name(index, self.hostname)
+                 for index in range(self.config.security_groups)]
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            security_groups = [
+                security_group for security_group in
+                executor.map(self.os_client.create_security_group, names)
+                if security_group]
+            if not security_groups:
+                LOG.warning("No security groups were created")
+                return
+            rules = sum(executor.map(
+                lambda index: self._create_rules(index, security_groups),
+                range(len(security_groups))))
+            group_ids = [security_group['id']
+                         for security_group in security_groups]
+            per_port = min(self.config.security_groups_per_port,
+                           len(group_ids))
+            # Groups of the next ports start from the next groups
+            ring = group_ids * 2
+            updates = []
+            for number, port in enumerate(self._get_ports(net_numbers)):
+                first = number % len(group_ids)
+                updates.append(executor.submit(
+                    self._set_security_groups, port,
+                    ring[first:first + per_port]))
+            ports = sum(1 for update in updates if update.result())
+        elapsed = time.monotonic() - started_at
+        self.os_client.metrics.record(SECURITY_GROUP_STORM, elapsed)
+        LOG.info("Created %s security groups with %s rules and set them on "
+                 "%s ports, %s groups per port, in %.2f seconds",
+                 len(security_groups), rules, ports, per_port, elapsed)
+
+
+def clean_security_groups(security_groups, os_client, workers):
+    """Delete security groups, after all ports which used them."""
+    # Rules of other groups which reference the deleted group are deleted
+    # by Neutron together with it, so groups can be deleted in any order
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(os_client.delete_security_group, security_groups))
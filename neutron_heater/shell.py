@@ -11,182 +11,897 @@
 #    under the License.
 
 from concurrent import futures
+import functools
+import math
+import multiprocessing
 import os
-import re
+import queue
 import socket
 import sys
-import yaml
+import threading
+import time
 
 from oslo_log import log as logging
+from oslo_utils import uuidutils
 
+from neutron_heater import address_planner
+from neutron_heater import async_engine
+from neutron_heater import churn
 from neutron_heater import conf
+from neutron_heater import connection_pool
 from neutron_heater import constants
+from neutron_heater import journal
+from neutron_heater import limiter
+from neutron_heater import load_profile
+from neutron_heater import metrics
 from neutron_heater import openstack_client
 from neutron_heater import os_vif_client
+from neutron_heater import ovsdb_client
+from neutron_heater import pipeline
+from neutron_heater import provisioning
+from neutron_heater import rate
+from neutron_heater import reconcile
+from neutron_heater import routers
+from neutron_heater import security_groups
+from neutron_heater import token_cache
+from neutron_heater import utils
+from neutron_heater import work_scheduler
 
 
 LOG = logging.getLogger(__name__)
 
+NODE_NAMES_FILE = 'node_names.json'
 
-def get_network_name(index, hostname):
-    return "network-%s-host-%s" % (index, hostname)
+
+def _create_and_plug_ports(network, subnets, port_names, hostname, os_client,
+                           os_vif, port_batch_size=1, tracker=None):
+    for batch in utils.chunks(port_names, port_batch_size):
+        created_ports = os_client.create_ports_bulk(
+            network['id'], batch, hostname)
+        if tracker:
+            tracker.ports_created(created_ports)
+        os_vif.plug_ports(created_ports, subnets)
+        if tracker:
+            tracker.ports_plugged(created_ports)
+
+
+def create_network_ports(network, subnets, ports, hostname, os_client,
+                         os_vif, port_batch_size=1, tracker=None):
+    port_names = (utils.get_port_name(port, hostname, network['id'])
+                  for port in range(ports))
+    _create_and_plug_ports(network, subnets, port_names, hostname, os_client,
+                           os_vif, port_batch_size, tracker)
+    os_vif.release_network(network['id'])
 
 
 def create_network_with_ports(net_number, ipv4_subnets, ipv6_subnets, ports,
-                              hostname, os_client, os_vif):
-    network_name = get_network_name(net_number, hostname)
+                              hostname, os_client, os_vif, port_batch_size=1,
+                              tracker=None):
+    network_name = utils.get_network_name(net_number, hostname)
     LOG.info("Starting to create network %s" % network_name)
     network = os_client.create_network(network_name)
     if not network:
         LOG.error("Failed to create network. Stopping worker.")
         return False
     subnets = {}
-    for v4_subnet in range(ipv4_subnets):
-        subnet_name = "v4_subnet-%s-host-%s" % (v4_subnet, hostname)
-        cidr = constants.V4_CIDR_BASE % v4_subnet
+    subnets_to_create = address_planner.AddressPlanner(
+        ports, ipv4_subnets, ipv6_subnets).get_subnets(net_number, hostname)
+    for subnet_name, cidr in subnets_to_create:
         subnet = os_client.create_subnet(network['id'], subnet_name, cidr)
         if subnet:
             subnets[subnet['id']] = subnet
 
-    for v6_subnet in range(ipv6_subnets):
-        subnet_name = "v6_subnet-%s-host-%s" % (v6_subnet, hostname)
-        cidr = constants.V6_CIDR_BASE % v4_subnet
+    if subnets:
+        # Only if some subnets were created creating ports makes any sense
+        create_network_ports(network, subnets, ports, hostname, os_client,
+                             os_vif, port_batch_size, tracker)
+    return True
+
+
+def resume_network_with_ports(net_number, ipv4_subnets, ipv6_subnets, ports,
+                              hostname, os_client, os_vif, journaled,
+                              port_batch_size=1, tracker=None):
+    """Create only what is missing from the network recorded in journal.
+
+    Subnets and ports which are not in the journal are created and ports
+    which were created but not plugged on the node are plugged.
+    """
+    network_name = utils.get_network_name(net_number, hostname)
+    network = journaled.networks.get(network_name)
+    if not network:
+        return create_network_with_ports(
+            net_number, ipv4_subnets, ipv6_subnets, ports, hostname,
+            os_client, os_vif, port_batch_size, tracker)
+    LOG.info("Resuming network %s", network_name)
+    subnets = dict(journaled.subnets[network['id']])
+    subnet_names = {subnet['name'] for subnet in subnets.values()}
+    subnets_to_create = address_planner.AddressPlanner(
+        ports, ipv4_subnets, ipv6_subnets).get_subnets(net_number, hostname)
+    for subnet_name, cidr in subnets_to_create:
+        if subnet_name in subnet_names:
+            continue
         subnet = os_client.create_subnet(network['id'], subnet_name, cidr)
         if subnet:
             subnets[subnet['id']] = subnet
-
-    if subnets:
-        # Only if some subnets were created creating ports makes any sense
-        for port in range(ports):
-            port_name = "port-%s-host-%s-network-%s" % (
-                port, hostname, network['id'])
-            port = os_client.create_port(network['id'], port_name, hostname)
-            if port:
-                os_vif.plug_port(port, subnets)
+    if not subnets:
+        return True
+
+    network_ports = journaled.ports[network['id']]
+    ports_to_plug = [port for port in network_ports.values()
+                     if port['id'] not in journaled.plugged_ports]
+    for batch in utils.chunks(ports_to_plug, port_batch_size):
+        os_vif.plug_ports(batch, subnets)
+    port_names = (utils.get_port_name(port, hostname, network['id'])
+                  for port in range(ports))
+    _create_and_plug_ports(
+        network, subnets,
+        (name for name in port_names if name not in network_ports),
+        hostname, os_client, os_vif, port_batch_size, tracker)
+    os_vif.release_network(network['id'])
     return True
 
 
-def _get_osclient(config):
-    kwargs = {'cloud': config.cloud_name}
+def _get_osclient(config, scheduler=None, metrics=None, tags=None,
+                  resource_journal=None):
+    kwargs = {'cloud': config.cloud_name, 'scheduler': scheduler,
+              'metrics': metrics, 'tags': tags,
+              'page_size': config.list_page_size,
+              'journal': resource_journal,
+              'pool_size': get_connection_pool_size(config),
+              'connection_per_worker': config.connection_per_worker,
+              'token_cache': get_token_cache(config)}
     if config.region_name is not None:
         kwargs['region_name'] = config.region_name
     if config.insecure is True:
         kwargs['verify'] = False
-    return openstack_client.OSClient(**kwargs)
+    client = openstack_client.OSClient(**kwargs)
+    # Limit over time is stored in the same metrics as the requests
+    client.limiter = get_concurrency_limiter(config, client.metrics)
+    return client
 
 
-def get_node_name(config):
-    client = _get_osclient(config)
-    agents = client.get_agents(config.l2_agent_name,
-                               only_alive=False)
-    hostname = socket.gethostname()
-    LOG.info('Looking for a name of the node with hostname: %s', hostname)
-    for agent in agents:
+def get_token_cache(config):
+    if config.cache_dir:
+        return token_cache.TokenCache(config.cache_dir)
+
+
+def get_vif_client(config, resource_journal=None):
+    if config.plug_backend == constants.OVSDB_BACKEND:
+        vif_client = ovsdb_client.OvsdbClient(config.ovsdb_connection,
+                                              config.integration_bridge,
+                                              config.ovsdb_timeout)
+    else:
+        vif_client = os_vif_client.OSVifClient()
+    if resource_journal:
+        return journal.JournalingVifClient(vif_client, resource_journal)
+    return vif_client
+
+
+def get_journal(config):
+    if config.journal_file:
+        return journal.Journal(config.journal_file)
+    if config.resume or config.from_journal:
+        LOG.error('Options "resume" and "from-journal" require the '
+                  '"journal-file" option to be set.')
+        sys.exit(constants.INVALID_CONFIG_OPTION)
+
+
+def get_run_id(config, resource_journal):
+    run_id = config.run_id
+    if config.resume and not run_id:
+        run_id = resource_journal.get_last_run_id()
+    return run_id or uuidutils.generate_uuid()
+
+
+def _get_node_names_file(config):
+    return os.path.join(config.cache_dir, NODE_NAMES_FILE)
+
+
+def _get_node_name_key(config, hostname):
+    return "%s:%s:%s" % (config.cloud_name, config.region_name or '',
+                         hostname)
+
+
+def _find_node_name(client, l2_agent_name, hostname):
+    # Usually agent's host is the same as the hostname, so one request for
+    # that host's agent is enough to find it
+    for agent in client.get_agents(l2_agent_name, only_alive=False,
+                                   host=hostname):
+        return agent['host']
+    for agent in client.get_agents(l2_agent_name, only_alive=False):
         if hostname in agent['host']:
             return agent['host']
-    LOG.warning("Hostname '%s' not found in any of agents. It will be used "
-                "as is but may cause other problems.", hostname)
-    return hostname
 
 
-def get_number_of_workers(config):
-    return min(config.concurrency or config.networks,
-               int(os.cpu_count() / 2))
+def get_node_name(config, run_metrics=None):
+    hostname = socket.gethostname()
+    if config.cache_dir:
+        node_name = utils.read_json_file(_get_node_names_file(config)).get(
+            _get_node_name_key(config, hostname))
+        if node_name:
+            LOG.info('Using cached name of the node: %s', node_name)
+            return node_name
+    client = _get_osclient(config, metrics=run_metrics)
+    LOG.info('Looking for a name of the node with hostname: %s', hostname)
+    node_name = _find_node_name(client, config.l2_agent_name, hostname)
+    if not node_name:
+        LOG.warning("Hostname '%s' not found in any of agents. It will be "
+                    "used as is but may cause other problems.", hostname)
+        return hostname
+    if config.cache_dir:
+        node_names = utils.read_json_file(_get_node_names_file(config))
+        node_names[_get_node_name_key(config, hostname)] = node_name
+        utils.write_json_file(_get_node_names_file(config), node_names)
+    return node_name
 
 
-def create_resources(config):
-    hostname = get_node_name(config)
-    client = _get_osclient(config)
-    os_vif = os_vif_client.OSVifClient()
+def is_auto_concurrency(config):
+    return config.concurrency == constants.AUTO_CONCURRENCY
 
+
+def get_load_phases(config):
+    if config.load_profile:
+        return load_profile.get_phases(config.load_profile)
+
+
+def get_profile_concurrency(config):
+    """Get the highest concurrency set by the load profile, if any."""
+    if config.load_profile_target == constants.CONCURRENCY_TARGET:
+        phases = get_load_phases(config)
+        if phases:
+            return math.ceil(load_profile.get_max_value(phases))
+
+
+def get_number_of_workers(config):
+    # Single port batches are units of the work, so even a few networks
+    # can keep many workers busy
+    work_items = config.networks * max(
+        math.ceil(config.ports / config.port_batch_size), 1)
+    if get_profile_concurrency(config):
+        # There are just enough threads for the highest concurrency of the
+        # profile, which is set by the limiter over time
+        return min(work_items, get_profile_concurrency(config))
+    if is_auto_concurrency(config):
+        # Requests in flight are limited by the limiter, there are just
+        # enough threads for its highest limit
+        return min(work_items, limiter.MAX_LIMIT)
+    return min(config.concurrency or work_items, int(os.cpu_count() / 2))
+
+
+def get_number_of_plug_workers(config):
+    return config.plug_workers or get_number_of_workers(config)
+
+
+def get_connection_pool_size(config):
+    return config.connection_pool_size or max(
+        get_number_of_workers(config), connection_pool.DEFAULT_POOL_SIZE)
+
+
+def get_async_concurrency(config):
+    if get_profile_concurrency(config):
+        return get_profile_concurrency(config)
+    if is_auto_concurrency(config):
+        return limiter.MAX_LIMIT
+    return config.concurrency or async_engine.DEFAULT_CONCURRENCY
+
+
+def get_concurrency_limiter(config, run_metrics):
+    if get_profile_concurrency(config):
+        return limiter.ConcurrencyLimiter(
+            get_load_phases(config)[0].start_value)
+    if not is_auto_concurrency(config):
+        return
+    if config.engine == constants.ASYNCIO_ENGINE:
+        max_limit = get_async_concurrency(config)
+    else:
+        max_limit = get_number_of_workers(config)
+    return limiter.AIMDLimiter(max_limit, run_metrics,
+                               config.report_interval)
+
+
+def get_scheduler(config, workers=1):
+    target_rate = config.rate
+    phases = get_load_phases(config)
+    if phases and config.load_profile_target == constants.RATE_TARGET:
+        target_rate = phases[0].start_value
+    if target_rate:
+        # Every worker process sends its part of the requests
+        return rate.OpenLoopScheduler(target_rate / workers, config.arrival)
+
+
+def start_load_profile(config, client):
+    phases = get_load_phases(config)
+    if not phases:
+        return
+    if config.load_profile_target == constants.RATE_TARGET:
+        # Scheduler of the worker process keeps its share of every rate
+        share = client.scheduler.rate / phases[0].start_value
+
+        def apply(value):
+            client.scheduler.rate = value * share
+    else:
+        def apply(value):
+            client.limiter.set_limit(max(round(value), 1))
+    runner = load_profile.LoadProfileRunner(
+        phases, config.load_profile_target, apply, client.metrics)
+    runner.start()
+    return runner
+
+
+def get_provisioning_tracker(config, os_client):
+    if config.track_provisioning:
+        tracker = provisioning.ProvisioningTracker(
+            os_client, os_client.metrics,
+            config.provisioning_poll_interval, config.provisioning_timeout)
+        tracker.start()
+        return tracker
+
+
+def create_resources(config, scheduler=None, run_metrics=None,
+                     net_numbers=None):
+    if net_numbers is None:
+        net_numbers = range(config.networks)
+    hostname = get_node_name(config, run_metrics)
+    resource_journal = get_journal(config)
+    run_id = get_run_id(config, resource_journal)
+    LOG.info("Resources created in this run are tagged with run ID %s",
+             run_id)
+    if resource_journal:
+        resource_journal.run_id = run_id
+    client = _get_osclient(config, scheduler, run_metrics,
+                           tags=utils.get_resource_tags(hostname, run_id),
+                           resource_journal=resource_journal)
+    os_vif = get_vif_client(config, resource_journal)
+    tracker = get_provisioning_tracker(config, client)
+    # With "churn" action the profile drives the steady state, not the
+    # creation of the initial resources
+    profile = None
+    if config.action == constants.CREATE:
+        profile = start_load_profile(config, client)
+
+    if config.resume:
+        LOG.info("Resuming run %s recorded in the journal %s",
+                 run_id, config.journal_file)
+        _resume_resources_in_threads(config, hostname, client, os_vif,
+                                     tracker, resource_journal.load(run_id),
+                                     net_numbers)
+    elif config.engine == constants.ASYNCIO_ENGINE:
+        async_engine.create_resources(
+            config, hostname, client, os_vif,
+            get_async_concurrency(config), get_number_of_plug_workers(config),
+            tracker, net_numbers)
+    elif config.engine == constants.PIPELINE_ENGINE:
+        pipeline.create_resources(
+            config, hostname, client, os_vif, get_number_of_workers(config),
+            get_number_of_plug_workers(config), tracker, net_numbers)
+    else:
+        work_scheduler.create_resources(
+            config, hostname, client, os_vif, get_number_of_workers(config),
+            tracker, net_numbers)
+
+    if profile:
+        profile.stop()
+    if config.security_groups:
+        security_groups.SecurityGroupStorm(
+            config, hostname, client, get_number_of_workers(config),
+            tracker).run(net_numbers)
+    if config.routers:
+        routers.RouterWorkload(
+            config, hostname, client,
+            get_number_of_workers(config)).run(net_numbers)
+    if tracker:
+        LOG.info("Waiting for all ports to become ACTIVE")
+        tracker.wait()
+        tracker.report_summary()
+    if resource_journal:
+        resource_journal.close()
+
+
+def _resume_resources_in_threads(config, hostname, client, os_vif, tracker,
+                                 journaled, net_numbers):
     workers = get_number_of_workers(config)
     with futures.ThreadPoolExecutor(max_workers=workers) as executor:
         [executor.submit(
-            create_network_with_ports,
+            resume_network_with_ports,
             net, config.ipv4_subnets, config.ipv6_subnets, config.ports,
-            hostname, client, os_vif) for net in range(config.networks)]
+            hostname, client, os_vif, journaled, config.port_batch_size,
+            tracker)
+            for net in net_numbers]
 
 
-def clean_network_with_ports(network, os_client, os_vif):
-    ports = os_client.get_ports(network['id'])
+def clean_ports(ports, subnets, os_client, os_vif):
+    os_vif.unplug_ports(ports, subnets)
     for port in ports:
-        subnets = os_client.get_port_subnets(port)
-        os_vif.unplug_port(port, subnets)
         os_client.delete_port(port)
-    os_client.delete_network(network)
 
 
-def clean_all(config):
-    hostname = get_node_name(config)
-    client = _get_osclient(config)
-    os_vif = os_vif_client.OSVifClient()
-    all_networks = client.get_networks()
-    networks_to_clean = []
-    expected_network_name_pattern = re.compile(
-        r"network-\d+-host-%s" % hostname)
-    for network in all_networks:
-        if expected_network_name_pattern.match(network['name']):
-            networks_to_clean.append(network)
+def get_networks_to_clean(os_client, hostname, run_id=None):
+    # Only networks tagged by the runs on this host are fetched from the
+    # server, not all networks in the cloud, page by page while they are
+    # cleaned
+    return os_client.get_networks(
+        tags=utils.get_resource_tags(hostname, run_id)) or []
+
+
+def get_journaled_resources_to_clean(config, resource_journal):
+    networks = resource_journal.get_resources(journal.NETWORK, config.run_id)
+    ports = resource_journal.get_resources(journal.PORT, config.run_id)
+    subnets = {subnet['id']: subnet for subnet in
+               resource_journal.get_resources(journal.SUBNET, config.run_id)}
+    LOG.info("Found %s networks and %s ports to clean in the journal %s",
+             len(networks), len(ports), config.journal_file)
+    return networks, ports, subnets
+
+
+def clean_from_journal(config, client, os_vif, networks, ports, subnets):
+    """Clean resources recorded in the journal without listing them."""
+    if config.engine == constants.ASYNCIO_ENGINE:
+        async_engine.clean_resources(
+            networks, ports, subnets, client, os_vif,
+            get_async_concurrency(config), get_number_of_plug_workers(config),
+            config.port_batch_size)
+        return
     workers = get_number_of_workers(config)
     with futures.ThreadPoolExecutor(max_workers=workers) as executor:
-        [executor.submit(
-            clean_network_with_ports, network, client, os_vif) for
-            network in networks_to_clean]
+        # Ports have to be deleted before their networks
+        list(executor.map(
+            lambda batch: clean_ports(batch, subnets, client, os_vif),
+            utils.chunks(ports, config.port_batch_size)))
+        list(executor.map(client.delete_network, networks))
+    for network in networks:
+        os_vif.release_network(network['id'])
+
+
+def clean_networks(config, client, os_vif, networks, started_at=None):
+    if config.engine == constants.ASYNCIO_ENGINE:
+        async_engine.clean_all(
+            networks, client, os_vif,
+            get_async_concurrency(config), get_number_of_plug_workers(config),
+            config.port_batch_size)
+        return
+    pipeline.clean_resources(
+        networks, client, os_vif, get_number_of_workers(config),
+        config.pipeline_queue_size, config.port_batch_size,
+        config.report_interval, started_at)
+
+
+def _clean_resources(config, client, os_vif, networks, ports=None,
+                     subnets=None, started_at=None):
+    # Ports and subnets are known only if resources are taken from the
+    # journal, otherwise they are listed for every network
+    if ports is None:
+        clean_networks(config, client, os_vif, networks, started_at)
+    else:
+        clean_from_journal(config, client, os_vif, networks, ports, subnets)
+    client.metrics.increment(pipeline.PEAK_RSS, utils.get_peak_rss())
 
 
-def write_inventory_file(hosts, filename):
-    if filename.endswith(".yaml") or filename.endswith("yml"):
-        write_yaml_file(hosts, filename)
+def _get_clean_shards(networks, ports, subnets, processes):
+    network_shards = utils.split(networks, processes)
+    # Ports are cleaned by the same process as their network
+    shard_ports = [[] for _ in network_shards]
+    network_shard = {network['id']: index
+                     for index, shard in enumerate(network_shards)
+                     for network in shard}
+    for port in ports:
+        shard_ports[network_shard.get(port['network_id'], 0)].append(port)
+    return [(shard, shard_ports[index], subnets)
+            for index, shard in enumerate(network_shards)]
+
+
+def _feed_networks(networks, network_queue, processes, stop):
+    """Hand networks over to the cleaning processes while they are listed.
+
+    All processes take networks from the same bounded queue, so listing
+    waits for them and only a few pages of networks are kept in memory.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                network_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    try:
+        for network in networks:
+            if stop.is_set():
+                return
+            # Only fields needed for the cleanup are sent to the processes
+            put({'id': network['id'], 'name': network['name']})
+    finally:
+        for _ in range(processes):
+            put(None)
+
+
+def _clean_shard(config, scheduler, run_metrics, shard, started_at=None):
+    networks, ports, subnets = shard
+    if ports is None:
+        networks = iter(networks.get, None)
+    resource_journal = get_journal(config)
+    client = _get_osclient(config, scheduler, run_metrics,
+                           resource_journal=resource_journal)
+    _clean_resources(config, client, get_vif_client(config), networks, ports,
+                     subnets, started_at)
+    if resource_journal:
+        resource_journal.close()
+
+
+def get_security_groups_to_clean(config, client, resource_journal,
+                                 hostname):
+    if config.from_journal:
+        return resource_journal.get_resources(journal.SECURITY_GROUP,
+                                              config.run_id)
+    return client.get_security_groups(tags=utils.get_resource_tags(
+        hostname, config.run_id)) or []
+
+
+def clean_l3_resources(config, client, resource_journal, hostname):
+    if config.from_journal:
+        floating_ips = resource_journal.get_resources(journal.FLOATING_IP,
+                                                      config.run_id)
+        routers_to_clean = resource_journal.get_resources(journal.ROUTER,
+                                                          config.run_id)
+    else:
+        tags = utils.get_resource_tags(hostname, config.run_id)
+        floating_ips = list(client.get_floating_ips(tags=tags) or [])
+        routers_to_clean = list(client.get_routers(tags=tags) or [])
+    routers.clean_routers(routers_to_clean, floating_ips, client,
+                          get_number_of_workers(config))
+
+
+def clean_in_processes(config, networks, ports, subnets, started_at,
+                       run_metrics):
+    clean_shard = functools.partial(_clean_shard, started_at=started_at)
+    if ports is not None:
+        # Resources from the journal are already known, so they are split
+        # between the processes at once
+        run_in_processes(
+            config, clean_shard,
+            _get_clean_shards(networks, ports, subnets, config.processes),
+            run_metrics)
+        return
+    # Networks are listed page by page while the processes clean them and
+    # list their ports
+    context = multiprocessing.get_context('fork')
+    network_queue = context.Queue(config.pipeline_queue_size)
+    stop = threading.Event()
+    feeder = threading.Thread(
+        target=_feed_networks,
+        args=(networks, network_queue, config.processes, stop))
+    feeder.start()
+    try:
+        run_in_processes(config, clean_shard,
+                         [(network_queue, None, None)] * config.processes,
+                         run_metrics)
+    finally:
+        # Workers which exited early don't take the rest of the networks
+        stop.set()
+        feeder.join()
+
+
+def clean_all(config, scheduler=None, run_metrics=None):
+    started_at = time.monotonic()
+    resource_journal = get_journal(config)
+    client = _get_osclient(config, scheduler, run_metrics,
+                           resource_journal=resource_journal)
+    # Resources recorded in the journal are cleaned without looking for
+    # the node's tags
+    hostname = None
+    if not config.from_journal:
+        hostname = get_node_name(config, run_metrics)
+    # Networks and subnets can't be deleted while they are attached to the
+    # routers
+    clean_l3_resources(config, client, resource_journal, hostname)
+    ports = subnets = None
+    if config.from_journal:
+        networks, ports, subnets = get_journaled_resources_to_clean(
+            config, resource_journal)
     else:
-        write_ini_file(hosts, filename)
+        networks = get_networks_to_clean(client, hostname, config.run_id)
+    if config.processes > 1:
+        if resource_journal:
+            resource_journal.close()
+        clean_in_processes(config, networks, ports, subnets, started_at,
+                           run_metrics)
+        resource_journal = get_journal(config)
+        client.journal = resource_journal
+    else:
+        _clean_resources(config, client, get_vif_client(config), networks,
+                         ports, subnets, started_at)
+    # Security groups can be deleted only when all ports which used them
+    # are deleted
+    security_groups.clean_security_groups(
+        get_security_groups_to_clean(config, client, resource_journal,
+                                     hostname),
+        client, get_number_of_workers(config))
+    if resource_journal:
+        resource_journal.close()
+
+
+def churn_resources(config, scheduler=None, run_metrics=None):
+    # Run ID is chosen up front so that the ports created to reach the
+    # target number can be found and replaced later
+    if not config.run_id:
+        config.set_override('run_id', uuidutils.generate_uuid())
+    create_resources(config, scheduler, run_metrics)
+    if scheduler:
+        # Requests of the steady state are planned from its start, not
+        # from the last request which created the initial resources
+        scheduler.pause()
+    hostname = get_node_name(config, run_metrics)
+    resource_journal = get_journal(config)
+    if resource_journal:
+        resource_journal.run_id = config.run_id
+    # Steady state is measured separately from creating initial resources
+    churn_metrics = metrics.Metrics()
+    tags = utils.get_resource_tags(hostname, config.run_id)
+    client = _get_osclient(config, scheduler, churn_metrics, tags=tags,
+                           resource_journal=resource_journal)
+    runner = churn.ChurnRunner(
+        client, get_vif_client(config, resource_journal), hostname,
+        get_number_of_workers(config), config.churn_rate,
+        first_port_number=config.ports,
+        report_interval=config.report_interval)
+    profile = start_load_profile(config, client)
+    runner.run(client.get_networks(tags=tags) or [], config.duration)
+    if profile:
+        profile.stop()
+    LOG.info("Operations done in the churn steady state:")
+    churn_metrics.report_summary()
+    if run_metrics:
+        run_metrics.merge(churn_metrics)
+    if resource_journal:
+        resource_journal.close()
+
+
+def reconcile_resources(config, scheduler=None, run_metrics=None):
+    hostname = get_node_name(config, run_metrics)
+    resource_journal = get_journal(config)
+    run_id = get_run_id(config, resource_journal)
+    LOG.info("Resources created in this run are tagged with run ID %s",
+             run_id)
+    if resource_journal:
+        resource_journal.run_id = run_id
+    client = _get_osclient(config, scheduler, run_metrics,
+                           tags=utils.get_resource_tags(hostname, run_id),
+                           resource_journal=resource_journal)
+    # Resources of the given run, or of all runs on this host, are owned by
+    # the tool and compared with the requested ones
+    networks = list(get_networks_to_clean(client, hostname, config.run_id))
+    tracker = get_provisioning_tracker(config, client)
+    try:
+        reconcile.reconcile_resources(
+            config, hostname, client,
+            get_vif_client(config, resource_journal),
+            get_number_of_workers(config), networks, tracker)
+    except reconcile.SubnetsConflict as e:
+        LOG.error("Existing subnets can't be used for %s ports, clean the "
+                  "resources and create them again. Error: %s",
+                  config.ports, e)
+        sys.exit(constants.INVALID_CONFIG_OPTION)
+    if tracker:
+        LOG.info("Waiting for all ports to become ACTIVE")
+        tracker.wait()
+        tracker.report_summary()
+    if resource_journal:
+        resource_journal.close()
+
+
+def _run_worker(func, config, shard, results, workers):
+    scheduler = get_scheduler(config, workers)
+    worker_metrics = metrics.Metrics()
+    try:
+        func(config, scheduler, worker_metrics, shard)
+        if scheduler:
+            scheduler.report_summary()
+    except Exception:
+        LOG.exception("Worker process failed")
+    finally:
+        results.put(worker_metrics.to_dict())
+
+
+def run_in_processes(config, func, shards, run_metrics):
+    """Run func for every shard of the work in a separate worker process.
+
+    func is called as func(config, scheduler, metrics, shard) and metrics
+    from all the worker processes are merged into run_metrics.
+    """
+    # Worker processes are forked so they inherit already parsed config
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=_run_worker,
+                               args=(func, config, shard, results,
+                                     len(shards)),
+                               name='heater-worker-%s' % index)
+               for index, shard in enumerate(shards)]
+    for worker in workers:
+        worker.start()
+    pending = len(workers)
+    while pending:
+        try:
+            run_metrics.merge(
+                metrics.Metrics.from_dict(results.get(timeout=1)))
+            pending -= 1
+        except queue.Empty:
+            workers_alive = any(worker.is_alive() for worker in workers)
+            if not workers_alive and results.empty():
+                LOG.error("%s worker processes exited without reporting "
+                          "their metrics", pending)
+                break
+    for worker in workers:
+        worker.join()
+
+
+def create_resources_in_processes(config, run_metrics):
+    if not config.run_id:
+        # All processes have to tag resources with the same run ID
+        resource_journal = get_journal(config)
+        config.set_override('run_id', get_run_id(config, resource_journal))
+        if resource_journal:
+            resource_journal.close()
+    shards = utils.split(range(config.networks), config.processes)
+    LOG.info("Creating resources in %s worker processes", len(shards))
+    run_in_processes(config, create_resources, shards, run_metrics)
+
+
+def write_inventory_file(hosts, f, filename):
+    """Write hosts in the format of the inventory filename to file f.
+
+    Returns number of the written hosts.
+    """
+    if filename.endswith(".yaml") or filename.endswith("yml"):
+        return write_yaml_file(hosts, f)
+    return write_ini_file(hosts, f)
 
 
-def write_yaml_file(hosts, filename):
-    content = {"all": {"hosts": {}}}
+def write_yaml_file(hosts, f):
+    # Hosts are written one by one as they come instead of dumping whole
+    # {"all": {"hosts": {host: None}}} at once, with empty values as nulls
+    count = 0
+    f.write("all:\n  hosts:\n")
     for host in hosts:
-        content["all"]["hosts"][host] = None
+        f.write("    %s:\n" % host)
+        count += 1
+    return count
+
 
-    yaml.SafeDumper.add_representer(
-        type(None),
-        lambda dumper, value: dumper.represent_scalar(
-            'tag:yaml.org,2002:null', '')
-    )
-    with open(filename, 'w',) as f:
-        yaml.safe_dump(content, f, default_flow_style=False)
+def write_ini_file(hosts, f):
+    count = 0
+    for host in hosts:
+        f.write("%s\n" % host)
+        count += 1
+    return count
 
 
-def write_ini_file(hosts, filename):
-    with open(filename, "w") as f:
-        f.writelines("%s\n" % host for host in hosts)
+def _get_unique_hosts(agents):
+    seen_hosts = set()
+    for agent in agents:
+        if agent['host'] not in seen_hosts:
+            seen_hosts.add(agent['host'])
+            yield agent['host']
 
 
 def discover_hosts(config):
     client = _get_osclient(config)
-    agents = client.get_agents(config.l2_agent_name)
-    if not agents:
-        sys.exit(constants.NO_AGENTS_FOUND)
-    hosts = []
-    for agent in agents:
-        hosts.append(agent.host)
-    write_inventory_file(hosts, config.inventory_file_name)
+    filename = config.inventory_file_name
+    # Hosts are written while agents are fetched page by page from the
+    # server, to the temporary file which replaces the inventory file only
+    # when all agents were listed, so the previous inventory isn't lost
+    tmp_filename = '%s.tmp' % filename
+    hosts = _get_unique_hosts(client.get_agents(config.l2_agent_name))
+    try:
+        with open(tmp_filename, 'w') as f:
+            hosts_count = write_inventory_file(hosts, f, filename)
+        if client.metrics.operations['get_agents'].errors:
+            LOG.error("Agents couldn't be listed, inventory file %s is not "
+                      "changed", filename)
+            sys.exit(constants.NO_AGENTS_FOUND)
+        if not hosts_count:
+            LOG.error("No hosts with %s found, inventory file %s is not "
+                      "changed", config.l2_agent_name, filename)
+            sys.exit(constants.NO_AGENTS_FOUND)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def check_address_plan(config):
+    planner = address_planner.AddressPlanner(
+        config.ports, config.ipv4_subnets, config.ipv6_subnets)
+    try:
+        planner.check(config.networks)
+    except address_planner.AddressPoolExhausted as e:
+        LOG.error("Subnets of %s networks with %s ports each don't fit in "
+                  "the address pools. Error: %s", config.networks,
+                  config.ports, e)
+        sys.exit(constants.INVALID_CONFIG_OPTION)
 
 
-def set_unlimited_quotas(config):
-    client = _get_osclient(config)
-    client.set_project_quota(networks=-1, subnets=-1, ports=-1)
+def check_load_profile(config):
+    if not config.load_profile:
+        return
+    if config.action not in (constants.CREATE, constants.CHURN):
+        LOG.error("Load profile can only be used with the %s and %s actions",
+                  constants.CREATE, constants.CHURN)
+        sys.exit(constants.INVALID_CONFIG_OPTION)
+    try:
+        get_load_phases(config)
+    except ValueError as e:
+        LOG.error("Invalid load profile %s. Error: %s", config.load_profile,
+                  e)
+        sys.exit(constants.INVALID_CONFIG_OPTION)
+    if get_profile_concurrency(config) and is_auto_concurrency(config):
+        LOG.error("Concurrency can't be set by the load profile and "
+                  "adjusted automatically at the same time")
+        sys.exit(constants.INVALID_CONFIG_OPTION)
+
+
+def set_unlimited_quotas(config, run_metrics=None):
+    client = _get_osclient(config, metrics=run_metrics)
+    client.set_project_quota(networks=-1, subnets=-1, ports=-1,
+                             security_groups=-1, security_group_rules=-1,
+                             routers=-1, floating_ips=-1)
+
+
+def report_results(config, scheduler, run_metrics):
+    if scheduler:
+        scheduler.report_summary()
+    run_metrics.report_summary()
+    connection_pool.report_summary(run_metrics)
+    token_cache.report_summary(run_metrics)
+    pipeline.report_clean_summary(run_metrics)
+    limiter.report_summary(run_metrics)
+    load_profile.report_summary(run_metrics)
+    if config.metrics_file:
+        run_metrics.write_json(config.metrics_file)
+        LOG.info("Metrics written to the file %s", config.metrics_file)
 
 
 def main(argv=sys.argv[1:]):
     config = conf.get_config(argv)
+    check_load_profile(config)
     if config.action == constants.CREATE:
         LOG.info("Starting resource creation")
-        set_unlimited_quotas(config)
-        create_resources(config)
+        check_address_plan(config)
+        run_metrics = metrics.Metrics()
+        set_unlimited_quotas(config, run_metrics)
+        if config.processes > 1:
+            scheduler = None
+            create_resources_in_processes(config, run_metrics)
+        else:
+            scheduler = get_scheduler(config)
+            create_resources(config, scheduler, run_metrics)
         LOG.info("Resources created")
+        report_results(config, scheduler, run_metrics)
     elif config.action == constants.CLEAN:
         LOG.info("Starting resource cleanup")
-        clean_all(config)
+        # With many processes, every one of them has its own scheduler
+        scheduler = get_scheduler(config) if config.processes == 1 else None
+        run_metrics = metrics.Metrics()
+        clean_all(config, scheduler, run_metrics)
         LOG.info("Resources cleaned")
+        report_results(config, scheduler, run_metrics)
+    elif config.action == constants.CHURN:
+        LOG.info("Starting churn of resources for %s seconds",
+                 config.duration)
+        check_address_plan(config)
+        run_metrics = metrics.Metrics()
+        set_unlimited_quotas(config, run_metrics)
+        scheduler = get_scheduler(config)
+        churn_resources(config, scheduler, run_metrics)
+        LOG.info("Churn finished")
+        report_results(config, scheduler, run_metrics)
+    elif config.action == constants.RECONCILE:
+        LOG.info("Starting reconciliation of resources")
+        check_address_plan(config)
+        run_metrics = metrics.Metrics()
+        set_unlimited_quotas(config, run_metrics)
+        scheduler = get_scheduler(config)
+        reconcile_resources(config, scheduler, run_metrics)
+        LOG.info("Resources reconciled")
+        report_results(config, scheduler, run_metrics)
     elif config.action == constants.DISCOVER_HOSTS:
         LOG.info("Starting discovering hosts for inventory file")
         discover_hosts(config)
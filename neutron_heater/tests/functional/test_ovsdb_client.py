@@ -0,0 +1,65 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from oslo_utils import uuidutils
+
+from neutron_heater import ovsdb_client
+from neutron_heater.tests import base
+
+# Connection to the ovsdb-server used by the tests, e.g.
+# "tcp:127.0.0.1:6640" or "unix:/var/run/openvswitch/db.sock"
+OVSDB_CONNECTION_ENV = 'NEUTRON_HEATER_OVSDB_CONNECTION'
+
+
+class TestOvsdbClient(base.TestCase):
+
+    def setUp(self):
+        super(TestOvsdbClient, self).setUp()
+        ovsdb_connection = os.environ.get(OVSDB_CONNECTION_ENV)
+        if not ovsdb_connection:
+            self.skipTest("%s is not set" % OVSDB_CONNECTION_ENV)
+        self.bridge = 'heater-%s' % uuidutils.generate_uuid()[:8]
+        self.client = ovsdb_client.OvsdbClient(ovsdb_connection,
+                                               self.bridge, timeout=10)
+        self.ovs = self.client.ovs
+        self.ovs.add_br(self.bridge, datapath_type='netdev').execute(
+            check_error=True)
+        self.addCleanup(self.ovs.del_br(self.bridge).execute,
+                        check_error=True)
+
+    def _get_ports(self, count):
+        return [{'id': uuidutils.generate_uuid(),
+                 'name': 'port-%s' % i,
+                 'mac_address': 'fa:16:3e:00:00:%02x' % i}
+                for i in range(count)]
+
+    def test_plug_unplug_ports(self):
+        ports = self._get_ports(3)
+        tap_names = sorted(self.client._get_tap_name(port) for port in ports)
+
+        self.client.plug_ports(ports, {})
+        self.assertEqual(
+            tap_names,
+            sorted(self.ovs.list_ports(self.bridge).execute(
+                check_error=True)))
+        for port in ports:
+            self.assertEqual(
+                port['id'],
+                self.ovs.db_get(
+                    'Interface', self.client._get_tap_name(port),
+                    'external_ids').execute(check_error=True)['iface-id'])
+
+        self.client.unplug_ports(ports, {})
+        self.assertEqual(
+            [], self.ovs.list_ports(self.bridge).execute(check_error=True))
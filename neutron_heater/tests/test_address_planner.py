@@ -0,0 +1,43 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import netaddr
+
+from neutron_heater import address_planner
+from neutron_heater.tests import base
+
+
+class TestAddressPlanner(base.TestCase):
+
+    def test_v4_prefix_fits_all_ports(self):
+        self.assertEqual(29, address_planner.get_v4_prefixlen(0))
+        self.assertEqual(27, address_planner.get_v4_prefixlen(10))
+        self.assertEqual(18, address_planner.get_v4_prefixlen(10000))
+
+    def test_subnets_dont_overlap(self):
+        planner = address_planner.AddressPlanner(300, 3, 2)
+        cidrs = netaddr.IPSet()
+        for net_number in range(50):
+            subnets = planner.get_subnets(net_number, 'host')
+            self.assertEqual(5, len(subnets))
+            for _name, cidr in subnets:
+                network = netaddr.IPNetwork(cidr)
+                self.assertNotIn(network, cidrs)
+                cidrs.add(network)
+        self.assertEqual('10.0.2.0/23', planner.get_v4_cidr(0, 1))
+        self.assertEqual('fd00:0:0:1::/64', planner.get_v6_cidr(0, 1))
+
+    def test_check_pool_exhausted(self):
+        planner = address_planner.AddressPlanner(10000, 1, 1)
+        planner.check(1024)
+        self.assertRaises(address_planner.AddressPoolExhausted,
+                          planner.check, 1025)
@@ -0,0 +1,45 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+from unittest import mock
+
+from neutron_heater import async_engine
+from neutron_heater.tests import base
+
+
+class TestAsyncEngine(base.TestCase):
+
+    def test_clean_all_is_bounded(self):
+        engine = async_engine.AsyncEngine(mock.Mock(), mock.Mock(),
+                                          concurrency=2, plug_workers=1)
+        listed = []
+        cleaning = set()
+        max_ahead = []
+
+        def list_networks():
+            for index in range(10):
+                listed.append(index)
+                yield {'id': index}
+
+        async def clean_network(network, port_batch_size):
+            cleaning.add(network['id'])
+            self.assertLessEqual(len(cleaning), 2)
+            # Networks aren't listed far ahead of the ones being cleaned
+            max_ahead.append(len(listed) - network['id'])
+            await asyncio.sleep(0)
+            cleaning.remove(network['id'])
+
+        engine._clean_network_with_ports = clean_network
+        asyncio.run(engine._clean_all(list_networks(), 1))
+        self.assertEqual(list(range(10)), listed)
+        self.assertLessEqual(max(max_ahead), 2)
@@ -0,0 +1,87 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+from unittest import mock
+
+from neutron_heater import churn
+from neutron_heater import constants
+from neutron_heater import metrics
+from neutron_heater.tests import base
+
+
+def _get_port(index, device_owner=constants.PORT_DEVICE_OWNER):
+    return {'id': 'port-%s' % index, 'name': 'port-%s' % index,
+            'network_id': 'net-id', 'project_id': 'project',
+            'mac_address': 'mac', 'fixed_ips': [],
+            'device_owner': device_owner}
+
+
+class TestChurnRunner(base.TestCase):
+
+    def setUp(self):
+        super(TestChurnRunner, self).setUp()
+        self.os_client = mock.Mock(metrics=metrics.Metrics())
+        self.os_client.get_ports.return_value = [
+            _get_port(0), _get_port(1),
+            _get_port('dhcp', 'network:dhcp'),
+            _get_port('metadata', 'network:distributed')]
+        self.os_client.delete_port.return_value = True
+        self.new_ports = iter(_get_port('new-%s' % index)
+                              for index in range(100))
+        self.os_client.create_ports_bulk.side_effect = (
+            lambda network_id, names, hostname: [next(self.new_ports)])
+        self.runner = churn.ChurnRunner(self.os_client, mock.Mock(), 'host',
+                                        workers=1, rate=0.5)
+
+    def _get_pool(self):
+        return sorted(port['id'] for port in self.runner._ports)
+
+    def test_foreign_ports_are_not_replaced(self):
+        self.runner._load([{'id': 'net-id'}])
+        self.assertEqual(['port-0', 'port-1'], self._get_pool())
+
+    def test_failed_delete_keeps_old_port(self):
+        self.runner._load([{'id': 'net-id'}])
+        self.os_client.delete_port.return_value = None
+        self.runner._replace_port(self.runner._ports.popleft())
+        self.assertEqual(['port-0', 'port-1'], self._get_pool())
+        self.os_client.create_ports_bulk.assert_not_called()
+        # Old port is plugged back after it was unplugged
+        plugged = self.runner.os_vif.plug_ports.call_args[0][0]
+        self.assertEqual(['port-0'], [port['id'] for port in plugged])
+
+    def test_failed_create_is_retried(self):
+        self.runner._load([{'id': 'net-id'}])
+        self.os_client.create_ports_bulk.side_effect = [[], [_get_port(2)]]
+        self.runner._replace_port(self.runner._ports.popleft())
+        self.assertEqual(2, len(self.runner._ports))
+        self.assertIsNone(self.runner._ports[0]['id'])
+        # Placeholder is replaced first, without deleting any port
+        self.runner._replace_port(self.runner._ports.popleft())
+        self.assertEqual(['port-1', 'port-2'], self._get_pool())
+        self.os_client.delete_port.assert_called_once()
+
+    @mock.patch.object(churn, 'TICK', 0.05)
+    def test_queued_replacements_are_cancelled_at_deadline(self):
+        self.os_client.get_ports.return_value = [
+            _get_port(index) for index in range(20)]
+        self.os_client.delete_port.side_effect = (
+            lambda port: time.sleep(0.1) or True)
+        self.runner.rate = 10
+        started_at = time.monotonic()
+        self.runner.run([{'id': 'net-id'}], 0.1)
+        # Without cancelling, 20 replacements would take 2 seconds
+        self.assertLess(time.monotonic() - started_at, 1)
+        self.assertLess(self.os_client.delete_port.call_count, 20)
+        self.assertEqual(20, len(self.runner._ports))
+        self.assertEqual(0, self.runner._in_progress)
@@ -0,0 +1,62 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+
+from neutron_heater import journal
+from neutron_heater.tests import base
+
+
+class TestJournal(base.TestCase):
+
+    def setUp(self):
+        super(TestJournal, self).setUp()
+        tmp_dir = self.useFixture(fixtures.TempDir()).path
+        self.journal = journal.Journal(os.path.join(tmp_dir, 'journal.db'),
+                                       run_id='run-1')
+        self.addCleanup(self.journal.close)
+        self.network = {'id': 'net-1', 'name': 'network-0', 'project_id': 'p'}
+        self.subnet = {'id': 'subnet-1', 'name': 'subnet-0',
+                       'network_id': 'net-1', 'cidr': '10.0.0.0/24'}
+        self.ports = [
+            {'id': 'port-%s' % i, 'name': 'port-%s' % i,
+             'network_id': 'net-1', 'project_id': 'p',
+             'mac_address': 'fa:16:3e:00:00:0%s' % i,
+             'fixed_ips': [{'subnet_id': 'subnet-1',
+                            'ip_address': '10.0.0.%s' % (i + 10)}]}
+            for i in range(3)]
+        self.journal.record_created(journal.NETWORK, [self.network])
+        self.journal.record_created(journal.SUBNET, [self.subnet])
+        self.journal.record_created(journal.PORT, self.ports)
+
+    def test_load(self):
+        self.journal.record_plugged(self.ports[:2])
+        journaled = self.journal.load('run-1')
+        self.assertEqual({'network-0': self.network}, journaled.networks)
+        self.assertEqual({'subnet-1': self.subnet},
+                         journaled.subnets['net-1'])
+        self.assertEqual({port['name']: port for port in self.ports},
+                         journaled.ports['net-1'])
+        self.assertEqual({'port-0', 'port-1'}, journaled.plugged_ports)
+        self.assertEqual('run-1', self.journal.get_last_run_id())
+        self.assertEqual([], self.journal.get_resources(journal.NETWORK,
+                                                        'run-2'))
+
+    def test_deleted_resources(self):
+        self.journal.record_deleted(journal.PORT, self.ports[:1])
+        self.assertEqual(
+            self.ports[1:], self.journal.get_resources(journal.PORT))
+        self.journal.record_deleted(journal.NETWORK, [self.network])
+        self.assertEqual([], self.journal.get_resources(journal.NETWORK))
+        self.assertEqual([], self.journal.get_resources(journal.SUBNET))
@@ -0,0 +1,84 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+import threading
+
+from neutron_heater import limiter
+from neutron_heater import metrics
+from neutron_heater.tests import base
+
+
+class TestAIMDLimiter(base.TestCase):
+
+    def setUp(self):
+        super(TestAIMDLimiter, self).setUp()
+        self.limiter = limiter.AIMDLimiter(50, metrics.Metrics())
+
+    def _run_window(self, latency, success=True, operation=None):
+        limit = int(self.limiter.limit)
+        for _ in range(limit):
+            self.assertTrue(self.limiter.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+        for _ in range(limit):
+            self.limiter.release(latency, success, operation)
+
+    def test_slow_start_and_backoff(self):
+        self._run_window(0.1)
+        self.assertEqual(8, self.limiter.limit)
+        self._run_window(0.1)
+        self.assertEqual(16, self.limiter.limit)
+        self._run_window(0.5)
+        self.assertEqual(12, self.limiter.limit)
+        # After the first backoff limit grows additively
+        self._run_window(0.1)
+        self.assertEqual(13, self.limiter.limit)
+
+    def test_latency_compared_per_operation(self):
+        self._run_window(0.01, operation='get_networks')
+        self.assertEqual(8, self.limiter.limit)
+        # Ports are created much slower than networks are listed, which
+        # isn't a sign of the overload
+        self._run_window(0.5, operation='create_port')
+        self.assertEqual(16, self.limiter.limit)
+        self._run_window(0.01, operation='get_networks')
+        self.assertEqual(32, self.limiter.limit)
+        self._run_window(1.5, operation='create_port')
+        self.assertEqual(24, self.limiter.limit)
+
+    def test_errors_decrease_limit(self):
+        self._run_window(0.1, success=False)
+        self.assertEqual(3, self.limiter.limit)
+
+    def test_is_overload_error(self):
+        self.assertTrue(limiter.is_overload_error(TimeoutError()))
+        error = Exception()
+        error.status_code = 503
+        self.assertTrue(limiter.is_overload_error(error))
+        error.status_code = 409
+        self.assertFalse(limiter.is_overload_error(error))
+
+
+class TestConcurrencyLimiter(base.TestCase):
+
+    def test_set_limit_wakes_async_waiters(self):
+        concurrency_limiter = limiter.ConcurrencyLimiter(1)
+
+        async def acquire_two():
+            await concurrency_limiter.async_acquire()
+            # Limit is raised from other thread, like by the load profile
+            threading.Timer(0.1, concurrency_limiter.set_limit,
+                            args=(2,)).start()
+            await asyncio.wait_for(concurrency_limiter.async_acquire(), 2)
+
+        asyncio.run(acquire_two())
+        self.assertEqual(2, concurrency_limiter.in_flight)
@@ -0,0 +1,56 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron_heater import load_profile
+from neutron_heater import metrics
+from neutron_heater.tests import base
+
+
+class TestLoadProfile(base.TestCase):
+
+    def test_linear(self):
+        phases = load_profile.get_phases(
+            'linear:start=10,end=50,duration=100,phases=4')
+        self.assertEqual([(25, 10, 20), (25, 20, 30), (25, 30, 40),
+                          (25, 40, 50)],
+                         [(phase.duration, phase.start_value,
+                           phase.end_value) for phase in phases])
+
+    def test_step(self):
+        phases = load_profile.get_phases(
+            'step:start=10,end=50,steps=5,duration=50')
+        self.assertEqual([10, 20, 30, 40, 50],
+                         [phase.start_value for phase in phases])
+        self.assertEqual(50, load_profile.get_max_value(phases))
+
+    def test_spike_in_the_middle(self):
+        phases = load_profile.get_phases('spike:base=5,peak=50,duration=100')
+        self.assertEqual([('base', 45, 5), ('spike', 10, 50),
+                          ('recovery', 45, 5)],
+                         [(phase.name, phase.duration, phase.start_value)
+                          for phase in phases])
+
+    def test_invalid_profiles(self):
+        for spec in ('ramp:start=1', 'soak:level=5', 'soak:level=0,duration=5',
+                     'soak:level=5,duration=5,foo=1',
+                     'spike:base=1,peak=5,duration=10,at=8,length=5'):
+            self.assertRaises(ValueError, load_profile.get_phases, spec)
+
+    def test_phase_metrics(self):
+        run_metrics = metrics.Metrics()
+        run_metrics.record('create_port', 0.1)
+        phase = run_metrics.start_phase()
+        run_metrics.record('create_port', 0.2)
+        run_metrics.end_phase()
+        run_metrics.record('create_port', 0.3)
+        self.assertEqual(3, run_metrics.operations['create_port'].count)
+        self.assertEqual(1, phase.operations['create_port'].count)
@@ -0,0 +1,82 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron_heater import metrics
+from neutron_heater.tests import base
+
+
+class TestHistogram(base.TestCase):
+
+    def _get_histogram(self, values):
+        histogram = metrics.Histogram()
+        for value in values:
+            histogram.record(value)
+        return histogram
+
+    def test_percentiles(self):
+        histogram = self._get_histogram([i / 1000.0 for i in range(1, 1001)])
+        self.assertEqual(1000, histogram.count)
+        self.assertAlmostEqual(0.5, histogram.percentile(50), delta=0.01)
+        self.assertAlmostEqual(0.9, histogram.percentile(90), delta=0.015)
+        self.assertAlmostEqual(0.99, histogram.percentile(99), delta=0.016)
+        self.assertEqual(1.0, histogram.percentile(100))
+        self.assertEqual(0.001, histogram.min)
+
+    def test_merge(self):
+        histogram = self._get_histogram([0.1, 0.2])
+        histogram.merge(self._get_histogram([0.05, 3.0]))
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.05, histogram.min)
+        self.assertEqual(3.0, histogram.max)
+
+    def test_to_dict_from_dict(self):
+        histogram = self._get_histogram([0.001, 0.25, 7.5])
+        restored = metrics.Histogram.from_dict(histogram.to_dict())
+        self.assertEqual(histogram.buckets, restored.buckets)
+        self.assertEqual(histogram.percentile(50), restored.percentile(50))
+
+
+class TestMetrics(base.TestCase):
+
+    def test_measure_records_errors(self):
+        run_metrics = metrics.Metrics()
+
+        def create_port(fail):
+            with run_metrics.measure('create_port'):
+                if fail:
+                    raise ValueError()
+
+        create_port(fail=False)
+        self.assertRaises(ValueError, create_port, fail=True)
+        stats = run_metrics.operations['create_port']
+        self.assertEqual(2, stats.count)
+        self.assertEqual(1, stats.errors)
+
+    def test_measure_iter(self):
+        run_metrics = metrics.Metrics()
+        items = list(run_metrics.measure_iter('get_ports', iter([1, 2, 3])))
+        self.assertEqual([1, 2, 3], items)
+        self.assertEqual(1, run_metrics.operations['get_ports'].count)
+
+    def test_merge(self):
+        first = metrics.Metrics()
+        first.record('create_network', 0.1)
+        second = metrics.Metrics()
+        second.record('create_network', 0.2, success=False)
+        second.record('delete_network', 0.3)
+        first.increment('http_connections_opened')
+        second.increment('http_connections_opened', 2)
+        first.merge(metrics.Metrics.from_dict(second.to_dict()))
+        self.assertEqual(2, first.operations['create_network'].count)
+        self.assertEqual(1, first.operations['create_network'].errors)
+        self.assertEqual(1, first.operations['delete_network'].count)
+        self.assertEqual(3, first.counters['http_connections_opened'])
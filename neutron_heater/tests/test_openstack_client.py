@@ -0,0 +1,77 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from openstack.network.v2 import port as _port
+
+from neutron_heater import openstack_client
+from neutron_heater import shell
+from neutron_heater.tests import base
+
+
+class TestCreatePortsBulk(base.TestCase):
+
+    def setUp(self):
+        super(TestCreatePortsBulk, self).setUp()
+        self.client = openstack_client.OSClient('cloud')
+        self.client._os_conn = mock.Mock()
+        self.client._os_conn.network.create_port.side_effect = (
+            lambda **attrs: dict(attrs, id=attrs['name']))
+        self.bulk_create = mock.patch.object(_port.Port,
+                                             'bulk_create').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_ports_created_in_one_request(self):
+        self.bulk_create.side_effect = (
+            lambda network, data: [dict(attrs, id=attrs['name'])
+                                   for attrs in data])
+        ports = self.client.create_ports_bulk('net-id', ['a', 'b', 'c'],
+                                              'host')
+        self.bulk_create.assert_called_once()
+        data = self.bulk_create.call_args[0][1]
+        self.assertEqual(['a', 'b', 'c'], [attrs['name'] for attrs in data])
+        self.assertEqual({'host'},
+                         {attrs['binding_host_id'] for attrs in data})
+        self.assertEqual(['a', 'b', 'c'], [port['id'] for port in ports])
+        self.client._os_conn.network.create_port.assert_not_called()
+
+    def test_failed_bulk_request_falls_back_to_single_ports(self):
+        self.bulk_create.side_effect = Exception('bulk failed')
+        ports = self.client.create_ports_bulk('net-id', ['a', 'b'], 'host')
+        self.assertEqual(['a', 'b'], [port['id'] for port in ports])
+        self.assertEqual(
+            2, self.client._os_conn.network.create_port.call_count)
+        self.assertEqual(
+            1, self.client.metrics.operations['create_ports_bulk'].errors)
+
+
+class TestCreateNetworkPorts(base.TestCase):
+
+    def test_ports_created_and_plugged_in_batches(self):
+        os_client = mock.Mock()
+        os_client.create_ports_bulk.side_effect = (
+            lambda network_id, names, hostname: [{'id': name}
+                                                 for name in names])
+        os_vif = mock.Mock()
+        shell.create_network_ports({'id': 'net-id'}, {}, 5, 'host',
+                                   os_client, os_vif, port_batch_size=2)
+        self.assertEqual(
+            [2, 2, 1], [len(call[0][1]) for call in
+                        os_client.create_ports_bulk.call_args_list])
+        # Every batch is plugged at once, as it was created
+        self.assertEqual(
+            [[port['id'] for port in call[0][0]]
+             for call in os_vif.plug_ports.call_args_list],
+            [call[0][1] for call in
+             os_client.create_ports_bulk.call_args_list])
+        os_vif.release_network.assert_called_once_with('net-id')
@@ -0,0 +1,90 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+from unittest import mock
+
+from neutron_heater import metrics
+from neutron_heater import pipeline
+from neutron_heater.tests import base
+
+
+def _slow(item):
+    time.sleep(0.05)
+
+
+class TestPipeline(base.TestCase):
+
+    def test_full_queue_blocks_previous_stage(self):
+        produce = pipeline.Stage('produce', lambda item: range(5), 1, 1)
+        consume = pipeline.Stage('consume', _slow, 1, 1)
+        pipeline.Pipeline([produce, consume]).run([None])
+        self.assertEqual(5, consume.processed)
+        self.assertEqual(1, consume.max_queue_depth)
+        # Producer waited for the slow consumer for most of the items
+        self.assertGreater(produce.blocked_time, 0.1)
+        self.assertLess(produce.busy_time, produce.blocked_time)
+
+    def test_stage_statistics(self):
+        stage = pipeline.Stage('slow', _slow, 2, 10)
+        pipeline.Pipeline([stage]).run(range(4))
+        self.assertEqual(4, stage.processed)
+        self.assertEqual(0, stage.failed)
+        self.assertGreaterEqual(stage.busy_time, 0.2)
+        elapsed = stage.finished_at - stage.started_at
+        self.assertAlmostEqual(4 / elapsed, stage.throughput())
+        # Both workers were busy all the time
+        self.assertGreater(stage.utilization(), 80)
+        self.assertLessEqual(stage.utilization(), 100)
+
+    def test_failed_items_dont_stop_pipeline(self):
+        def fail_odd(item):
+            if item % 2:
+                raise ValueError(item)
+            return [item]
+
+        done = []
+        first = pipeline.Stage('first', fail_odd, 2, 2)
+        second = pipeline.Stage('second', done.append, 1, 2)
+        pipeline.Pipeline([first, second]).run(range(6))
+        self.assertEqual(3, first.failed)
+        self.assertEqual(6, first.processed)
+        self.assertEqual([0, 2, 4], sorted(done))
+        self.assertIsNotNone(second.finished_at)
+
+
+class TestCleanResources(base.TestCase):
+
+    def test_listing_and_deleting_overlap(self):
+        events = []
+
+        def list_networks():
+            for index in range(10):
+                events.append(('listed', index))
+                yield {'id': index}
+
+        os_client = mock.Mock(metrics=metrics.Metrics())
+        os_client.get_ports.return_value = []
+        os_client.delete_network.side_effect = (
+            lambda network: events.append(('deleted', network['id'])))
+        started_at = time.monotonic() - 10
+        pipeline.clean_resources(list_networks(), os_client, mock.Mock(),
+                                 api_workers=1, queue_size=1,
+                                 started_at=started_at)
+        self.assertEqual(10, os_client.delete_network.call_count)
+        # First networks are deleted before the last ones are listed
+        self.assertLess(events.index(('deleted', 0)),
+                        events.index(('listed', 9)))
+        # Time to the first delete is counted from the start of the run
+        first_delete = os_client.metrics.operations[
+            pipeline.TIME_TO_FIRST_DELETE]
+        self.assertGreaterEqual(first_delete.latency.min, 10)
@@ -0,0 +1,91 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron_heater import metrics
+from neutron_heater import openstack_client
+from neutron_heater import provisioning
+from neutron_heater.tests import base
+
+
+class TestProvisioningTracker(base.TestCase):
+
+    def setUp(self):
+        super(TestProvisioningTracker, self).setUp()
+        self.statuses = {}
+        self.os_client = openstack_client.OSClient('cloud')
+        self.os_client._os_conn = mock.Mock()
+        self.os_client._os_conn.network.ports.side_effect = (
+            lambda id, fields: [{'id': port_id,
+                                 'status': self.statuses[port_id]}
+                                for port_id in id])
+        self.metrics = metrics.Metrics()
+        self.tracker = provisioning.ProvisioningTracker(
+            self.os_client, self.metrics, interval=1, timeout=60)
+        self.ports = [{'id': 'port-%s' % index} for index in range(250)]
+        self.statuses.update((port['id'], 'DOWN') for port in self.ports)
+
+    def test_status_checked_in_chunks(self):
+        self.tracker.ports_created(self.ports)
+        self.tracker._check_ports()
+        calls = self.os_client._os_conn.network.ports.call_args_list
+        self.assertEqual([100, 100, 50], [len(call[1]['id'])
+                                          for call in calls])
+        self.assertEqual({('id', 'status')},
+                         {tuple(call[1]['fields']) for call in calls})
+
+    def test_active_ports_are_recorded(self):
+        self.tracker.ports_created(self.ports)
+        self.tracker.ports_plugged(self.ports[:10])
+        self.statuses.update((port['id'], 'ACTIVE')
+                             for port in self.ports[:20])
+        self.tracker._check_ports()
+        operations = self.metrics.operations
+        self.assertEqual(
+            20, operations[provisioning.CREATE_TO_ACTIVE].count)
+        self.assertEqual(10, operations[provisioning.PLUG_TO_ACTIVE].count)
+        # Only ports which are not ACTIVE yet are checked again
+        self.assertEqual(230, len(self.tracker._pending))
+
+    def test_timed_out_ports_are_errors(self):
+        self.tracker.timeout = 0
+        self.tracker.ports_created(self.ports[:3])
+        self.tracker._check_ports()
+        self.tracker.report_summary()
+        self.assertEqual(
+            3, self.metrics.operations[provisioning.CREATE_TO_ACTIVE].errors)
+        self.assertEqual(['port-0', 'port-1', 'port-2'],
+                         sorted(self.metrics.details['ports_not_active']))
+        self.assertEqual({}, self.tracker._pending)
+
+    def test_updated_ports_are_recorded(self):
+        self.tracker.ports_created(self.ports[:3])
+        self.tracker.ports_updated(self.ports[1:5])
+        self.statuses.update((port['id'], 'ACTIVE')
+                             for port in self.ports[:5])
+        self.tracker._check_ports()
+        operations = self.metrics.operations
+        # Update doesn't replace tracking of the port's creation
+        self.assertEqual(3, operations[provisioning.CREATE_TO_ACTIVE].count)
+        self.assertEqual(4, operations[provisioning.UPDATE_TO_ACTIVE].count)
+        self.assertEqual({}, self.tracker._pending)
+        self.assertEqual({}, self.tracker._updated)
+
+    def test_timed_out_updated_ports_are_errors(self):
+        self.tracker.timeout = 0
+        self.tracker.ports_updated(self.ports[:2])
+        self.tracker._check_ports()
+        self.assertEqual(
+            2, self.metrics.operations[provisioning.UPDATE_TO_ACTIVE].errors)
+        self.assertEqual(['port-0', 'port-1'],
+                         sorted(self.tracker.timed_out_ports))
@@ -0,0 +1,55 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron_heater import rate
+from neutron_heater.tests import base
+
+
+class TestOpenLoopScheduler(base.TestCase):
+
+    def setUp(self):
+        super(TestOpenLoopScheduler, self).setUp()
+        self.now = 100.0
+        fake_time = mock.patch.object(rate, 'time').start()
+        self.addCleanup(mock.patch.stopall)
+        fake_time.monotonic.side_effect = lambda: self.now
+        fake_time.sleep.side_effect = self._sleep
+        self.scheduler = rate.OpenLoopScheduler(10)
+
+    def _sleep(self, seconds):
+        self.now += seconds
+
+    def _request(self, duration):
+        intended_time, send_time = self.scheduler.wait()
+        self.now += duration
+        self.scheduler.record(intended_time, send_time)
+        return intended_time - 100.0
+
+    def test_stalled_request_keeps_schedule(self):
+        self.assertAlmostEqual(0.0, self._request(0.05))
+        # All senders are blocked on the slow request for almost a second
+        self.assertAlmostEqual(0.1, self._request(0.9))
+        # Requests which couldn't be sent in the meantime are late, so
+        # their latency is measured from their original send times
+        self.assertAlmostEqual(0.2, self._request(0.01))
+        self.assertAlmostEqual(0.3, self._request(0.01))
+        self.assertGreaterEqual(self.scheduler.latency_max, 0.9)
+
+    def test_paused_time_is_not_counted(self):
+        self.assertAlmostEqual(0.0, self._request(0.05))
+        self.scheduler.pause()
+        self.now += 5
+        self.scheduler.resume()
+        self.assertAlmostEqual(5.1, self._request(0.01))
+        self.assertAlmostEqual(5.2, self._request(0.01))
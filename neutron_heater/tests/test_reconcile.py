@@ -0,0 +1,132 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron_heater import constants
+from neutron_heater import metrics
+from neutron_heater import reconcile
+from neutron_heater.tests import base
+from neutron_heater import utils
+from neutron_heater import work_scheduler
+
+
+class TestNetworkReconciler(base.TestCase):
+
+    def setUp(self):
+        super(TestNetworkReconciler, self).setUp()
+        self.config = mock.Mock(ports=3, ipv4_subnets=1, ipv6_subnets=0,
+                                port_batch_size=10)
+        self.os_client = mock.Mock()
+        self.os_client.create_ports_bulk.side_effect = (
+            lambda network_id, names, hostname: [{'name': name}
+                                                 for name in names])
+        self.os_vif = mock.Mock()
+        self.scheduler = work_scheduler.WorkScheduler(2, metrics.Metrics())
+        self.reconciler = reconcile.NetworkReconciler(
+            self.config, 'host', self.os_client, self.os_vif, self.scheduler)
+        self.subnets = {'subnet-id': {'id': 'subnet-id',
+                                      'name': 'v4_subnet-0-host-host',
+                                      'cidr': '10.0.0.0/28'}}
+        self.network = {'id': 'net-id', 'name': 'network-0-host-host'}
+
+    def _get_port(self, index, device_owner=constants.PORT_DEVICE_OWNER):
+        return {'id': 'port-%s' % index, 'network_id': 'net-id',
+                'project_id': 'project', 'mac_address': 'mac',
+                'fixed_ips': [], 'device_owner': device_owner,
+                'name': utils.get_port_name(index, 'host', 'net-id')}
+
+    def _reconcile(self, ports):
+        self.os_client.get_ports.return_value = ports
+        self.scheduler.run([work_scheduler.Task(
+            'network', self.reconciler.reconcile, 0, self.network,
+            self.subnets)])
+
+    def test_missing_ports_get_unused_names(self):
+        self._reconcile([self._get_port(1)])
+        self.os_client.create_ports_bulk.assert_called_once_with(
+            'net-id', [utils.get_port_name(0, 'host', 'net-id'),
+                       utils.get_port_name(2, 'host', 'net-id')], 'host')
+        self.os_client.delete_port.assert_not_called()
+        self.os_client.create_subnet.assert_not_called()
+
+    def test_unrequested_ports_are_deleted_first(self):
+        self._reconcile([self._get_port(index) for index in (7, 0, 1, 2, 5)])
+        self.os_client.create_ports_bulk.assert_not_called()
+        self.assertEqual(
+            ['port-5', 'port-7'],
+            sorted(call.args[0]['id'] for call in
+                   self.os_client.delete_port.call_args_list))
+
+    def test_foreign_ports_are_ignored(self):
+        self.config.ports = 4
+        self._reconcile([self._get_port(index) for index in range(3)] + [
+            self._get_port('dhcp', 'network:dhcp'),
+            self._get_port('metadata', 'network:distributed')])
+        self.os_client.delete_port.assert_not_called()
+        self.os_client.create_ports_bulk.assert_called_once_with(
+            'net-id', [utils.get_port_name(3, 'host', 'net-id')], 'host')
+
+    def test_check_subnet_too_small(self):
+        self.reconciler.check(0, self.network, self.subnets)
+        self.config.ports = 100
+        reconciler = reconcile.NetworkReconciler(
+            self.config, 'host', self.os_client, self.os_vif, self.scheduler)
+        self.assertRaises(reconcile.SubnetTooSmall, reconciler.check, 0,
+                          self.network, self.subnets)
+
+    def test_fewer_subnets_free_their_ips_first(self):
+        self.subnets['extra-id'] = {'id': 'extra-id',
+                                    'name': 'v4_subnet-1-host-host',
+                                    'cidr': '10.0.0.16/28'}
+        ports = [self._get_port(index) for index in range(4)]
+        for port in ports:
+            port['fixed_ips'] = [
+                {'subnet_id': 'subnet-id', 'ip_address': '10.0.0.2'},
+                {'subnet_id': 'extra-id', 'ip_address': '10.0.0.18'}]
+        calls = []
+        self.os_client.set_port_fixed_ips.side_effect = (
+            lambda port, fixed_ips: calls.append(('update', port['id'])))
+        self.os_client.delete_port.side_effect = (
+            lambda port: calls.append(('delete', port['id'])))
+        self.os_client.delete_subnet.side_effect = (
+            lambda subnet: calls.append(('delete_subnet', subnet['id'])))
+        self._reconcile(ports)
+        # Only the kept ports are updated, the extra one is deleted
+        self.assertEqual(
+            ['port-0', 'port-1', 'port-2'],
+            sorted(call[0][0]['id'] for call in
+                   self.os_client.set_port_fixed_ips.call_args_list))
+        self.assertEqual(
+            [['subnet-id']] * 3,
+            [[fixed_ip['subnet_id'] for fixed_ip in call[0][1]]
+             for call in self.os_client.set_port_fixed_ips.call_args_list])
+        self.assertEqual(('delete_subnet', 'extra-id'), calls[-1])
+        self.assertIn(('delete', 'port-3'), calls)
+
+    def test_check_new_subnet_overlaps_existing(self):
+        # Existing subnet was created for more ports than requested now
+        self.subnets['subnet-id']['cidr'] = '10.0.0.0/24'
+        self.config.ipv4_subnets = 2
+        reconciler = reconcile.NetworkReconciler(
+            self.config, 'host', self.os_client, self.os_vif, self.scheduler)
+        self.assertRaises(reconcile.SubnetsOverlap, reconciler.check, 0,
+                          self.network, self.subnets)
+
+    def test_check_more_ports_than_existing_prefix(self):
+        self.config.ports = 100
+        self.config.ipv4_subnets = 2
+        reconciler = reconcile.NetworkReconciler(
+            self.config, 'host', self.os_client, self.os_vif, self.scheduler)
+        self.assertRaises(reconcile.SubnetsConflict, reconciler.check, 0,
+                          self.network, self.subnets)
+        self.os_client.create_subnet.assert_not_called()
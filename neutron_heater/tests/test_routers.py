@@ -0,0 +1,62 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron_heater import constants
+from neutron_heater import metrics
+from neutron_heater import routers
+from neutron_heater.tests import base
+from neutron_heater import utils
+
+
+class TestRouterWorkload(base.TestCase):
+
+    def setUp(self):
+        super(TestRouterWorkload, self).setUp()
+        self.config = mock.Mock(routers=2, external_network='public',
+                                floating_ips=1)
+        self.os_client = mock.Mock(metrics=metrics.Metrics())
+        self.os_client.find_network.return_value = {'id': 'ext-id'}
+        self.os_client.create_router.side_effect = lambda name: {'id': name}
+        self.os_client.get_networks.return_value = [
+            {'id': 'net-%s' % index,
+             'name': utils.get_network_name(index, 'host')}
+            for index in range(3)]
+        self.os_client.get_network_subnets.side_effect = (
+            lambda network_id: {'%s-subnet' % network_id: {}})
+        self.os_client.get_ports.side_effect = lambda network_id: [
+            {'id': '%s-dhcp' % network_id, 'device_owner': 'network:dhcp'},
+            {'id': '%s-port' % network_id,
+             'device_owner': constants.PORT_DEVICE_OWNER}]
+
+    def test_run(self):
+        routers.RouterWorkload(self.config, 'host', self.os_client, 4).run(
+            range(3))
+        self.assertEqual(2, self.os_client.create_router.call_count)
+        self.assertEqual(2, self.os_client.set_router_gateway.call_count)
+        # Networks are spread between the routers in round robin order
+        self.os_client.add_router_interface.assert_any_call(
+            {'id': utils.get_router_name(0, 'host')}, 'net-2-subnet')
+        self.os_client.add_router_interface.assert_any_call(
+            {'id': utils.get_router_name(1, 'host')}, 'net-1-subnet')
+        self.assertEqual(
+            ['net-0-port', 'net-1-port', 'net-2-port'],
+            sorted(call.args[1]['id'] for call in
+                   self.os_client.create_floating_ip.call_args_list))
+
+    def test_no_floating_ips_without_gateway(self):
+        self.os_client.set_router_gateway.return_value = None
+        routers.RouterWorkload(self.config, 'host', self.os_client, 4).run(
+            range(3))
+        self.assertEqual(3, self.os_client.add_router_interface.call_count)
+        self.os_client.create_floating_ip.assert_not_called()
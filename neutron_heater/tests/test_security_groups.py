@@ -0,0 +1,74 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron_heater import constants
+from neutron_heater import security_groups
+from neutron_heater.tests import base
+from neutron_heater import utils
+
+
+class TestSecurityGroupRules(base.TestCase):
+
+    def test_get_rules(self):
+        rules = security_groups.get_rules(
+            {'id': 'sg-0'}, [{'id': 'sg-1'}, {'id': 'sg-2'}], 5, 3)
+        self.assertEqual(['sg-1', 'sg-2', 'sg-1', None, None],
+                         [rule.get('remote_group_id') for rule in rules])
+        self.assertEqual(5, len({rule['port_range_min'] for rule in rules}))
+        self.assertEqual('0.0.0.0/0', rules[-1]['remote_ip_prefix'])
+        self.assertNotIn('remote_ip_prefix', rules[0])
+
+    def test_get_rules_without_remote_groups(self):
+        rules = security_groups.get_rules({'id': 'sg-0'}, [], 2, 2)
+        self.assertEqual(['0.0.0.0/0', '0.0.0.0/0'],
+                         [rule['remote_ip_prefix'] for rule in rules])
+
+
+class TestSecurityGroupStorm(base.TestCase):
+
+    def setUp(self):
+        super(TestSecurityGroupStorm, self).setUp()
+        self.os_client = mock.Mock()
+        self.os_client.get_networks.return_value = [
+            {'id': 'net-id', 'name': utils.get_network_name(0, 'host')}]
+        self.os_client.get_ports.return_value = [
+            {'id': port_id, 'device_owner': device_owner}
+            for port_id, device_owner in (
+                ('port', constants.PORT_DEVICE_OWNER),
+                ('dhcp', 'network:dhcp'),
+                ('metadata', 'network:distributed'))]
+
+    def test_only_heater_ports_are_updated(self):
+        storm = security_groups.SecurityGroupStorm(mock.Mock(), 'host',
+                                                   self.os_client, 1)
+        self.assertEqual(['port'],
+                         [port['id'] for port in storm._get_ports([0])])
+
+    def test_updated_ports_are_tracked(self):
+        config = mock.Mock(security_groups=2, security_group_rules=1,
+                           remote_group_rules=0, security_groups_per_port=1)
+        self.os_client.create_security_group.side_effect = (
+            lambda name: {'id': name})
+        self.os_client.create_security_group_rules_bulk.side_effect = (
+            lambda rules: rules)
+        self.os_client.set_port_security_groups.side_effect = (
+            lambda port, security_group_ids: dict(
+                port, security_group_ids=security_group_ids))
+        tracker = mock.Mock()
+        security_groups.SecurityGroupStorm(config, 'host', self.os_client, 2,
+                                           tracker).run([0])
+        updated_ports = tracker.ports_updated.call_args[0][0]
+        self.assertEqual(['port'], [port['id'] for port in updated_ports])
+        self.assertEqual([utils.get_security_group_name(0, 'host')],
+                         updated_ports[0]['security_group_ids'])
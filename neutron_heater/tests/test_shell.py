@@ -0,0 +1,176 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+from unittest import mock
+
+import fixtures
+
+from neutron_heater import constants
+from neutron_heater import metrics
+from neutron_heater import openstack_client
+from neutron_heater import shell
+from neutron_heater.tests import base
+
+
+def _record_shard(config, scheduler, worker_metrics, shard):
+    worker_metrics.record('shard', 0.1)
+    worker_metrics.increment('networks', len(shard))
+    worker_metrics.add_details('run_ids', [config.run_id])
+    worker_metrics.add_details('rates', [scheduler.rate])
+
+
+class TestRunInProcesses(base.TestCase):
+
+    def setUp(self):
+        super(TestRunInProcesses, self).setUp()
+        self.config = mock.Mock(
+            action=constants.CREATE, networks=3, processes=8, rate=12,
+            arrival='uniform', load_profile=None, run_id=None,
+            journal_file=None, resume=False, from_journal=False)
+        self.config.set_override.side_effect = (
+            lambda name, value: setattr(self.config, name, value))
+        self.run_metrics = metrics.Metrics()
+
+    @mock.patch.object(shell, 'create_resources', _record_shard)
+    def test_metrics_of_all_shards_are_merged(self):
+        shell.create_resources_in_processes(self.config, self.run_metrics)
+        self.assertEqual(3, self.run_metrics.operations['shard'].count)
+        self.assertEqual(3, self.run_metrics.counters['networks'])
+        # Rate is shared only by the 3 processes which were started
+        self.assertEqual([4.0, 4.0, 4.0], self.run_metrics.details['rates'])
+
+    @mock.patch.object(shell, 'create_resources', _record_shard)
+    def test_processes_share_run_id(self):
+        shell.create_resources_in_processes(self.config, self.run_metrics)
+        run_ids = self.run_metrics.details['run_ids']
+        self.assertEqual(3, len(run_ids))
+        self.assertEqual({self.config.run_id}, set(run_ids))
+        self.assertIsInstance(self.config.run_id, str)
+
+
+class TestDiscoverHosts(base.TestCase):
+
+    def setUp(self):
+        super(TestDiscoverHosts, self).setUp()
+        self.tmp_dir = self.useFixture(fixtures.TempDir()).path
+        self.config = mock.Mock(
+            l2_agent_name='neutron-ovn-metadata-agent', cloud_name='cloud',
+            region_name=None, cache_dir=self.tmp_dir,
+            inventory_file_name=os.path.join(self.tmp_dir, 'hosts.yaml'))
+        self.client = openstack_client.OSClient('cloud', page_size=100)
+        self.client._os_conn = mock.Mock()
+        mock.patch.object(shell, '_get_osclient',
+                          return_value=self.client).start()
+        self.addCleanup(mock.patch.stopall)
+        with open(self.config.inventory_file_name, 'w') as f:
+            f.write('old inventory')
+
+    def _read_inventory(self):
+        with open(self.config.inventory_file_name) as f:
+            return f.read()
+
+    def test_agents_filtered_on_server(self):
+        self.client._os_conn.network.agents.return_value = iter(
+            [{'host': 'host-1', 'is_alive': True},
+             {'host': 'host-1', 'is_alive': True},
+             {'host': 'host-2', 'is_alive': False}])
+        shell.discover_hosts(self.config)
+        self.client._os_conn.network.agents.assert_called_once_with(
+            binary='neutron-ovn-metadata-agent', limit=100)
+        self.assertEqual("all:\n  hosts:\n    host-1:\n",
+                         self._read_inventory())
+
+    def test_failed_listing_keeps_inventory(self):
+        def agents(**filters):
+            yield {'host': 'host-1', 'is_alive': True}
+            raise Exception('listing failed')
+
+        self.client._os_conn.network.agents.side_effect = agents
+        self.assertRaises(SystemExit, shell.discover_hosts, self.config)
+        self.assertEqual('old inventory', self._read_inventory())
+        self.assertEqual(['hosts.yaml'], os.listdir(self.tmp_dir))
+
+    def test_no_hosts_keep_inventory(self):
+        self.client._os_conn.network.agents.return_value = iter([])
+        self.assertRaises(SystemExit, shell.discover_hosts, self.config)
+        self.assertEqual('old inventory', self._read_inventory())
+
+    @mock.patch.object(shell.socket, 'gethostname', return_value='host-1')
+    def test_node_name_cached(self, _):
+        self.client._os_conn.network.agents.return_value = iter(
+            [{'host': 'host-1.example.com'}])
+        self.assertEqual('host-1.example.com',
+                         shell.get_node_name(self.config))
+        self.client._os_conn.network.agents.assert_called_once_with(
+            binary='neutron-ovn-metadata-agent', host='host-1', limit=100)
+        # Next run finds the name in the cache, without any request
+        shell._get_osclient.reset_mock()
+        self.assertEqual('host-1.example.com',
+                         shell.get_node_name(self.config))
+        shell._get_osclient.assert_not_called()
+
+
+def _record_networks(config, client, os_vif, networks, ports, subnets,
+                     started_at):
+    client.metrics.add_details('cleaned', [network['id']
+                                           for network in networks])
+
+
+class TestCleanInProcesses(base.TestCase):
+
+    def setUp(self):
+        super(TestCleanInProcesses, self).setUp()
+        self.config = mock.Mock(
+            action=constants.CLEAN, processes=3, rate=None, load_profile=None,
+            journal_file=None, resume=False, from_journal=False,
+            pipeline_queue_size=2)
+        mock.patch.object(
+            shell, '_get_osclient',
+            side_effect=lambda config, scheduler, worker_metrics, **kwargs:
+            mock.Mock(metrics=worker_metrics)).start()
+        mock.patch.object(shell, 'get_vif_client').start()
+        self.addCleanup(mock.patch.stopall)
+
+    @mock.patch.object(shell, '_clean_resources', _record_networks)
+    def test_listed_networks_cleaned_once(self):
+        run_metrics = metrics.Metrics()
+        networks = ({'id': 'net-%s' % index, 'name': 'net-%s' % index}
+                    for index in range(20))
+        shell.clean_in_processes(self.config, networks, None, None, 0.0,
+                                 run_metrics)
+        self.assertEqual(sorted('net-%s' % index for index in range(20)),
+                         sorted(run_metrics.details['cleaned']))
+
+
+class TestLoadProfile(base.TestCase):
+
+    def _get_config(self, action):
+        return mock.Mock(action=action,
+                         load_profile='linear:start=1,end=10,duration=60',
+                         load_profile_target=constants.RATE_TARGET,
+                         concurrency=10)
+
+    def test_profile_accepted_by_create_and_churn(self):
+        for action in (constants.CREATE, constants.CHURN):
+            shell.check_load_profile(self._get_config(action))
+
+    @mock.patch.object(shell, 'reconcile_resources')
+    @mock.patch.object(shell, 'clean_all')
+    def test_profile_rejected_by_other_actions(self, clean_all,
+                                               reconcile_resources):
+        for action in (constants.CLEAN, constants.RECONCILE):
+            with mock.patch.object(shell.conf, 'get_config',
+                                   return_value=self._get_config(action)):
+                self.assertRaises(SystemExit, shell.main, [])
+        clean_all.assert_not_called()
+        reconcile_resources.assert_not_called()
@@ -0,0 +1,65 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import os
+import stat
+
+import fixtures
+from keystoneauth1 import access
+from keystoneauth1 import fixture as ks_fixture
+from keystoneauth1.identity import v3
+from oslo_utils import timeutils
+
+from neutron_heater import token_cache
+from neutron_heater.tests import base
+
+
+class TestTokenCache(base.TestCase):
+
+    def setUp(self):
+        super(TestTokenCache, self).setUp()
+        self.cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.cache = token_cache.TokenCache(self.cache_dir)
+
+    def _get_auth(self, password='secret', expires_in=3600):
+        auth = v3.Password(auth_url='http://keystone/v3', username='admin',
+                           password=password, user_domain_id='default',
+                           project_name='admin', project_domain_id='default')
+        lifetime = datetime.timedelta(seconds=expires_in)
+        token = ks_fixture.V3Token(expires=timeutils.utcnow() + lifetime)
+        auth.auth_ref = access.create(body=token, auth_token='token-id')
+        return auth
+
+    def test_restore(self):
+        self.cache.save(self._get_auth(), 'cloud', 'RegionOne', 0.5)
+        auth = self._get_auth()
+        auth.auth_ref = None
+        self.assertEqual(0.5, self.cache.restore(auth, 'cloud', 'RegionOne'))
+        self.assertEqual('token-id', auth.auth_ref.auth_token)
+        self.assertIsNone(self.cache.restore(auth, 'cloud', 'RegionTwo'))
+
+    def test_restore_expired_token(self):
+        self.cache.save(self._get_auth(expires_in=60), 'cloud', None, 0.5)
+        self.assertIsNone(self.cache.restore(self._get_auth(), 'cloud', None))
+
+    def test_restore_other_credentials(self):
+        self.cache.save(self._get_auth(), 'cloud', None, 0.5)
+        self.assertIsNone(self.cache.restore(
+            self._get_auth(password='other'), 'cloud', None))
+
+    def test_save_restricts_existing_directory(self):
+        os.chmod(self.cache_dir, 0o755)
+        self.cache.save(self._get_auth(), 'cloud', None, 0.5)
+        self.assertEqual(
+            0o700, stat.S_IMODE(os.stat(self.cache_dir).st_mode))
+        self.assertTrue(os.path.exists(self.cache.filename))
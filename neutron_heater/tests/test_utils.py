@@ -0,0 +1,25 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron_heater import utils
+from neutron_heater.tests import base
+
+
+class TestSplit(base.TestCase):
+
+    def test_similar_contiguous_slices(self):
+        self.assertEqual([range(0, 3), range(3, 6), range(6, 10)],
+                         utils.split(range(10), 3))
+
+    def test_no_empty_slices(self):
+        self.assertEqual([[1], [2]], utils.split([1, 2], 4))
+        self.assertEqual([], utils.split([], 4))
@@ -0,0 +1,61 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from neutron_heater import metrics
+from neutron_heater.tests import base
+from neutron_heater import work_scheduler
+
+
+class TestWorkScheduler(base.TestCase):
+
+    def setUp(self):
+        super(TestWorkScheduler, self).setUp()
+        self.scheduler = work_scheduler.WorkScheduler(4, metrics.Metrics())
+        self.done = []
+        self.lock = threading.Lock()
+
+    def _record(self, name):
+        with self.lock:
+            self.done.append(name)
+        return name
+
+    def test_dependencies(self):
+
+        def create_network():
+            ports = [self.scheduler.add(work_scheduler.Task(
+                'ports', self._record, 'port-%s' % i)) for i in range(10)]
+            self.scheduler.add(
+                work_scheduler.Task('release', self._record, 'release'),
+                after=ports)
+
+        self.scheduler.run([work_scheduler.Task('network', create_network)])
+        self.assertEqual(11, len(self.done))
+        self.assertEqual('release', self.done[-1])
+        self.assertEqual({'network': 1, 'ports': 10, 'release': 1},
+                         self.scheduler.done)
+
+    def test_failed_dependency_skips_dependents(self):
+
+        def fail():
+            raise ValueError()
+
+        failed = work_scheduler.Task('ports', fail)
+        plug = work_scheduler.Task('plug', self._record, 'plug')
+        release = work_scheduler.Task('release', self._record, 'release')
+        self.scheduler.add(plug, after=[failed])
+        self.scheduler.add(release, after=[plug])
+        self.scheduler.run([failed])
+        self.assertEqual([], self.done)
+        self.assertTrue(release.failed)
+        self.assertEqual(3, self.scheduler.failed)
@@ -0,0 +1,99 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import os
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+TOKENS_FILE = 'tokens.json'
+# Cached token which expires sooner than that, in seconds, is not used
+EXPIRY_MARGIN = 600
+
+TOKENS_REUSED = 'keystone_tokens_reused'
+AUTH_TIME_SAVED = 'keystone_auth_time_saved'
+
+
+class TokenCache(object):
+    """On-disk cache of the Keystone tokens shared by the heater runs.
+
+    Tokens are stored in the tokens.json file in the cache directory,
+    keyed by cloud and region name, together with time which it took to
+    get them. Every run on the node, like discover, create and clean,
+    can then reuse the token instead of authenticating to Keystone again.
+    """
+
+    def __init__(self, cache_dir):
+        self.filename = os.path.join(cache_dir, TOKENS_FILE)
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    @staticmethod
+    def _get_key(cloud, region_name):
+        return "%s:%s" % (cloud, region_name or '')
+
+    def restore(self, auth, cloud, region_name):
+        """Install cached token in the auth plugin if it is still valid.
+
+        Returns time which it took to get that token from Keystone or None
+        if there is no valid token for the cloud and region in the cache.
+        """
+        cached = utils.read_json_file(self.filename).get(
+            self._get_key(cloud, region_name))
+        if not cached or cached['cache_id'] != auth.get_cache_id():
+            return
+        expires_at = timeutils.parse_isotime(cached['expires_at'])
+        if timeutils.is_soon(expires_at, EXPIRY_MARGIN):
+            return
+        auth.set_auth_state(cached['auth_state'])
+        return cached['auth_time']
+
+    def save(self, auth, cloud, region_name, auth_time):
+        auth_state = auth.get_auth_state()
+        if not auth_state:
+            return
+        tokens = utils.read_json_file(self.filename)
+        now = timeutils.utcnow(with_timezone=True)
+        for key, cached in list(tokens.items()):
+            if timeutils.parse_isotime(cached['expires_at']) < now:
+                del tokens[key]
+        expires_at = auth.auth_ref.expires
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+        tokens[self._get_key(cloud, region_name)] = {
+            'cache_id': auth.get_cache_id(),
+            'auth_state': auth_state,
+            'expires_at': expires_at.isoformat(),
+            'auth_time': auth_time,
+        }
+        # Mode isn't changed by makedirs if the directory already existed
+        cache_dir = os.path.dirname(self.filename)
+        try:
+            os.chmod(cache_dir, 0o700)
+        except OSError as e:
+            LOG.warning("Tokens aren't cached as access to the directory %s "
+                        "can't be restricted. Error: %s", cache_dir, e)
+            return
+        utils.write_json_file(self.filename, tokens)
+
+
+def report_summary(metrics):
+    reused = metrics.counters[TOKENS_REUSED]
+    if reused:
+        LOG.info("Cached Keystone token was reused %s times, which saved "
+                 "about %.3f s of authentication",
+                 reused, metrics.counters[AUTH_TIME_SAVED])
@@ -0,0 +1,108 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+import json
+import os
+import resource
+import tempfile
+
+from oslo_log import log as logging
+
+from neutron_heater import constants
+
+
+LOG = logging.getLogger(__name__)
+
+
+def chunks(iterable, size):
+    """Split iterable into lists of at most size elements."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, max(size, 1)))
+        if not chunk:
+            return
+        yield chunk
+
+
+def split(sequence, parts):
+    """Split sequence into at most parts contiguous, similar slices."""
+    length = len(sequence)
+    slices = [sequence[part * length // parts:(part + 1) * length // parts]
+              for part in range(parts)]
+    return [part for part in slices if len(part)]
+
+
+def read_json_file(filename):
+    """Read dict from the JSON file, empty if file can't be read."""
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        LOG.warning("Failed to read file %s. Error: %s", filename, e)
+        return {}
+
+
+def write_json_file(filename, data):
+    """Write data to the JSON file readable only by its owner.
+
+    File is replaced atomically so other runs never read only part of it.
+    """
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                        prefix=os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_filename, filename)
+    except OSError as e:
+        LOG.warning("Failed to write file %s. Error: %s", filename, e)
+        os.unlink(tmp_filename)
+
+
+def get_peak_rss():
+    """Get peak resident memory of the current process in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def is_heater_port(port):
+    """Check if port was created by the heater, not e.g. DHCP or router."""
+    return port['device_owner'] == constants.PORT_DEVICE_OWNER
+
+
+def get_network_name(index, hostname):
+    return "network-%s-host-%s" % (index, hostname)
+
+
+def get_port_name(index, hostname, network_id):
+    return "port-%s-host-%s-network-%s" % (index, hostname, network_id)
+
+
+def get_security_group_name(index, hostname):
+    return "security-group-%s-host-%s" % (index, hostname)
+
+
+def get_router_name(index, hostname):
+    return "router-%s-host-%s" % (index, hostname)
+
+
+def get_resource_tags(hostname, run_id=None):
+    """Get tags of the resources created by the run on the host.
+
+    If run_id is not given, only the host's tag is returned, which matches
+    resources created by all runs on that host.
+    """
+    tags = [constants.HOST_TAG_PREFIX + hostname]
+    if run_id:
+        tags.append(constants.RUN_TAG_PREFIX + run_id)
+    return tags
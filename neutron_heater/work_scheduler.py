@@ -0,0 +1,242 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+
+from oslo_log import log as logging
+
+from neutron_heater import address_planner
+from neutron_heater import utils
+
+
+LOG = logging.getLogger(__name__)
+
+TASKS_STOLEN = 'work_tasks_stolen'
+
+
+class Task(object):
+    """Work item which is run when all tasks it depends on are done.
+
+    Result returned by func is stored in the task so tasks which depend on
+    it can use it. If func raises an exception, the task and all tasks
+    which depend on it, directly or not, are failed without being run.
+    """
+
+    def __init__(self, name, func, *args):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.result = None
+        self.done = False
+        self.failed = False
+        self._dependencies = 0
+        self._dependents = []
+
+
+class WorkScheduler(object):
+    """Run tasks with dependencies on a pool of work-stealing workers.
+
+    Every worker has its own deque of ready tasks. Tasks made ready by the
+    worker are put in its own deque and taken from it in LIFO order, so
+    e.g. ports are plugged by the worker right after it created them. Idle
+    workers steal the oldest tasks from the deques of other workers, so
+    all of them are busy as long as there is any ready task, no matter how
+    the tasks are spread across networks.
+    """
+
+    def __init__(self, workers, metrics):
+        self.workers = workers
+        self.metrics = metrics
+        self.done = collections.Counter()
+        self.failed = 0
+        self.stolen = 0
+        self._deques = [collections.deque() for _ in range(workers)]
+        self._next_deque = 0
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def add(self, task, after=()):
+        """Add task which will be run after all tasks given in after."""
+        with self._condition:
+            self._pending += 1
+            for dependency in after:
+                if dependency.done:
+                    task.failed = task.failed or dependency.failed
+                else:
+                    task._dependencies += 1
+                    dependency._dependents.append(task)
+            if not task._dependencies:
+                self._ready(task)
+        return task
+
+    def run(self, tasks):
+        """Run tasks, and all tasks added by them, until all are done."""
+        for task in tasks:
+            self.add(task)
+        threads = [threading.Thread(target=self._run, args=(index,),
+                                    name="worker-%s" % index, daemon=True)
+                   for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.metrics.increment(TASKS_STOLEN, self.stolen)
+        self.report_summary()
+
+    def _ready(self, task):
+        if task.failed:
+            self._finish(task)
+            return
+        # Tasks added from outside of the workers are spread between them
+        index = getattr(self._local, 'index', None)
+        if index is None:
+            index = self._next_deque
+            self._next_deque = (index + 1) % self.workers
+        self._deques[index].append(task)
+        self._condition.notify()
+
+    def _finish(self, task):
+        task.done = True
+        self._pending -= 1
+        if task.failed:
+            self.failed += 1
+        else:
+            self.done[task.name] += 1
+        dependents, task._dependents = task._dependents, []
+        for dependent in dependents:
+            dependent.failed = dependent.failed or task.failed
+            dependent._dependencies -= 1
+            if not dependent._dependencies:
+                self._ready(dependent)
+        if not self._pending:
+            self._condition.notify_all()
+
+    def _get_task(self, index):
+        if self._deques[index]:
+            return self._deques[index].pop()
+        for offset in range(1, self.workers):
+            victim = self._deques[(index + offset) % self.workers]
+            if victim:
+                self.stolen += 1
+                return victim.popleft()
+
+    def _run(self, index):
+        self._local.index = index
+        while True:
+            with self._condition:
+                task = self._get_task(index)
+                while task is None:
+                    if not self._pending:
+                        return
+                    self._condition.wait()
+                    task = self._get_task(index)
+            try:
+                task.result = task.func(*task.args)
+            except Exception:
+                LOG.exception("Task %s failed", task.name)
+                task.failed = True
+            with self._condition:
+                self._finish(task)
+
+    def report_summary(self):
+        LOG.info("Work scheduler: %(done)s tasks done (%(tasks)s) by "
+                 "%(workers)s workers, %(stolen)s of them stolen by idle "
+                 "workers, %(failed)s tasks failed or skipped",
+                 {'done': sum(self.done.values()),
+                  'tasks': ", ".join("%s=%s" % item for item in
+                                     sorted(self.done.items())),
+                  'workers': self.workers, 'stolen': self.stolen,
+                  'failed': self.failed})
+
+
+def create_resources(config, hostname, os_client, os_vif, workers,
+                     tracker=None, net_numbers=None):
+    """Create resources as tasks network -> subnets -> ports -> plug.
+
+    Every subnet, batch of ports and its plugging on the node is a separate
+    task, so even a few networks with many ports keep all workers busy.
+    """
+    if net_numbers is None:
+        net_numbers = range(config.networks)
+    bulk = config.network_batch_size > 1
+    planner = address_planner.AddressPlanner(
+        config.ports, config.ipv4_subnets, config.ipv6_subnets)
+    scheduler = WorkScheduler(workers, os_client.metrics)
+
+    def get_subnets(subnet_tasks):
+        return {subnet['id']: subnet for task in subnet_tasks
+                for subnet in task.result or [] if subnet}
+
+    def create_networks(net_numbers):
+        network_names = {utils.get_network_name(net_number, hostname):
+                         net_number for net_number in net_numbers}
+        LOG.info("Starting to create networks %s", ", ".join(network_names))
+        if bulk:
+            networks = os_client.create_networks_bulk(list(network_names))
+        else:
+            networks = [os_client.create_network(name)
+                        for name in network_names]
+        for network in networks:
+            if network:
+                add_network_tasks(network_names[network['name']], network)
+
+    def create_subnets(subnets_data):
+        if bulk:
+            return os_client.create_subnets_bulk(subnets_data)
+        return [os_client.create_subnet(**subnet) for subnet in subnets_data]
+
+    def create_ports(network, subnet_tasks, port_names):
+        if not get_subnets(subnet_tasks):
+            # Only if some subnets were created creating ports makes any
+            # sense
+            return []
+        ports = os_client.create_ports_bulk(network['id'], port_names,
+                                            hostname)
+        if tracker and ports:
+            tracker.ports_created(ports)
+        return ports
+
+    def plug_ports(ports_task, subnet_tasks):
+        if not ports_task.result:
+            return
+        os_vif.plug_ports(ports_task.result, get_subnets(subnet_tasks))
+        if tracker:
+            tracker.ports_plugged(ports_task.result)
+
+    def add_network_tasks(net_number, network):
+        subnets_data = [
+            {'network_id': network['id'], 'name': subnet_name, 'cidr': cidr}
+            for subnet_name, cidr in planner.get_subnets(net_number,
+                                                         hostname)]
+        subnet_tasks = [
+            scheduler.add(Task('subnets', create_subnets, batch))
+            for batch in utils.chunks(subnets_data,
+                                      len(subnets_data) if bulk else 1)]
+        # Ports get their IPs from all subnets of the network, so they are
+        # created after all of them
+        port_names = (utils.get_port_name(port, hostname, network['id'])
+                      for port in range(config.ports))
+        plug_tasks = []
+        for batch in utils.chunks(port_names, config.port_batch_size):
+            ports_task = scheduler.add(
+                Task('ports', create_ports, network, subnet_tasks, batch),
+                after=subnet_tasks)
+            plug_tasks.append(scheduler.add(
+                Task('plug', plug_ports, ports_task, subnet_tasks),
+                after=[ports_task]))
+        scheduler.add(Task('release', os_vif.release_network, network['id']),
+                      after=plug_tasks)
+
+    scheduler.run(Task('networks', create_networks, batch) for batch in
+                  utils.chunks(net_numbers, config.network_batch_size))
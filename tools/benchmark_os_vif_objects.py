@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark of building os_vif objects for plugged ports.
+
+It measures CPU time needed to build all os_vif objects passed to
+os_vif.plug for one port, with the per-network cache of Network objects
+and without it (when cache is released before every port), without
+really plugging anything on the node.
+
+Usage: benchmark_os_vif_objects.py [PORTS] [SUBNETS]
+"""
+
+import sys
+import time
+
+from oslo_utils import uuidutils
+
+from neutron_heater import os_vif_client
+
+
+def get_test_data(ports, subnets):
+    network_id = uuidutils.generate_uuid()
+    subnets = {
+        uuidutils.generate_uuid(): {'cidr': '10.%s.0.0/16' % subnet}
+        for subnet in range(subnets)}
+    ports = [
+        {'id': uuidutils.generate_uuid(),
+         'name': 'port-%s' % port,
+         'network_id': network_id,
+         'project_id': uuidutils.generate_uuid(),
+         'mac_address': 'fa:16:3e:00:%02x:%02x' % divmod(port % 65536, 256),
+         'fixed_ips': [{'subnet_id': subnet_id} for subnet_id in subnets]}
+        for port in range(ports)]
+    return ports, subnets
+
+
+def build_objects(client, ports, subnets, cached):
+    start = time.process_time()
+    for port in ports:
+        if not cached:
+            client.release_network(port['network_id'])
+        client._get_instance_info(port)
+        client._get_vif_object(port, subnets)
+    return (time.process_time() - start) / len(ports)
+
+
+def main():
+    number_of_ports = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    number_of_subnets = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    ports, subnets = get_test_data(number_of_ports, number_of_subnets)
+    client = os_vif_client.OSVifClient()
+    uncached = build_objects(client, ports, subnets, cached=False)
+    cached = build_objects(client, ports, subnets, cached=True)
+    print("Ports: %s, subnets per port: %s" % (
+        number_of_ports, number_of_subnets))
+    print("CPU time per port without cache: %.1f us" % (uncached * 10 ** 6))
+    print("CPU time per port with cache:    %.1f us" % (cached * 10 ** 6))
+    print("Speedup: %.2fx" % (uncached / cached if cached else 0.0))
+
+
+if __name__ == '__main__':
+    main()